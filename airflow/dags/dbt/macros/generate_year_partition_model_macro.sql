@@ -1,25 +1,44 @@
 /*
 This macro generates a year partition data model by receiving required 
-attributes and year for the table.
+attributes and year for the table. When the year is none, all years are
+selected for the clustered measurement table.
+
+The incremental load filters staging records on the high-watermark of
+the staging load date in the partition, so that micro-partitions loaded
+before the watermark are pruned. Key-based deduplication is only applied
+to late records loaded on the watermark date.
+Records are unique by the integer record key, derived from station key
+and date, in the staging table.
 */
 
 {% macro generate_year_partition_model_macro(attributes, year) %}
 
-select distinct
-    station_name || '_' || to_varchar(date, 'yyyymmdd') as record_id,
+select
+    record_key,
+    station_key,
     station_name,
     date,
     {{ attributes }}
     state,
-    current_date() as load_date
+    load_date
 from {{ source("staging", "weather_preprocessed") }} as source
-where extract(year from date) = {{ year }}
+{% if year is not none %}
+where date between '{{ year }}-01-01' and '{{ year }}-12-31'
+{% else %}
+where true
+{% endif %}
 {% if is_incremental() %}
-    and not exists (
-        select 1
-        from {{ this }}
-        where (source.station_name || '_' || to_varchar(source.date, 'yyyymmdd')) = record_id
+    and (
+        source.load_date > (select coalesce(max(load_date), '1900-01-01'::date) from {{ this }})
+        or (
+            source.load_date = (select max(load_date) from {{ this }})
+            and not exists (
+                select 1
+                from {{ this }} as target
+                where target.record_key = source.record_key
+            )
+        )
     )
 {% endif %}
 
-{% endmacro %}
\ No newline at end of file
+{% endmacro %}
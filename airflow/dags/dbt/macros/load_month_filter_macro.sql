@@ -0,0 +1,15 @@
+/*
+This macro filters records of an incremental model to the months touched
+by the latest staging load. It requires the `load_months` CTE in the model
+and renders nothing on a full refresh. The month start is cast to a date,
+as DuckDB truncates dates to timestamps.
+*/
+
+{% macro load_month_filter() %}
+
+{% if is_incremental() %}
+    where date >= (select min(month_start) from load_months)
+        and cast(date_trunc('month', date) as date) in (select month_start from load_months)
+{% endif %}
+
+{% endmacro %}
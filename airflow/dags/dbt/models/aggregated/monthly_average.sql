@@ -1,192 +1,206 @@
 {{
     config(
-        materialized='table'
+        materialized='incremental',
+        incremental_strategy=('merge' if target.type == 'snowflake' else 'delete+insert'),
+        unique_key=['station_name', 'state', 'year', 'month']
     )
 }}
 
-with evapo_trans_union as (
-    select record_id, station_name, state, date, evapo_transpiration from {{ ref('evapo_transpiration_2023') }} 
-    union
-    select record_id, station_name, state, date, evapo_transpiration from {{ ref('evapo_transpiration_2022') }}
-    union
-    select record_id, station_name, state, date, evapo_transpiration from {{ ref('evapo_transpiration_2021') }}
-    union
-    select record_id, station_name, state, date, evapo_transpiration from {{ ref('evapo_transpiration_2020') }}
-    union
-    select record_id, station_name, state, date, evapo_transpiration from {{ ref('evapo_transpiration_2019') }}
-    union
-    select record_id, station_name, state, date, evapo_transpiration from {{ ref('evapo_transpiration_2018') }}
-    union
-    select record_id, station_name, state, date, evapo_transpiration from {{ ref('evapo_transpiration_2017') }}
-    union
-    select record_id, station_name, state, date, evapo_transpiration from {{ ref('evapo_transpiration_2016') }}
-    union
-    select record_id, station_name, state, date, evapo_transpiration from {{ ref('evapo_transpiration_2015') }}
-    union
-    select record_id, station_name, state, date, evapo_transpiration from {{ ref('evapo_transpiration_2014') }}
-    union
-    select record_id, station_name, state, date, evapo_transpiration from {{ ref('evapo_transpiration_2013') }}
-    union
-    select record_id, station_name, state, date, evapo_transpiration from {{ ref('evapo_transpiration_2012') }}
+/*
+This model is generated by generate_dbt_model.py. Do not edit manually.
+*/
+
+with {% if is_incremental() %}
+load_months as (
+    select distinct cast(date_trunc('month', date) as date) as month_start
+    from {{ source("staging", "weather_preprocessed") }}
+    where load_date = (select max(load_date) from {{ source("staging", "weather_preprocessed") }})
+),
+{% endif %}
+
+evapo_trans_union as (
+    select record_key, station_name, state, date, evapo_transpiration from {{ ref('evapo_transpiration_2023') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, evapo_transpiration from {{ ref('evapo_transpiration_2022') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, evapo_transpiration from {{ ref('evapo_transpiration_2021') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, evapo_transpiration from {{ ref('evapo_transpiration_2020') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, evapo_transpiration from {{ ref('evapo_transpiration_2019') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, evapo_transpiration from {{ ref('evapo_transpiration_2018') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, evapo_transpiration from {{ ref('evapo_transpiration_2017') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, evapo_transpiration from {{ ref('evapo_transpiration_2016') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, evapo_transpiration from {{ ref('evapo_transpiration_2015') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, evapo_transpiration from {{ ref('evapo_transpiration_2014') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, evapo_transpiration from {{ ref('evapo_transpiration_2013') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, evapo_transpiration from {{ ref('evapo_transpiration_2012') }}{{ load_month_filter() }}
 ),
 
 rain_union as (
-    select record_id, station_name, state, date, rain from {{ ref('rain_2023') }} 
-    union
-    select record_id, station_name, state, date, rain from {{ ref('rain_2022') }}
-    union
-    select record_id, station_name, state, date, rain from {{ ref('rain_2021') }}
-    union
-    select record_id, station_name, state, date, rain from {{ ref('rain_2020') }}
-    union
-    select record_id, station_name, state, date, rain from {{ ref('rain_2019') }}
-    union
-    select record_id, station_name, state, date, rain from {{ ref('rain_2018') }}
-    union
-    select record_id, station_name, state, date, rain from {{ ref('rain_2017') }}
-    union
-    select record_id, station_name, state, date, rain from {{ ref('rain_2016') }}
-    union
-    select record_id, station_name, state, date, rain from {{ ref('rain_2015') }}
-    union
-    select record_id, station_name, state, date, rain from {{ ref('rain_2014') }}
-    union
-    select record_id, station_name, state, date, rain from {{ ref('rain_2013') }}
-    union
-    select record_id, station_name, state, date, rain from {{ ref('rain_2012') }}
+    select record_key, station_name, state, date, rain from {{ ref('rain_2023') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, rain from {{ ref('rain_2022') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, rain from {{ ref('rain_2021') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, rain from {{ ref('rain_2020') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, rain from {{ ref('rain_2019') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, rain from {{ ref('rain_2018') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, rain from {{ ref('rain_2017') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, rain from {{ ref('rain_2016') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, rain from {{ ref('rain_2015') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, rain from {{ ref('rain_2014') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, rain from {{ ref('rain_2013') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, rain from {{ ref('rain_2012') }}{{ load_month_filter() }}
 ),
 
 pan_evapo_union as (
-    select record_id, station_name, state, date, pan_evaporation from {{ ref('pan_evaporation_2023') }} 
-    union
-    select record_id, station_name, state, date, pan_evaporation from {{ ref('pan_evaporation_2022') }}
-    union
-    select record_id, station_name, state, date, pan_evaporation from {{ ref('pan_evaporation_2021') }}
-    union
-    select record_id, station_name, state, date, pan_evaporation from {{ ref('pan_evaporation_2020') }}
-    union
-    select record_id, station_name, state, date, pan_evaporation from {{ ref('pan_evaporation_2019') }}
-    union
-    select record_id, station_name, state, date, pan_evaporation from {{ ref('pan_evaporation_2018') }}
-    union
-    select record_id, station_name, state, date, pan_evaporation from {{ ref('pan_evaporation_2017') }}
-    union
-    select record_id, station_name, state, date, pan_evaporation from {{ ref('pan_evaporation_2016') }}
-    union
-    select record_id, station_name, state, date, pan_evaporation from {{ ref('pan_evaporation_2015') }}
-    union
-    select record_id, station_name, state, date, pan_evaporation from {{ ref('pan_evaporation_2014') }}
-    union
-    select record_id, station_name, state, date, pan_evaporation from {{ ref('pan_evaporation_2013') }}
-    union
-    select record_id, station_name, state, date, pan_evaporation from {{ ref('pan_evaporation_2012') }}
+    select record_key, station_name, state, date, pan_evaporation from {{ ref('pan_evaporation_2023') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, pan_evaporation from {{ ref('pan_evaporation_2022') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, pan_evaporation from {{ ref('pan_evaporation_2021') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, pan_evaporation from {{ ref('pan_evaporation_2020') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, pan_evaporation from {{ ref('pan_evaporation_2019') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, pan_evaporation from {{ ref('pan_evaporation_2018') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, pan_evaporation from {{ ref('pan_evaporation_2017') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, pan_evaporation from {{ ref('pan_evaporation_2016') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, pan_evaporation from {{ ref('pan_evaporation_2015') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, pan_evaporation from {{ ref('pan_evaporation_2014') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, pan_evaporation from {{ ref('pan_evaporation_2013') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, pan_evaporation from {{ ref('pan_evaporation_2012') }}{{ load_month_filter() }}
 ),
 
 temp_union as (
-    select record_id, station_name, state, date, variance_temperature from {{ ref('temperature_2023') }} 
-    union
-    select record_id, station_name, state, date, variance_temperature from {{ ref('temperature_2022') }}
-    union
-    select record_id, station_name, state, date, variance_temperature from {{ ref('temperature_2021') }}
-    union
-    select record_id, station_name, state, date, variance_temperature from {{ ref('temperature_2020') }}
-    union
-    select record_id, station_name, state, date, variance_temperature from {{ ref('temperature_2019') }}
-    union
-    select record_id, station_name, state, date, variance_temperature from {{ ref('temperature_2018') }}
-    union
-    select record_id, station_name, state, date, variance_temperature from {{ ref('temperature_2017') }}
-    union
-    select record_id, station_name, state, date, variance_temperature from {{ ref('temperature_2016') }}
-    union
-    select record_id, station_name, state, date, variance_temperature from {{ ref('temperature_2015') }}
-    union
-    select record_id, station_name, state, date, variance_temperature from {{ ref('temperature_2014') }}
-    union
-    select record_id, station_name, state, date, variance_temperature from {{ ref('temperature_2013') }}
-    union
-    select record_id, station_name, state, date, variance_temperature from {{ ref('temperature_2012') }}
+    select record_key, station_name, state, date, variance_temperature from {{ ref('temperature_2023') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, variance_temperature from {{ ref('temperature_2022') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, variance_temperature from {{ ref('temperature_2021') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, variance_temperature from {{ ref('temperature_2020') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, variance_temperature from {{ ref('temperature_2019') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, variance_temperature from {{ ref('temperature_2018') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, variance_temperature from {{ ref('temperature_2017') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, variance_temperature from {{ ref('temperature_2016') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, variance_temperature from {{ ref('temperature_2015') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, variance_temperature from {{ ref('temperature_2014') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, variance_temperature from {{ ref('temperature_2013') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, variance_temperature from {{ ref('temperature_2012') }}{{ load_month_filter() }}
 ),
 
 rel_hum_union as (
-    select record_id, station_name, state, date, maximum_relative_humidity, minimum_relative_humidity from {{ ref('relative_humidity_2023') }} 
-    union
-    select record_id, station_name, state, date, maximum_relative_humidity, minimum_relative_humidity from {{ ref('relative_humidity_2022') }}
-    union
-    select record_id, station_name, state, date, maximum_relative_humidity, minimum_relative_humidity from {{ ref('relative_humidity_2021') }}
-    union
-    select record_id, station_name, state, date, maximum_relative_humidity, minimum_relative_humidity from {{ ref('relative_humidity_2020') }}
-    union
-    select record_id, station_name, state, date, maximum_relative_humidity, minimum_relative_humidity from {{ ref('relative_humidity_2019') }}
-    union
-    select record_id, station_name, state, date, maximum_relative_humidity, minimum_relative_humidity from {{ ref('relative_humidity_2018') }}
-    union
-    select record_id, station_name, state, date, maximum_relative_humidity, minimum_relative_humidity from {{ ref('relative_humidity_2017') }}
-    union
-    select record_id, station_name, state, date, maximum_relative_humidity, minimum_relative_humidity from {{ ref('relative_humidity_2016') }}
-    union
-    select record_id, station_name, state, date, maximum_relative_humidity, minimum_relative_humidity from {{ ref('relative_humidity_2015') }}
-    union
-    select record_id, station_name, state, date, maximum_relative_humidity, minimum_relative_humidity from {{ ref('relative_humidity_2014') }}
-    union
-    select record_id, station_name, state, date, maximum_relative_humidity, minimum_relative_humidity from {{ ref('relative_humidity_2013') }}
-    union
-    select record_id, station_name, state, date, maximum_relative_humidity, minimum_relative_humidity from {{ ref('relative_humidity_2012') }}
+    select record_key, station_name, state, date, maximum_relative_humidity, minimum_relative_humidity from {{ ref('relative_humidity_2023') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, maximum_relative_humidity, minimum_relative_humidity from {{ ref('relative_humidity_2022') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, maximum_relative_humidity, minimum_relative_humidity from {{ ref('relative_humidity_2021') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, maximum_relative_humidity, minimum_relative_humidity from {{ ref('relative_humidity_2020') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, maximum_relative_humidity, minimum_relative_humidity from {{ ref('relative_humidity_2019') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, maximum_relative_humidity, minimum_relative_humidity from {{ ref('relative_humidity_2018') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, maximum_relative_humidity, minimum_relative_humidity from {{ ref('relative_humidity_2017') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, maximum_relative_humidity, minimum_relative_humidity from {{ ref('relative_humidity_2016') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, maximum_relative_humidity, minimum_relative_humidity from {{ ref('relative_humidity_2015') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, maximum_relative_humidity, minimum_relative_humidity from {{ ref('relative_humidity_2014') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, maximum_relative_humidity, minimum_relative_humidity from {{ ref('relative_humidity_2013') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, maximum_relative_humidity, minimum_relative_humidity from {{ ref('relative_humidity_2012') }}{{ load_month_filter() }}
 ),
 
 wind_speed_union as (
-    select record_id, station_name, state, date, average_10m_wind_speed from {{ ref('wind_speed_2023') }} 
-    union
-    select record_id, station_name, state, date, average_10m_wind_speed from {{ ref('wind_speed_2022') }}
-    union
-    select record_id, station_name, state, date, average_10m_wind_speed from {{ ref('wind_speed_2021') }}
-    union
-    select record_id, station_name, state, date, average_10m_wind_speed from {{ ref('wind_speed_2020') }}
-    union
-    select record_id, station_name, state, date, average_10m_wind_speed from {{ ref('wind_speed_2019') }}
-    union
-    select record_id, station_name, state, date, average_10m_wind_speed from {{ ref('wind_speed_2018') }}
-    union
-    select record_id, station_name, state, date, average_10m_wind_speed from {{ ref('wind_speed_2017') }}
-    union
-    select record_id, station_name, state, date, average_10m_wind_speed from {{ ref('wind_speed_2016') }}
-    union
-    select record_id, station_name, state, date, average_10m_wind_speed from {{ ref('wind_speed_2015') }}
-    union
-    select record_id, station_name, state, date, average_10m_wind_speed from {{ ref('wind_speed_2014') }}
-    union
-    select record_id, station_name, state, date, average_10m_wind_speed from {{ ref('wind_speed_2013') }}
-    union
-    select record_id, station_name, state, date, average_10m_wind_speed from {{ ref('wind_speed_2012') }}
+    select record_key, station_name, state, date, average_10m_wind_speed from {{ ref('wind_speed_2023') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, average_10m_wind_speed from {{ ref('wind_speed_2022') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, average_10m_wind_speed from {{ ref('wind_speed_2021') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, average_10m_wind_speed from {{ ref('wind_speed_2020') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, average_10m_wind_speed from {{ ref('wind_speed_2019') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, average_10m_wind_speed from {{ ref('wind_speed_2018') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, average_10m_wind_speed from {{ ref('wind_speed_2017') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, average_10m_wind_speed from {{ ref('wind_speed_2016') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, average_10m_wind_speed from {{ ref('wind_speed_2015') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, average_10m_wind_speed from {{ ref('wind_speed_2014') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, average_10m_wind_speed from {{ ref('wind_speed_2013') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, average_10m_wind_speed from {{ ref('wind_speed_2012') }}{{ load_month_filter() }}
 ),
 
 solar_rad_union as (
-    select record_id, station_name, state, date, solar_radiation from {{ ref('solar_radiation_2023') }} 
-    union
-    select record_id, station_name, state, date, solar_radiation from {{ ref('solar_radiation_2022') }}
-    union
-    select record_id, station_name, state, date, solar_radiation from {{ ref('solar_radiation_2021') }}
-    union
-    select record_id, station_name, state, date, solar_radiation from {{ ref('solar_radiation_2020') }}
-    union
-    select record_id, station_name, state, date, solar_radiation from {{ ref('solar_radiation_2019') }}
-    union
-    select record_id, station_name, state, date, solar_radiation from {{ ref('solar_radiation_2018') }}
-    union
-    select record_id, station_name, state, date, solar_radiation from {{ ref('solar_radiation_2017') }}
-    union
-    select record_id, station_name, state, date, solar_radiation from {{ ref('solar_radiation_2016') }}
-    union
-    select record_id, station_name, state, date, solar_radiation from {{ ref('solar_radiation_2015') }}
-    union
-    select record_id, station_name, state, date, solar_radiation from {{ ref('solar_radiation_2014') }}
-    union
-    select record_id, station_name, state, date, solar_radiation from {{ ref('solar_radiation_2013') }}
-    union
-    select record_id, station_name, state, date, solar_radiation from {{ ref('solar_radiation_2012') }}
+    select record_key, station_name, state, date, solar_radiation from {{ ref('solar_radiation_2023') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, solar_radiation from {{ ref('solar_radiation_2022') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, solar_radiation from {{ ref('solar_radiation_2021') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, solar_radiation from {{ ref('solar_radiation_2020') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, solar_radiation from {{ ref('solar_radiation_2019') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, solar_radiation from {{ ref('solar_radiation_2018') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, solar_radiation from {{ ref('solar_radiation_2017') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, solar_radiation from {{ ref('solar_radiation_2016') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, solar_radiation from {{ ref('solar_radiation_2015') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, solar_radiation from {{ ref('solar_radiation_2014') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, solar_radiation from {{ ref('solar_radiation_2013') }}{{ load_month_filter() }}
+    union all
+    select record_key, station_name, state, date, solar_radiation from {{ ref('solar_radiation_2012') }}{{ load_month_filter() }}
 )
 
-select distinct
+select
     temp_union.station_name,
     extract(year from temp_union.date) as year,
     extract(month from temp_union.date) as month,
@@ -201,11 +215,11 @@ select distinct
     temp_union.state,
     current_date() as load_date
 from temp_union
-left join evapo_trans_union on temp_union.record_id = evapo_trans_union.record_id
-left join rain_union on temp_union.record_id = rain_union.record_id
-left join pan_evapo_union on temp_union.record_id = pan_evapo_union.record_id
-left join rel_hum_union on temp_union.record_id = rel_hum_union.record_id
-left join wind_speed_union on temp_union.record_id = wind_speed_union.record_id
-left join solar_rad_union on temp_union.record_id = solar_rad_union.record_id
+left join evapo_trans_union on temp_union.record_key = evapo_trans_union.record_key
+left join rain_union on temp_union.record_key = rain_union.record_key
+left join pan_evapo_union on temp_union.record_key = pan_evapo_union.record_key
+left join rel_hum_union on temp_union.record_key = rel_hum_union.record_key
+left join wind_speed_union on temp_union.record_key = wind_speed_union.record_key
+left join solar_rad_union on temp_union.record_key = solar_rad_union.record_key
 where temp_union.state in ('VIC', 'WA')
 group by temp_union.station_name, temp_union.state, year, month
@@ -0,0 +1,13 @@
+{{
+    config(
+        materialized='incremental',
+        on_schema_change='sync_all_columns',
+        cluster_by=['date', 'station_key']
+    )
+}}
+
+{{
+    generate_year_partition_model_macro(
+        "EVAPO_TRANSPIRATION, RAIN, PAN_EVAPORATION, MAXIMUM_TEMPERATURE, MINIMUM_TEMPERATURE, MAXIMUM_TEMPERATURE - MINIMUM_TEMPERATURE AS VARIANCE_TEMPERATURE, MAXIMUM_RELATIVE_HUMIDITY, MINIMUM_RELATIVE_HUMIDITY, AVERAGE_10M_WIND_SPEED, SOLAR_RADIATION, ", none
+    )
+}}
\ No newline at end of file
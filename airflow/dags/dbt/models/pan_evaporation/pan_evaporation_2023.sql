@@ -1,6 +1,7 @@
 {{
     config(
-        materialized='incremental'
+        materialized='incremental',
+        on_schema_change='sync_all_columns'
     )
 }}
 
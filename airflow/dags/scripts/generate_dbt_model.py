@@ -1,8 +1,8 @@
 ###############################################################################
 # Name: generate_partition.py
 # Description: This script automatically generates the followings based on the
-#              available years in the preprocessed weather table in Snowflake
-#              staging schema:
+#              available years in the preprocessed weather table in the
+#              warehouse staging schema:
 #              - Year partition table for weather measurement schemas 
 #                (e.g., rain_2023)
 #              - dbt data model & schema file for the created partition table
@@ -14,11 +14,327 @@
 ###############################################################################
 import os
 import ast
+import hashlib
 import yaml
 
-import snowflake.connector
 from airflow.utils.log.logging_mixin import LoggingMixin
 
+from warehouse import connect_warehouse
+from metrics import RunMetrics
+
+
+# Define weather measurement schemas and their attributes
+## For year partition tables
+"""
+This dictionary is used to create a query to create year partition table 
+with respective attributes. 
+
+E.g., { Weather schema: Attributes of respective year partition table }
+
+* Weather schema refer to weather measurement schema
+* Year partition table refer to partition table by year
+"""
+weather_schema_dict_table = {
+    "EVAPO_TRANSPIRATION": ["EVAPO_TRANSPIRATION"],
+    "RAIN": ["RAIN"],
+    "PAN_EVAPORATION": ["PAN_EVAPORATION"],
+    "TEMPERATURE": [
+        "MAXIMUM_TEMPERATURE",
+        "MINIMUM_TEMPERATURE",
+        "VARIANCE_TEMPERATURE"
+    ],
+    "RELATIVE_HUMIDITY": [
+        "MAXIMUM_RELATIVE_HUMIDITY",
+        "MINIMUM_RELATIVE_HUMIDITY"
+    ],
+    "WIND_SPEED": ["AVERAGE_10M_WIND_SPEED"],
+    "SOLAR_RADIATION": ["SOLAR_RADIATION"]
+}
+## For dbt data model scripts
+"""
+This dictionary is used to create a dbt data model script that
+uses a macro `generate_year_partition_model_macro.sql which
+requires inputs of columns.
+
+E.g., { Weather schema: Partial query to model the attributes 
+                        of the respective year partition table }
+"""
+weather_schema_dict_model = {
+    "EVAPO_TRANSPIRATION": ["EVAPO_TRANSPIRATION"],
+    "RAIN": ["RAIN"],
+    "PAN_EVAPORATION": ["PAN_EVAPORATION"],
+    "TEMPERATURE": [
+        "MAXIMUM_TEMPERATURE",
+        "MINIMUM_TEMPERATURE",
+        "MAXIMUM_TEMPERATURE - MINIMUM_TEMPERATURE AS VARIANCE_TEMPERATURE"
+    ],
+    "RELATIVE_HUMIDITY": [
+        "MAXIMUM_RELATIVE_HUMIDITY",
+        "MINIMUM_RELATIVE_HUMIDITY"
+    ],
+    "WIND_SPEED": ["AVERAGE_10M_WIND_SPEED"],
+    "SOLAR_RADIATION": ["SOLAR_RADIATION"]
+}
+
+# Define warehouse queries
+"""Column types are portable between Snowflake and DuckDB
+(DOUBLE and BIGINT are synonyms of FLOAT and NUMBER(38,0) in Snowflake).
+"""
+query_create_weather_schema = """
+    CREATE SCHEMA IF NOT EXISTS {};
+"""
+query_fetch_weather_date_range = """
+    SELECT MIN(DATE), MAX(DATE)
+    FROM STAGING.WEATHER_PREPROCESSED
+"""
+query_fetch_load_years = """
+    SELECT DISTINCT EXTRACT(YEAR FROM DATE)
+    FROM STAGING.WEATHER_PREPROCESSED
+    WHERE LOAD_DATE = (SELECT MAX(LOAD_DATE) FROM STAGING.WEATHER_PREPROCESSED)
+"""
+## Partition registry
+"""
+The partition registry keeps the year partitions created for each weather
+schema, so that only missing partitions are created. It also flags the
+year partitions whose keys have been backfilled, so that the backfill
+runs once per year partition.
+"""
+query_create_partition_registry = """
+    CREATE TABLE IF NOT EXISTS STAGING.WEATHER_PARTITION_REGISTRY (
+        SCHEMA_NAME VARCHAR(100),
+        YEAR INTEGER,
+        CREATED_AT TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+        KEYS_BACKFILLED BOOLEAN DEFAULT FALSE
+    );
+"""
+query_add_keys_backfilled_partition_registry = """
+    ALTER TABLE STAGING.WEATHER_PARTITION_REGISTRY
+    ADD COLUMN IF NOT EXISTS KEYS_BACKFILLED BOOLEAN DEFAULT FALSE;
+"""
+query_fetch_registered_partitions = """
+    SELECT SCHEMA_NAME, YEAR
+    FROM STAGING.WEATHER_PARTITION_REGISTRY
+"""
+query_register_partitions = """
+    INSERT INTO STAGING.WEATHER_PARTITION_REGISTRY (SCHEMA_NAME, YEAR)
+    VALUES {};
+"""
+query_fetch_partitions_without_keys = """
+    SELECT SCHEMA_NAME, YEAR
+    FROM STAGING.WEATHER_PARTITION_REGISTRY
+    WHERE NOT COALESCE(KEYS_BACKFILLED, FALSE)
+"""
+query_flag_keys_backfilled = """
+    UPDATE STAGING.WEATHER_PARTITION_REGISTRY
+    SET KEYS_BACKFILLED = TRUE
+    WHERE (SCHEMA_NAME, YEAR) IN ({});
+"""
+query_create_year_partition = """
+    CREATE TABLE IF NOT EXISTS {0}.{0}_{1} (
+        RECORD_KEY BIGINT,
+        STATION_KEY BIGINT,
+        STATION_NAME VARCHAR(100),
+        DATE DATE,
+        {2}
+        STATE VARCHAR(3),
+        LOAD_DATE DATE
+    );
+"""
+query_add_keys_year_partition = [
+    "ALTER TABLE {0}.{0}_{1} ADD COLUMN IF NOT EXISTS RECORD_KEY BIGINT;",
+    "ALTER TABLE {0}.{0}_{1} ADD COLUMN IF NOT EXISTS STATION_KEY BIGINT;"
+]
+query_backfill_keys_year_partition = """
+    UPDATE {0}.{0}_{1} AS TARGET
+    SET STATION_KEY = DICTIONARY.STATION_KEY,
+        RECORD_KEY = DICTIONARY.STATION_KEY * 100000
+            + {date_ordinal}
+    FROM STAGING.STATION_DICTIONARY AS DICTIONARY
+    WHERE TARGET.STATION_NAME = DICTIONARY.STATION_NAME
+        AND TARGET.RECORD_KEY IS NULL;
+"""
+query_create_measurement_table = """
+    CREATE TABLE IF NOT EXISTS {0}.{0} (
+        RECORD_KEY BIGINT,
+        STATION_KEY BIGINT,
+        STATION_NAME VARCHAR(100),
+        DATE DATE,
+        {1}
+        STATE VARCHAR(3),
+        LOAD_DATE DATE
+    )
+    {2};
+"""
+
+# Define dbt data model script
+"""
+This defines a dbt model script which uses a macro to generate 
+a data model for year partition tables with the passed year 
+and schema-specific attributes.
+The scripts are written into the dbt project next to this script's
+directory, unless the model directory is given by DBT_MODEL_DIR.
+"""
+script_directory = os.path.dirname(os.path.abspath(__file__))
+dbt_model_directory = os.environ.get(
+    "DBT_MODEL_DIR",
+    os.path.join(os.path.dirname(script_directory), "dbt", "models")
+)
+target_location = os.path.join(dbt_model_directory, "{}", "{}")
+dbt_script_str_1 = "{{{{\n    config(\n        materialized='incremental',\n        on_schema_change='sync_all_columns'\n    )\n}}}}"
+dbt_script_str_2 = "\n\n{{{{\n    generate_year_partition_model_macro(\n        \"{}\", {}\n    )\n}}}}"
+dbt_script_str = dbt_script_str_1 + dbt_script_str_2
+## For clustered partition mode
+dbt_measurement_script_str = (
+    "{{{{\n    config(\n        materialized='incremental',\n"
+    "        on_schema_change='sync_all_columns',\n"
+    "        cluster_by=['date', 'station_key']\n    )\n}}}}"
+    "\n\n{{{{\n    generate_year_partition_model_macro(\n        \"{}\", none\n    )\n}}}}"
+)
+dbt_year_view_script_str = (
+    "{{{{\n    config(\n        materialized='view'\n    )\n}}}}"
+    "\n\nselect *\nfrom {{{{ ref('{0}') }}}}\nwhere date between '{1}-01-01' and '{1}-12-31'"
+)
+
+# Define dbt data model script of daily weather table
+"""
+This defines a dbt model script of the wide daily weather table, which
+uses the year partition macro without a year to load all attributes
+of the staging schema in a single pass.
+"""
+dbt_daily_weather_script_str = (
+    "{{{{\n    config(\n        materialized='incremental',\n"
+    "        on_schema_change='sync_all_columns',\n"
+    "        cluster_by=['date', 'station_key']\n    )\n}}}}"
+    "\n\n{{{{\n    generate_year_partition_model_macro(\n        \"{}\", none\n    )\n}}}}"
+)
+
+# Define dbt data model script of monthly average aggregate
+"""
+This dictionary is used to union the year partition tables of each
+weather schema in the monthly average aggregate.
+
+E.g., { Weather schema: (Name of union CTE, [ Columns to aggregate ]) }
+"""
+monthly_average_union_dict = {
+    "EVAPO_TRANSPIRATION": ("evapo_trans_union", ["evapo_transpiration"]),
+    "RAIN": ("rain_union", ["rain"]),
+    "PAN_EVAPORATION": ("pan_evapo_union", ["pan_evaporation"]),
+    "TEMPERATURE": ("temp_union", ["variance_temperature"]),
+    "RELATIVE_HUMIDITY": (
+        "rel_hum_union",
+        ["maximum_relative_humidity", "minimum_relative_humidity"]
+    ),
+    "WIND_SPEED": ("wind_speed_union", ["average_10m_wind_speed"]),
+    "SOLAR_RADIATION": ("solar_rad_union", ["solar_radiation"])
+}
+monthly_average_script_str = """{{{{
+    config(
+        materialized='incremental',
+        incremental_strategy=('merge' if target.type == 'snowflake' else 'delete+insert'),
+        unique_key=['station_name', 'state', 'year', 'month']
+    )
+}}}}
+
+/*
+This model is generated by generate_dbt_model.py. Do not edit manually.
+*/
+
+with {{% if is_incremental() %}}
+load_months as (
+    select distinct cast(date_trunc('month', date) as date) as month_start
+    from {{{{ source("staging", "weather_preprocessed") }}}}
+    where load_date = (select max(load_date) from {{{{ source("staging", "weather_preprocessed") }}}})
+),
+{{% endif %}}
+
+{0}
+
+select
+    temp_union.station_name,
+    extract(year from temp_union.date) as year,
+    extract(month from temp_union.date) as month,
+    avg(evapo_transpiration) as avg_evapo_transpiration,
+    avg(rain) as avg_rain_fall,
+    avg(pan_evaporation) as avg_pan_evaporation,
+    avg(variance_temperature) as avg_var_temperature,
+    avg(maximum_relative_humidity) as avg_max_rel_humidity,
+    avg(minimum_relative_humidity) as avg_min_rel_humidity,
+    avg(average_10m_wind_speed) as avg_10m_wind_speed,
+    avg(solar_radiation) as avg_solar_radiation,
+    temp_union.state,
+    current_date() as load_date
+from temp_union
+left join evapo_trans_union on temp_union.record_key = evapo_trans_union.record_key
+left join rain_union on temp_union.record_key = rain_union.record_key
+left join pan_evapo_union on temp_union.record_key = pan_evapo_union.record_key
+left join rel_hum_union on temp_union.record_key = rel_hum_union.record_key
+left join wind_speed_union on temp_union.record_key = wind_speed_union.record_key
+left join solar_rad_union on temp_union.record_key = solar_rad_union.record_key
+where temp_union.state in ('VIC', 'WA')
+group by temp_union.station_name, temp_union.state, year, month
+"""
+monthly_average_daily_script_str = """{{
+    config(
+        materialized='incremental',
+        incremental_strategy=('merge' if target.type == 'snowflake' else 'delete+insert'),
+        unique_key=['station_name', 'state', 'year', 'month']
+    )
+}}
+
+/*
+This model is generated by generate_dbt_model.py. Do not edit manually.
+*/
+
+with {% if is_incremental() %}
+load_months as (
+    select distinct cast(date_trunc('month', date) as date) as month_start
+    from {{ source("staging", "weather_preprocessed") }}
+    where load_date = (select max(load_date) from {{ source("staging", "weather_preprocessed") }})
+),
+{% endif %}
+
+daily_weather as (
+    select * from {{ ref('daily_weather') }}{{ load_month_filter() }}
+)
+
+select
+    station_name,
+    extract(year from date) as year,
+    extract(month from date) as month,
+    avg(evapo_transpiration) as avg_evapo_transpiration,
+    avg(rain) as avg_rain_fall,
+    avg(pan_evaporation) as avg_pan_evaporation,
+    avg(variance_temperature) as avg_var_temperature,
+    avg(maximum_relative_humidity) as avg_max_rel_humidity,
+    avg(minimum_relative_humidity) as avg_min_rel_humidity,
+    avg(average_10m_wind_speed) as avg_10m_wind_speed,
+    avg(solar_radiation) as avg_solar_radiation,
+    state,
+    current_date() as load_date
+from daily_weather
+where state in ('VIC', 'WA')
+group by station_name, state, year, month
+"""
+
+# Define dictionary of schema-specific columns details
+"""
+This dictionary holds schema-specific columns details including
+test cases (optional).
+E.g., 
+{ 
+    Weather schema: {
+        Column name: [
+            Column description,
+            [ Test case (optional) ]
+        ]
+    }
+}
+"""
+weather_schema_file = os.path.join(script_directory, "weather_schema_yaml_dict.txt")
+with open(weather_schema_file, "r") as f:
+    content = f.read()
+    weather_schema_yaml_dict = ast.literal_eval(content)
+
 
 def make_col_query_str(cols, purpose):
     """
@@ -26,7 +342,7 @@ def make_col_query_str(cols, purpose):
     1. Returning a partial query string that contains
     given columns and their data type.
     E.g., Input: ["MAXIMUM_TEMPERATURE", "MINIMUM_TEMPERATURE"]
-          Output: "MAXIMUM_TEMPERATURE FLOAT, MINIMUM_TEMPERATURE FLAT, "
+          Output: "MAXIMUM_TEMPERATURE DOUBLE, MINIMUM_TEMPERATURE DOUBLE, "
     This goes into the variable `query_create_year_partition` for
     creating year partition tables for each weather measurement schemas.
     
@@ -52,17 +368,16 @@ def make_col_query_str(cols, purpose):
     query_str = ""
     for col in cols:
         if purpose == "year_partition_table":
-            query_str += col + " FLOAT, "
+            query_str += col + " DOUBLE, "
         elif purpose == "dbt_model_script":
             query_str += col +", "
     return query_str
 
 
-def generate_dbt_model_script(schema, year, script_name, target_location):
+def render_dbt_model_script(schema, year):
     """
-    This function generates a dbt data model script
-    of the year partition table for the given schema and year 
-    in the target location.
+    This function renders a dbt data model script
+    of the year partition table for the given schema and year.
 
     The dbt model script is designed to call the dbt macro 
     `generate_year_partition_model` to create a year partition data model
@@ -75,24 +390,71 @@ def generate_dbt_model_script(schema, year, script_name, target_location):
         Name of schema.
     year: int/str
         Year for partition table.
-    script_name: str
-        Name of dbt script.
-    target_location: str
-        Location for dbt data model script.
+
+    Returns
+    -------
+    str
+        dbt data model script.
     """
     # Create a partial query string with columns separated by comma
     attribute_li = weather_schema_dict_model[schema]
     attribute_query_str = make_col_query_str(attribute_li, purpose="dbt_model_script")
 
-    # Write dbt data model script
-    schema_lower = schema.lower()
-    with open(target_location.format(schema_lower, script_name), "w") as f:
-        f.write(dbt_script_str.format(attribute_query_str, year))
+    return dbt_script_str.format(attribute_query_str, year)
+
+
+def render_measurement_model_script(schema):
+    """
+    This function renders a dbt data model script of the single
+    measurement table for the given schema in the clustered partition mode.
+
+    The same macro `generate_year_partition_model` is called without a year,
+    so that all years are loaded into one table clustered on date and
+    station key.
+
+    Parameters
+    ----------
+    schema: str
+        Name of schema.
+
+    Returns
+    -------
+    str
+        dbt data model script.
+    """
+    attribute_li = weather_schema_dict_model[schema]
+    attribute_query_str = make_col_query_str(attribute_li, purpose="dbt_model_script")
+
+    return dbt_measurement_script_str.format(attribute_query_str)
 
 
-def generate_schema_yml(schema, year, col_schema):
+def render_year_view_script(schema, year):
     """
-    This function creates a schame yaml file for the year partition tables.
+    This function renders a dbt data model script of the year view
+    over the measurement table for the given schema and year in the
+    clustered partition mode.
+
+    The year view keeps the name of the year partition table, so that
+    existing queries and refs keep working.
+
+    Parameters
+    ----------
+    schema: str
+        Name of schema.
+    year: int/str
+        Year for the view.
+
+    Returns
+    -------
+    str
+        dbt data model script.
+    """
+    return dbt_year_view_script_str.format(schema.lower(), year)
+
+
+def render_schema_yml(schema, year, col_schema):
+    """
+    This function renders a schame yaml file for the year partition tables.
     Schema-specific columns, their descriptions and test cases (optional) 
     can be added dynamically by passing them in a dictionary.
 
@@ -101,21 +463,31 @@ def generate_schema_yml(schema, year, col_schema):
     schema: str
         Name of schema.
     year: int/str
-        Year for partition table.
+        Year for partition table. None for the measurement table.
     col_schema: dict
         Dictionary of schema-specific columns details.
+
+    Returns
+    -------
+    str
+        dbt schema yaml.
     """
     # Define base schame with universal columns across schemas
     schema_dict = {
         "version": 2,
         "models": [{
-            "name": f"{schema}_{year}",
+            "name": f"{schema}_{year}" if year is not None else schema,
             "columns": [
                 {
-                    "name": "record_id",
-                    "description": "Synthetic key consisted of station name and date",
+                    "name": "record_key",
+                    "description": "Synthetic integer key derived from station key and date",
                     "tests": ["not_null", "unique"]
                 },
+                {
+                    "name": "station_key",
+                    "description": "Integer key of weather station from station dictionary",
+                    "tests": ["not_null"]
+                },
                 {
                     "name": "station_name",
                     "description": "Weather station name",
@@ -164,178 +536,504 @@ def generate_schema_yml(schema, year, col_schema):
         "description": "Date of data load from staging schema",
     })
 
-    # Write yaml file
-    file_path = f"/opt/airflow/dags/dbt/models/{schema}/{schema}_{year}.yml"
-    with open(file_path, "w") as f:
-        yaml.dump(schema_dict, f, sort_keys=False)
+    # Dump yaml and fix formatting of the value set
+    schema_str = yaml.dump(schema_dict, sort_keys=False)
+    return schema_str.replace("''", "'").replace("'[", "[").replace("]'", "]")
+
+
+def write_if_changed(file_path, content):
+    """
+    This function writes the content into the file only when
+    the content fingerprint differs from the existing file.
+
+    Unchanged files are left untouched so that dbt partial parsing
+    does not re-parse them. Changed files are replaced atomically.
+
+    Parameters
+    ----------
+    file_path: str
+        Path of the file.
+    content: str
+        Content of the file.
+
+    Returns
+    -------
+    Boolean
+        Whether the file has been written.
+    """
+    content_bytes = content.encode("utf-8")
+    if os.path.exists(file_path):
+        with open(file_path, "rb") as f:
+            if hashlib.sha256(f.read()).digest() == hashlib.sha256(content_bytes).digest():
+                return False
+
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    temp_file_path = file_path + ".tmp"
+    with open(temp_file_path, "wb") as f:
+        f.write(content_bytes)
+    os.replace(temp_file_path, file_path)
+    return True
+
+
+def generate_partition_models(partitions, partition_mode="year_table"):
+    """
+    This function renders dbt data model scripts and schema files of the
+    given year partitions and writes only the files that have changed.
+
+    In the year table mode, each year partition is a table with its own
+    schema file. In the clustered mode, each weather schema has a single
+    measurement table with the schema file, and each year partition is
+    a view over it.
+
+    Parameters
+    ----------
+    partitions: list
+        List of (schema, year) pairs.
+    partition_mode: str
+        Partition mode of either "year_table" or "clustered".
+
+    Returns
+    -------
+    list
+        Paths of written files.
+    """
+    file_contents = {}
+    if partition_mode == "clustered":
+        for schema in sorted({schema for (schema, _) in partitions}):
+            schema_lower = schema.lower()
+            file_contents[target_location.format(schema_lower, f"{schema_lower}.sql")] = \
+                render_measurement_model_script(schema)
+            file_contents[target_location.format(schema_lower, f"{schema_lower}.yml")] = \
+                render_schema_yml(schema_lower, None, weather_schema_yaml_dict[schema])
+    for (schema, year) in sorted(partitions):
+        schema_lower = schema.lower()
+        if partition_mode == "clustered":
+            file_contents[target_location.format(schema_lower, f"{schema_lower}_{year}.sql")] = \
+                render_year_view_script(schema, year)
+        else:
+            file_contents[target_location.format(schema_lower, f"{schema_lower}_{year}.sql")] = \
+                render_dbt_model_script(schema, year)
+            file_contents[target_location.format(schema_lower, f"{schema_lower}_{year}.yml")] = \
+                render_schema_yml(schema_lower, year, weather_schema_yaml_dict[schema])
+
+    written_file_paths = []
+    for (file_path, content) in file_contents.items():
+        if write_if_changed(file_path, content):
+            written_file_paths.append(file_path)
+
+    return written_file_paths
+
+
+def render_daily_weather_model():
+    """
+    This function renders the dbt data model script and schema file of
+    the wide daily weather table, which holds a row per station and date
+    with the attributes of all weather schemas.
+
+    The same macro `generate_year_partition_model` is called without a year
+    and with the attributes of all weather schemas, so that the table is
+    loaded incrementally in a single pass over the staging schema.
+
+    Returns
+    -------
+    script_str: str
+        dbt data model script.
+    schema_str: str
+        dbt schema yaml.
+    """
+    attribute_li = [
+        attribute
+        for attributes in weather_schema_dict_model.values()
+        for attribute in attributes
+    ]
+    attribute_query_str = make_col_query_str(attribute_li, purpose="dbt_model_script")
+    col_schema = {
+        col_name: col_detail
+        for schema_col_schema in weather_schema_yaml_dict.values()
+        for (col_name, col_detail) in schema_col_schema.items()
+    }
+
+    script_str = dbt_daily_weather_script_str.format(attribute_query_str)
+    schema_str = render_schema_yml("daily_weather", None, col_schema)
+    return script_str, schema_str
+
 
-    # Fix formatting from yaml dump and rewrite yaml file
-    with open(file_path, "r") as f:
-        schema_str = "".join(f.readlines())
-        schema_str_formatted = schema_str.replace("''", "'").replace("'[", "[").replace("]'", "]")
-        with open(file_path, "w") as f:
-            f.write(schema_str_formatted)
+def render_monthly_average_model(partitions, partition_mode="year_table", source="partitions"):
+    """
+    This function renders the dbt data model script of the monthly average
+    aggregate from the year partitions, so that a new year requires
+    no manual edit.
+
+    The year partition tables of each weather schema are combined with
+    `UNION ALL` as they hold disjoint years. In the clustered mode, the
+    measurement table of each weather schema is read instead. When the source
+    is the daily weather table, the aggregate is a single table scan without
+    union or join. The model is incremental, and only the months touched by
+    the latest staging load are recomputed and merged by the macro
+    `load_month_filter`.
+
+    Parameters
+    ----------
+    partitions: list
+        List of (schema, year) pairs.
+    partition_mode: str
+        Partition mode of either "year_table" or "clustered".
+    source: str
+        Source of either "partitions" or "daily_weather".
+
+    Returns
+    -------
+    str
+        dbt data model script.
+    """
+    if source == "daily_weather":
+        return monthly_average_daily_script_str
+
+    cte_str_li = []
+    for (schema, (cte_name, cols)) in monthly_average_union_dict.items():
+        schema_lower = schema.lower()
+        if partition_mode == "clustered":
+            model_names = [schema_lower]
+        else:
+            years = sorted((year for (s, year) in partitions if s == schema), reverse=True)
+            model_names = [f"{schema_lower}_{year}" for year in years]
+        select_str_li = [
+            f"    select record_key, station_name, state, date, {', '.join(cols)} "
+            f"from {{{{ ref('{model_name}') }}}}{{{{ load_month_filter() }}}}"
+            for model_name in model_names
+        ]
+        cte_str_li.append(
+            f"{cte_name} as (\n" + "\n    union all\n".join(select_str_li) + "\n)"
+        )
+
+    return monthly_average_script_str.format(",\n\n".join(cte_str_li))
+
+
+def fetch_registered_partitions():
+    """
+    This function fetches the year partitions already created
+    from the partition registry.
+
+    Returns
+    -------
+    set
+        Set of (schema, year) pairs.
+    """
+    return {(schema, int(year)) for (schema, year) in warehouse.fetchall(query_fetch_registered_partitions)}
+
+
+def fetch_partitions_without_keys():
+    """
+    This function fetches the year partitions whose keys have not been
+    backfilled from the partition registry.
+
+    Returns
+    -------
+    set
+        Set of (schema, year) pairs.
+    """
+    return {(schema, int(year)) for (schema, year) in warehouse.fetchall(query_fetch_partitions_without_keys)}
+
+
+def fetch_weather_years():
+    """
+    This function fetches the range of years in the preprocessed weather
+    table from its minimum and maximum dates, which are answered from
+    table metadata without scanning the table.
+
+    Returns
+    -------
+    list
+        List of years. Empty when the table has no records.
+    """
+    (date_min, date_max) = warehouse.fetchall(query_fetch_weather_date_range)[0]
+    if date_min is None:
+        return []
+    return list(range(date_min.year, date_max.year + 1))
+
+
+def fetch_load_years():
+    """
+    This function fetches the years of the weather records loaded by
+    the latest staging load, which is identified by the maximum load date.
+
+    Returns
+    -------
+    list
+        Sorted list of years. Empty when the table has no records.
+    """
+    return sorted(int(row[0]) for row in warehouse.fetchall(query_fetch_load_years))
+
+
+def render_dbt_selector(schemas, years, partition_mode="year_table", written_file_paths=()):
+    """
+    This function renders a dbt node selector of the data models affected
+    by the latest staging load and of the data models whose files have
+    been written, with their tests and downstream data models such as
+    the monthly average aggregate.
+
+    E.g., Input: ["RAIN"], [2023], "year_table", [".../rain/rain_2015.sql"]
+          Output: "rain_2023+ daily_weather+ rain_2015+"
+
+    Parameters
+    ----------
+    schemas: list
+        List of weather schemas.
+    years: list
+        List of years loaded by the latest staging load.
+    partition_mode: str
+        Partition mode of either "year_table" or "clustered".
+    written_file_paths: list
+        Paths of written dbt model scripts and schema files.
+
+    Returns
+    -------
+    str
+        dbt node selector.
+    """
+    if partition_mode == "clustered":
+        model_names = [schema.lower() for schema in schemas] if years else []
+    else:
+        model_names = [f"{schema.lower()}_{year}" for year in years for schema in schemas]
+    model_names.append("daily_weather")
+
+    # Add data models of written files, as their definition has changed
+    for file_path in written_file_paths:
+        model_name = os.path.splitext(os.path.basename(file_path))[0]
+        if model_name not in model_names:
+            model_names.append(model_name)
+
+    return " ".join(model_name + "+" for model_name in model_names)
+
+
+def find_missing_partitions(schemas, years, registered_partitions):
+    """
+    This function finds the year partitions that are not
+    in the partition registry yet.
+
+    Parameters
+    ----------
+    schemas: list
+        List of weather schemas.
+    years: list
+        List of years.
+    registered_partitions: set
+        Set of (schema, year) pairs in the partition registry.
+
+    Returns
+    -------
+    list
+        List of missing (schema, year) pairs.
+    """
+    return [
+        (schema, year)
+        for schema in schemas
+        for year in years
+        if (schema, year) not in registered_partitions
+    ]
 
 
 def main():
     LoggingMixin().log.info("Process has started")
 
-    # Fetch years from preprocessed weather table in staging schema
-    LoggingMixin().log.info("Fetching years from preprocessed weather table...")
-    cur.execute(query_fetch_weather_years)
-    result = cur.fetchall()
-    year_li = [year[0] for year in result]
-    LoggingMixin().log.info("Years have been fetched")
-
-    # For each weather schema, create year partition tables if not existing
-    # and generate dbt model scripts & respective schema files for the 
-    # created year partition tables
-    LoggingMixin().log.info("Creating year partition tables & dbt model scripts for weather schemas...")
-    for schema, cols in weather_schema_dict_table.items():
-        # Add data type next to column
-        cols_query_str = make_col_query_str(cols, purpose="year_partition_table")
-        for year in year_li:
-            # Create year partition table
-            cur.execute(query_create_year_partition.format(schema, year, cols_query_str))
-            response = cur.fetchall()[0][0]
-            LoggingMixin().log.info(response)
-
-            # When table creation query returns successful response
-            # generate dbt model script and schema file
-            if "successfully created" in response:
-                # Generate dbt model script for year partition table
-                schema_lower = schema.lower()
-                script_name = f"{schema_lower}_{year}.sql" 
-                generate_dbt_model_script(schema, year, script_name, target_location)
-                LoggingMixin().log.info(f"dbt model script {script_name} has been created")
-
-                # Generate respective schema file
-                col_schema = weather_schema_yaml_dict[schema]
-                generate_schema_yml(schema_lower, year, col_schema)
-                LoggingMixin().log.info(f"dbt model schema file {schema}_{year}.yml has been created")
-    
+    # Create weather schemas if not existing
+    for schema in weather_schema_dict_table:
+        warehouse.execute(query_create_weather_schema.format(schema))
+
+    # Find year partitions missing from partition registry
+    """Years are derived from the minimum and maximum dates of the preprocessed
+    weather table, and compared with the partition registry. When no new year
+    has appeared, no table is created.
+    """
+    LoggingMixin().log.info("Finding missing year partitions...")
+    with metrics.stage("find_missing_partitions") as stage:
+        warehouse.execute(query_create_partition_registry)
+        warehouse.execute(query_add_keys_backfilled_partition_registry)
+        registered_partitions = fetch_registered_partitions()
+        year_li = fetch_weather_years()
+        missing_partitions = find_missing_partitions(
+            list(weather_schema_dict_table),
+            year_li,
+            registered_partitions
+        )
+        stage["rows_in"] = len(registered_partitions)
+        stage["rows_out"] = len(missing_partitions)
+    LoggingMixin().log.info(f"{len(missing_partitions)} missing year partitions have been found")
+
+    if partition_mode == "clustered":
+        # Create measurement tables clustered on date and station key
+        """Year partitions are views over the measurement tables in the
+        clustered mode, so only the partition registry is updated for
+        missing year partitions.
+        """
+        LoggingMixin().log.info("Creating clustered measurement tables for weather schemas...")
+        with metrics.stage("create_measurement_tables"):
+            warehouse.execute_concurrently([
+                query_create_measurement_table.format(
+                    schema,
+                    make_col_query_str(weather_schema_dict_table[schema], purpose="year_partition_table"),
+                    warehouse.cluster_by(["DATE", "STATION_KEY"])
+                )
+                for schema in weather_schema_dict_table
+            ])
+        LoggingMixin().log.info("Clustered measurement tables have been created")
+
+    if missing_partitions and partition_mode != "clustered":
+        # Create missing year partition tables concurrently
+        LoggingMixin().log.info("Creating year partition tables for weather schemas...")
+        with metrics.stage("create_partition_tables", rows_in=len(missing_partitions)):
+            warehouse.execute_concurrently([
+                query_create_year_partition.format(
+                    schema,
+                    year,
+                    make_col_query_str(weather_schema_dict_table[schema], purpose="year_partition_table")
+                )
+                for (schema, year) in missing_partitions
+            ])
+        LoggingMixin().log.info("Year partition tables have been created")
+
+    if missing_partitions:
+        # Register missing year partitions
+        warehouse.execute(query_register_partitions.format(",\n".join(
+            f"('{schema}', {year})" for (schema, year) in missing_partitions
+        )))
+        LoggingMixin().log.info("Year partitions have been registered")
+
+    if partition_mode != "clustered":
+        # Backfill keys of year partition tables created before the keys
+        """Year partition tables created before the record key and station key
+        were introduced get the key columns as NULL from `sync_all_columns`,
+        which fails the unique and not-null tests and the joins of the monthly
+        average aggregate. The keys are backfilled from the station dictionary
+        with the same key convention as the staging schema. Once backfilled,
+        the update prunes all micro-partitions on the null count metadata.
+        The backfill runs once per year partition, as backfilled partitions
+        are flagged in the partition registry. Missing partitions are included,
+        as the year partition tables existing before the partition registry
+        are registered as missing on its first run.
+        """
+        partitions_without_keys = sorted(fetch_partitions_without_keys())
+        if partitions_without_keys:
+            LoggingMixin().log.info("Backfilling keys of year partition tables...")
+            with metrics.stage("backfill_partition_keys", rows_in=len(partitions_without_keys)):
+                for query in query_add_keys_year_partition:
+                    warehouse.execute_concurrently([
+                        query.format(schema, year) for (schema, year) in partitions_without_keys
+                    ])
+                warehouse.execute_concurrently([
+                    query_backfill_keys_year_partition.format(
+                        schema,
+                        year,
+                        date_ordinal=warehouse.date_ordinal("TARGET.DATE")
+                    )
+                    for (schema, year) in partitions_without_keys
+                ])
+                warehouse.execute(query_flag_keys_backfilled.format(", ".join(
+                    f"('{schema}', {year})" for (schema, year) in partitions_without_keys
+                )))
+            LoggingMixin().log.info(f"Keys of {len(partitions_without_keys)} year partition tables have been backfilled")
+
+    # Generate dbt model scripts & respective schema files
+    """Files of all year partitions are rendered in memory and only
+    files whose content has changed are written, which keeps dbt
+    partial parsing effective.
+    """
+    LoggingMixin().log.info("Generating dbt model scripts for year partition tables...")
+    partitions = registered_partitions | set(missing_partitions)
+    with metrics.stage("generate_partition_models", rows_in=len(partitions)) as stage:
+        written_file_paths = generate_partition_models(partitions, partition_mode)
+        stage["rows_out"] = len(written_file_paths)
+    for file_path in written_file_paths:
+        LoggingMixin().log.info(f"dbt model file {os.path.basename(file_path)} has been written")
+    LoggingMixin().log.info(f"{len(written_file_paths)} dbt model files have been written")
+
+    # Generate dbt model script & schema file of daily weather table
+    LoggingMixin().log.info("Generating dbt model script for daily weather table...")
+    script_str, schema_str = render_daily_weather_model()
+    for (file_name, content) in [("daily_weather.sql", script_str), ("daily_weather.yml", schema_str)]:
+        file_path = target_location.format("daily_weather", file_name)
+        if write_if_changed(file_path, content):
+            written_file_paths.append(file_path)
+            LoggingMixin().log.info(f"dbt model file {file_name} has been written")
+
+    # Generate dbt model script of monthly average aggregate
+    LoggingMixin().log.info("Generating dbt model script for monthly average aggregate...")
+    file_path = target_location.format("aggregated", "monthly_average.sql")
+    if write_if_changed(
+        file_path,
+        render_monthly_average_model(partitions, partition_mode, monthly_average_source)
+    ):
+        written_file_paths.append(file_path)
+        LoggingMixin().log.info("dbt model file monthly_average.sql has been written")
+
+    # Find dbt data models affected by latest staging load
+    """Only the year partitions loaded by the latest staging load and the data
+    models whose files have been written, their tests and downstream data models
+    are built, rather than the whole project. An empty selector builds the whole
+    project.
+    """
+    if dbt_selective_build:
+        with metrics.stage("fetch_load_years") as stage:
+            load_years = fetch_load_years()
+            stage["rows_out"] = len(load_years)
+        dbt_selector = render_dbt_selector(
+            list(weather_schema_dict_table),
+            load_years,
+            partition_mode,
+            written_file_paths
+        )
+        LoggingMixin().log.info(f"dbt selector for years {load_years} and written files has been rendered")
+    else:
+        dbt_selector = ""
+
     LoggingMixin().log.info("Process has completed")
+    return dbt_selector
 
 
 if __name__ == "__main__":
-    # Define Snowflake connection
-    snowflake_user = os.environ["SNOWFLAKE_USER"]
-    snowflake_pwd = os.environ["SNOWFLAKE_PWD"]
-    snowflake_acct = os.environ["SNOWFLAKE_ACCT"]
-    snowflake_wh = "COMPUTE_WH"
-    snowflake_db = "WEATHER_ANALYSIS"
-    conn = snowflake.connector.connect(
-        user=snowflake_user,
-        password=snowflake_pwd,
-        account=snowflake_acct,
-        warehouse=snowflake_wh,
-        database=snowflake_db,
-    )
-    cur = conn.cursor()
-
-    # Define Snowflake weather measurement schemas and their attributes
-    ## For year partition tables
-    """
-    This dictionary is used to create a query to create year partition table 
-    with respective attributes. 
-
-    E.g., { Weather schema: Attributes of respective year partition table }
-
-    * Weather schema refer to weather measurement schema
-    * Year partition table refer to partition table by year
-    """
-    weather_schema_dict_table = {
-        "EVAPO_TRANSPIRATION": ["EVAPO_TRANSPIRATION"],
-        "RAIN": ["RAIN"],
-        "PAN_EVAPORATION": ["PAN_EVAPORATION"],
-        "TEMPERATURE": [
-            "MAXIMUM_TEMPERATURE",
-            "MINIMUM_TEMPERATURE",
-            "VARIANCE_TEMPERATURE"
-        ],
-        "RELATIVE_HUMIDITY": [
-            "MAXIMUM_RELATIVE_HUMIDITY",
-            "MINIMUM_RELATIVE_HUMIDITY"
-        ],
-        "WIND_SPEED": ["AVERAGE_10M_WIND_SPEED"],
-        "SOLAR_RADIATION": ["SOLAR_RADIATION"]
-    }
-    ## For dbt data model scripts
-    """
-    This dictionary is used to create a dbt data model script that
-    uses a macro `generate_year_partition_model_macro.sql which
-    requires inputs of columns.
-
-    E.g., { Weather schema: Partial query to model the attributes 
-                            of the respective year partition table }
-    """
-    weather_schema_dict_model = {
-        "EVAPO_TRANSPIRATION": ["EVAPO_TRANSPIRATION"],
-        "RAIN": ["RAIN"],
-        "PAN_EVAPORATION": ["PAN_EVAPORATION"],
-        "TEMPERATURE": [
-            "MAXIMUM_TEMPERATURE",
-            "MINIMUM_TEMPERATURE",
-            "MAXIMUM_TEMPERATURE - MINIMUM_TEMPERATURE AS VARIANCE_TEMPERATURE"
-        ],
-        "RELATIVE_HUMIDITY": [
-            "MAXIMUM_RELATIVE_HUMIDITY",
-            "MINIMUM_RELATIVE_HUMIDITY"
-        ],
-        "WIND_SPEED": ["AVERAGE_10M_WIND_SPEED"],
-        "SOLAR_RADIATION": ["SOLAR_RADIATION"]
-    }
+    # Define warehouse connection
+    """Warehouse backend is either Snowflake or local DuckDB (for offline runs).
+    """
+    warehouse_backend = os.environ.get("WAREHOUSE_BACKEND", "snowflake")
+    warehouse = connect_warehouse(warehouse_backend, "WEATHER_ANALYSIS")
 
-    # Define Snowflake queries
-    query_fetch_weather_years = """
-        SELECT DISTINCT EXTRACT(YEAR FROM DATE)
-        FROM STAGING.WEATHER_PREPROCESSED
-    """
-    query_create_year_partition = """
-        CREATE TABLE {0}.{0}_{1} IF NOT EXISTS (
-            RECORD_ID VARCHAR(100),
-            STATION_NAME VARCHAR(100),
-            DATE DATE,
-            {2}
-            STATE VARCHAR(3),
-            LOAD_DATE DATE
-        );
-    """
-
-    # Define dbt data model script
-    """
-    This defines a dbt model script which uses a macro to generate 
-    a data model for year partition tables with the passed year 
-    and schema-specific attributes.
-    """
-    target_location = "/opt/airflow/dags/dbt/models/{}/{}"
-    dbt_script_str_1 = "{{{{\n    config(\n        materialized='incremental'\n    )\n}}}}"
-    dbt_script_str_2 = "\n\n{{{{\n    generate_year_partition_model_macro(\n        \"{}\", {}\n    )\n}}}}"
-    dbt_script_str = dbt_script_str_1 + dbt_script_str_2
-
-    # Define dictionary of schema-specific columns details
-    """
-    This dictionary holds schema-specific columns details including
-    test cases (optional).
-    E.g., 
-    { 
-        Weather schema: {
-            Column name: [
-                Column description,
-                [ Test case (optional) ]
-            ]
-        }
-    }
+    # Define partition mode
+    """In the year table mode, each weather schema holds a table per year.
+    In the clustered mode, each weather schema holds a single measurement
+    table clustered on date and station key, with a view per year
+    in place of the year partition tables.
+    """
+    partition_mode = os.environ.get("DBT_PARTITION_MODE", "year_table")  # year_table or clustered
+
+    # Define source of monthly average aggregate
+    """The monthly average aggregate is computed either from the year partitions
+    of the weather schemas with a union and join per weather schema, or from
+    the wide daily weather table with a single table scan.
+    """
+    monthly_average_source = os.environ.get("DBT_MONTHLY_AVERAGE_SOURCE", "partitions")  # partitions or daily_weather
+
+    # Define selective dbt build
+    """When selective build is on, a dbt selector of the data models affected
+    by the latest staging load is printed as the last line of output to be
+    pushed to XCom. Data models whose files have been written by this script
+    are always selected. Turn it off to build the whole project.
     """
-    weather_schema_file = "/opt/airflow/dags/scripts/weather_schema_yaml_dict.txt"
-    with open(weather_schema_file, "r") as f:
-        content = f.read()
-        weather_schema_yaml_dict = ast.literal_eval(content)
+    dbt_selective_build = os.environ.get("DBT_SELECTIVE_BUILD", "true").lower() == "true"
+
+    # Define performance metrics of stages
+    """Metrics are emitted as configured in metrics.py. The metrics summary
+    is only logged, as the last line of output is the dbt selector.
+    """
+    metrics = RunMetrics("generate_dbt_model", {"partition_mode": partition_mode})
 
     try:
         # Start process
-        main()
+        dbt_selector = main()
     finally:
-        # Close cursor and connection
-        cur.close()
-        conn.close()
+        # Close connection
+        warehouse.close()
+        # Emit performance metrics
+        metrics.emit()
+
+    # Print dbt selector as the last line of output to be pushed to XCom
+    print(dbt_selector)
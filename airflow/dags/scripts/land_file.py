@@ -6,61 +6,423 @@
 # Repository: https://github.com/TravisH0301/weather_analysis
 ###############################################################################
 import os
-import io
+import sys
+import json
+import hashlib
+import itertools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import pytz
-from urllib.request import urlopen
+from ftplib import FTP, error_temp, error_perm
+from urllib.parse import urlparse
 
 import boto3
 from botocore.exceptions import ClientError
 from airflow.utils.log.logging_mixin import LoggingMixin
 
+from metrics import RunMetrics
 
-def retrieve_ftp_file(ftp_file_path):
+
+def get_ftp_file_info(ftp_host, ftp_path, ftp_port=21):
+    """
+    This function retrieves the size and modification time
+    of the file via FTP without downloading it.
+
+    When the FTP server does not support the MDTM command, the modification
+    time is None, so that changes are detected with the content hash only.
+
+    Parameters
+    ----------
+    ftp_host: str
+        FTP host of the compressed BOM dataset file.
+    ftp_path: str
+        FTP path of the compressed BOM dataset file.
+    ftp_port: int
+        FTP port.
+
+    Returns
+    -------
+    dict
+        Size in bytes and modification time (YYYYMMDDHHMMSS) of the file.
+        Modification time is None when not supported by the FTP server.
+    """
+    with FTP() as ftp:
+        ftp.connect(ftp_host, ftp_port)
+        ftp.login()
+        ftp.voidcmd("TYPE I")
+        size = ftp.size(ftp_path)
+        try:
+            mdtm = ftp.sendcmd(f"MDTM {ftp_path}").split()[-1]
+        except error_perm as e:
+            LoggingMixin().log.warning(f"Modification time is not available: {e}")
+            mdtm = None
+    return {"size": size, "mdtm": mdtm}
+
+
+def load_landing_record(s3_client, bucket_name, record_name):
+    """
+    This function loads the record of the last landed compressed
+    BOM dataset file from the object storage.
+
+    Parameters
+    ----------
+    s3_client: object
+        boto3 S3 client.
+    bucket_name: str
+        Name of target bucket.
+    record_name: str
+        Name of the landing record object.
+
+    Returns
+    -------
+    dict
+        Landing record with object name, source size, source modification
+        time and content hash. None when nothing has been landed.
+    """
+    try:
+        response = s3_client.get_object(Bucket=bucket_name, Key=record_name)
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "NoSuchKey":
+            return None
+        raise
+    return json.loads(response["Body"].read())
+
+
+def save_landing_record(s3_client, bucket_name, record_name, record):
     """
-    This function retrieves the file via FTP
-    as a byte stream object.
+    This function saves the record of the last landed compressed
+    BOM dataset file into the object storage.
 
     Parameters
     ----------
-    ftp_file_path: str
-        FTP file path of the compressed BOM dataset file.
+    s3_client: object
+        boto3 S3 client.
+    bucket_name: str
+        Name of target bucket.
+    record_name: str
+        Name of the landing record object.
+    record: dict
+        Landing record. Refer to `load_landing_record`.
+    """
+    s3_client.put_object(
+        Bucket=bucket_name,
+        Key=record_name,
+        Body=json.dumps(record, indent=2).encode("utf-8")
+    )
+
+
+def is_file_staged(s3_client, bucket_name, manifest_prefix, file_name):
+    """
+    This function checks if the landed compressed BOM dataset file
+    has been staged, by looking up the manifest saved by the staging
+    process once the file is staged.
+
+    Parameters
+    ----------
+    s3_client: object
+        boto3 S3 client.
+    bucket_name: str
+        Name of target bucket.
+    manifest_prefix: str
+        Prefix of manifest objects.
+    file_name: str
+        Name of the landed compressed BOM dataset file.
+        E.g., "IDCKWCDEA0_2023-11-12.tgz"
 
     Returns
     -------
-    object
-        Byte stream of the compressed BOM dataset file.
+    bool
+        True when the manifest of the file exists.
+    """
+    try:
+        s3_client.head_object(Bucket=bucket_name, Key=manifest_prefix + file_name[:-4] + ".json")
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+            return False
+        raise
+    return True
+
+
+def hash_parts(parts, content_hash):
     """
-    response = urlopen(ftp_file_path)
-    return io.BytesIO(response.read())
+    This function updates the content hash with each part
+    while passing the parts through.
+
+    Parameters
+    ----------
+    parts: iterable
+        Parts of the file in bytes.
+    content_hash: object
+        hashlib hash object.
+
+    Yields
+    ------
+    bytes
+        Part of the file.
+    """
+    for part in parts:
+        content_hash.update(part)
+        yield part
+
+
+def iter_ftp_file_parts(ftp_host, ftp_path, part_size, max_retries=5, ftp_port=21):
+    """
+    This function retrieves the file via FTP and yields it
+    in fixed-size parts without holding the whole file in memory.
+
+    When the connection drops or closes before the end of file, the transfer
+    resumes from the last received byte using the REST offset of a new
+    connection.
+
+    Parameters
+    ----------
+    ftp_host: str
+        FTP host of the compressed BOM dataset file.
+    ftp_path: str
+        FTP path of the compressed BOM dataset file.
+    part_size: int
+        Size of each part in bytes. The last part can be smaller.
+    max_retries: int
+        Maximum number of consecutive resumes without receiving data.
+    ftp_port: int
+        FTP port.
+
+    Yields
+    ------
+    bytes
+        Part of the compressed BOM dataset file.
+    """
+    buffer = bytearray()
+    offset = 0
+    retries = 0
+    while True:
+        try:
+            with FTP() as ftp:
+                ftp.connect(ftp_host, ftp_port)
+                ftp.login()
+                ftp.voidcmd("TYPE I")
+                file_size = ftp.size(ftp_path)
+                with ftp.transfercmd(f"RETR {ftp_path}", rest=offset or None) as data_conn:
+                    while True:
+                        chunk = data_conn.recv(64 * 1024)
+                        if not chunk:
+                            break
+                        buffer += chunk
+                        offset += len(chunk)
+                        retries = 0
+                        while len(buffer) >= part_size:
+                            yield bytes(buffer[:part_size])
+                            del buffer[:part_size]
+                ftp.voidresp()
+                # Resume when data connection has closed before the end of file
+                if file_size is not None and offset < file_size:
+                    raise EOFError(f"Data connection closed at byte {offset} of {file_size}")
+            break
+        except (OSError, EOFError, error_temp) as e:
+            retries += 1
+            if retries > max_retries:
+                LoggingMixin().log.error(f"File retrieval has failed with an error: {e}")
+                raise
+            LoggingMixin().log.warning(f"File retrieval was interrupted at byte {offset}, resuming: {e}")
+
+    # Yield remaining bytes as last part
+    if buffer:
+        yield bytes(buffer)
+
+
+def upload_multipart(
+    s3_client,
+    bucket_name,
+    obj_name,
+    parts,
+    max_concurrency,
+    should_complete=None
+):
+    """
+    This function uploads parts into the object storage
+    as a multipart upload with parts uploaded concurrently.
+
+    At most `max_concurrency` parts are uploaded at a time, so the memory
+    is bounded by part size x concurrency. The multipart upload is aborted
+    upon failure to avoid leaving incomplete parts in the bucket.
+    An empty source is uploaded as an empty object instead, as a multipart
+    upload cannot be completed without parts.
+
+    Parameters
+    ----------
+    s3_client: object
+        boto3 S3 client.
+    bucket_name: str
+        Name of target bucket.
+    obj_name: str
+        Name of the object to upload.
+    parts: iterable
+        Parts of the object in bytes. Parts except the last one
+        must be at least 5 MiB.
+    max_concurrency: int
+        Maximum number of parts uploaded at a time.
+    should_complete: function
+        Function called after all parts are uploaded. The multipart upload
+        is aborted instead of completed when it returns False.
+
+    Returns
+    -------
+    Boolean
+        Whether the multipart upload has been completed.
+    """
+    # Upload empty object when there is no part
+    parts = iter(parts)
+    first_part = next(parts, None)
+    if first_part is None:
+        if should_complete is not None and not should_complete():
+            return False
+        s3_client.put_object(Bucket=bucket_name, Key=obj_name, Body=b"")
+        return True
+    parts = itertools.chain([first_part], parts)
+
+    upload_id = s3_client.create_multipart_upload(
+        Bucket=bucket_name,
+        Key=obj_name
+    )["UploadId"]
+    try:
+        uploaded_parts = []
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            for (part_number, part) in enumerate(parts, start=1):
+                # Wait for oldest upload when concurrency limit is reached
+                if len(pending) >= max_concurrency:
+                    pending_part_number, future = pending.popleft()
+                    uploaded_parts.append({
+                        "PartNumber": pending_part_number,
+                        "ETag": future.result()["ETag"]
+                    })
+                future = executor.submit(
+                    s3_client.upload_part,
+                    Bucket=bucket_name,
+                    Key=obj_name,
+                    UploadId=upload_id,
+                    PartNumber=part_number,
+                    Body=part
+                )
+                pending.append((part_number, future))
+
+            # Wait for remaining uploads
+            while pending:
+                pending_part_number, future = pending.popleft()
+                uploaded_parts.append({
+                    "PartNumber": pending_part_number,
+                    "ETag": future.result()["ETag"]
+                })
+
+        if should_complete is not None and not should_complete():
+            s3_client.abort_multipart_upload(
+                Bucket=bucket_name,
+                Key=obj_name,
+                UploadId=upload_id
+            )
+            return False
+
+        s3_client.complete_multipart_upload(
+            Bucket=bucket_name,
+            Key=obj_name,
+            UploadId=upload_id,
+            MultipartUpload={"Parts": uploaded_parts}
+        )
+        return True
+    except Exception:
+        s3_client.abort_multipart_upload(
+            Bucket=bucket_name,
+            Key=obj_name,
+            UploadId=upload_id
+        )
+        raise
 
 
 def main():
     LoggingMixin().log.info("Process has started")
 
-    # Retrieve compressed file as byte stream object
-    LoggingMixin().log.info("Retrieving compressed file...")
-    comp_file = retrieve_ftp_file(ftp_file_path)
-    LoggingMixin().log.info("Compressed file has been retrieved")
+    # Check if compressed file has changed since last landing
+    """The size and modification time of the compressed file on FTP are
+    compared with the landing record of the last landed file. When they are
+    unchanged, the file is not downloaded. Without the modification time,
+    the file is always downloaded and compared by the content hash.
+    An unchanged file is staged again when the last landed file has not been
+    staged, e.g., when the staging process has failed.
+    """
+    LoggingMixin().log.info("Checking compressed file for changes...")
+    ftp_url = urlparse(ftp_file_path)
+    ftp_port = ftp_url.port or 21
+    with metrics.stage("check_file"):
+        ftp_file_info = get_ftp_file_info(ftp_url.hostname, ftp_url.path, ftp_port)
+        landing_record = load_landing_record(s3, bucket_name, landing_record_name)
+    if (
+        landing_record is not None
+        and ftp_file_info["mdtm"] is not None
+        and landing_record["size"] == ftp_file_info["size"]
+        and landing_record["mdtm"] == ftp_file_info["mdtm"]
+    ):
+        LoggingMixin().log.info("Compressed file has not changed since last landing")
+        is_staged = is_file_staged(s3, bucket_name, manifest_prefix, landing_record["file_name"])
+        if not is_staged:
+            LoggingMixin().log.info("Last landed file has not been staged")
+        LoggingMixin().log.info("Process has completed")
+        return not is_staged
 
-    # Load compressed file into object storage
+    # Stream compressed file into object storage
     """Current date is added to the file name to keep track of 
     BOM dataset version within object storage.
+    The compressed file is streamed from FTP into a multipart upload
+    in fixed-size parts, so that the whole file is never held in memory.
+    The content hash is computed while streaming, and the upload is aborted
+    when the content is identical to the last landed file.
     """
-    LoggingMixin().log.info("Loading compressed file into object storage...")
-    file_name = os.path.basename(ftp_file_path)
+    LoggingMixin().log.info("Streaming compressed file into object storage...")
+    file_name = os.path.basename(ftp_url.path)
     file_name_date = file_name[:-4] + f"_{date_today_str}" + file_name[-4:]
-    try:
-        s3.put_object(
-            Bucket=bucket_name,
-            Key=file_name_date,
-            Body=comp_file
+    content_hash = hashlib.sha256()
+    parts = hash_parts(
+        iter_ftp_file_parts(ftp_url.hostname, ftp_url.path, part_size, ftp_port=ftp_port),
+        content_hash
+    )
+    def is_content_changed():
+        return (
+            landing_record is None
+            or landing_record["sha256"] != content_hash.hexdigest()
         )
+    try:
+        with metrics.stage("stream_file", bytes_in=ftp_file_info["size"]) as stage:
+            is_landed = upload_multipart(
+                s3,
+                bucket_name,
+                file_name_date,
+                parts,
+                max_concurrency,
+                should_complete=is_content_changed
+            )
+            stage["bytes_out"] = ftp_file_info["size"] if is_landed else 0
     except ClientError as e:
-        LoggingMixin().log.error("File load has failed with an error: {e}")    
-    LoggingMixin().log.info("Compressed file has been loaded to object storage")
+        LoggingMixin().log.error(f"File load has failed with an error: {e}")
+        raise
+
+    # Update landing record
+    """When the content is unchanged, the landing record keeps pointing to
+    the last landed file with the new size and modification time.
+    """
+    is_staged = False
+    if is_landed:
+        landing_record = {"file_name": file_name_date, "sha256": content_hash.hexdigest()}
+        LoggingMixin().log.info("Compressed file has been loaded to object storage")
+    else:
+        LoggingMixin().log.info("Compressed file content has not changed since last landing")
+        is_staged = is_file_staged(s3, bucket_name, manifest_prefix, landing_record["file_name"])
+        if not is_staged:
+            LoggingMixin().log.info("Last landed file has not been staged")
+    landing_record.update(ftp_file_info)
+    save_landing_record(s3, bucket_name, landing_record_name, landing_record)
     
     LoggingMixin().log.info("Process has completed")
+    return not is_staged
 
 
 if __name__ == "__main__":
@@ -84,11 +446,42 @@ if __name__ == "__main__":
         aws_secret_access_key=minio_secret_key
     )
 
+    # Define multipart upload
+    """Memory is bounded by part size x concurrency.
+    Part size must be at least 5 MiB for S3-compatible multipart upload.
+    """
+    part_size = int(os.environ.get("LAND_PART_SIZE", 8 * 1024**2))
+    max_concurrency = int(os.environ.get("LAND_MAX_CONCURRENCY", 4))
+
+    # Define landing record, manifest prefix and skip exit code
+    """The landing record keeps the source size, modification time and content
+    hash of the last landed file. When the file has not changed and has been
+    staged, as found by its manifest saved by stage_data.py, the process exits
+    with the skip exit code so that downstream tasks are skipped.
+    """
+    landing_record_name = "latest/IDCKWCDEA0.json"
+    manifest_prefix = "manifests/"
+    skip_exit_code = 99
+
+    # Define performance metrics of stages
+    """Metrics are emitted as configured in metrics.py, and a summary is
+    printed as the last line of output to be pushed to XCom.
+    """
+    metrics = RunMetrics("land_file")
+
     try:
         # Start Process
-        main()
+        is_staging_required = main()
     finally:
         # Close connection
         s3.close()
+        # Emit performance metrics
+        metrics.emit()
+
+    if not is_staging_required:
+        sys.exit(skip_exit_code)
+
+    # Print metrics summary as the last line of output to be pushed to XCom
+    print(json.dumps(metrics.summary()))
     
 
@@ -0,0 +1,305 @@
+###############################################################################
+# Name: metrics.py
+# Description: This script records performance metrics of the stages of the
+#              pipeline scripts (wall time, CPU time, peak RSS, rows and bytes)
+#              and emits them as a JSON run report, a Prometheus textfile,
+#              StatsD metrics and an Airflow XCom summary, so that regressions
+#              can be seen in trends.
+#              Outputs are configured with environment variables:
+#              METRICS_REPORT_DIR, METRICS_TEXTFILE_DIR, METRICS_STATSD_HOST,
+#              METRICS_STATSD_PORT and METRICS_STATSD_PREFIX.
+# Author: Travis Hong
+# Repository: https://github.com/TravisH0301/weather_analysis
+###############################################################################
+import os
+import re
+import json
+import time
+import socket
+import resource
+from contextlib import contextmanager
+from datetime import datetime
+
+from airflow.utils.log.logging_mixin import LoggingMixin
+
+
+# Define stage metrics and their units
+"""
+E.g., { Metric: Unit, where times are sent as StatsD timers and others as gauges }
+"""
+stage_metric_units = {
+    "wall_seconds": "seconds",
+    "cpu_seconds": "seconds",
+    "peak_rss_bytes": "bytes",
+    "rows_in": "rows",
+    "rows_out": "rows",
+    "bytes_in": "bytes",
+    "bytes_out": "bytes"
+}
+
+
+def read_peak_rss():
+    """
+    This function reads the peak resident set size of this process.
+
+    On Linux, the peak is read from /proc and can be reset per stage.
+    Otherwise, the peak since the process start is used.
+
+    Returns
+    -------
+    int
+        Peak resident set size in bytes.
+    """
+    try:
+        with open("/proc/self/status", "r") as f:
+            return int(re.search(r"VmHWM:\s+(\d+) kB", f.read()).group(1)) * 1024
+    except (OSError, AttributeError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def reset_peak_rss():
+    """
+    This function resets the peak resident set size of this process
+    to its current resident set size where supported (Linux).
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def read_cpu_seconds():
+    """
+    This function reads the CPU time of this process and its terminated
+    child processes (e.g., pre-processing worker processes).
+
+    Returns
+    -------
+    float
+        User and system CPU time in seconds.
+    """
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+class RunMetrics():
+    """
+    This class records performance metrics of the stages of a pipeline
+    script run, and emits them once the run has completed.
+
+    Stages are recorded with the context manager `stage`, which yields the
+    stage record so that rows and bytes handled by the stage can be set.
+    Stages can be nested, and the peak RSS of a stage covers its nested stages.
+    """
+
+    def __init__(self, script, labels=None):
+        """
+        Parameters
+        ----------
+        script: str
+            Name of the pipeline script. E.g., "stage_data"
+        labels: dict
+            Labels of the run. E.g., {"mode": "reduce"}
+        """
+        self.script = script
+        self.labels = {key: str(value) for (key, value) in (labels or {}).items() if value is not None}
+        self.run_id = os.environ.get("AIRFLOW_CTX_DAG_RUN_ID", datetime.now().strftime("manual__%Y%m%dT%H%M%S"))
+        self.started_at = datetime.now().isoformat(timespec="seconds")
+        self.status = "success"
+        self.stages = []
+        self.stage_stack = []
+        self.file_stem = re.sub(r"[^\w.-]", "_", "_".join([script] + list(self.labels.values())))
+
+    @contextmanager
+    def stage(self, name, rows_in=None, bytes_in=None):
+        """
+        This method records wall time, CPU time and peak RSS of the
+        enclosed block as a stage. The stage is recorded as failed
+        when the block raises an exception.
+
+        Parameters
+        ----------
+        name: str
+            Name of the stage. E.g., "dedup_weather"
+        rows_in: int
+            Number of rows into the stage.
+        bytes_in: int
+            Number of bytes into the stage.
+
+        Yields
+        ------
+        dict
+            Stage record, where "rows_out" and "bytes_out"
+            (and "rows_in" and "bytes_in") can be set.
+        """
+        record = {
+            "stage": name,
+            "status": "success",
+            "wall_seconds": None,
+            "cpu_seconds": None,
+            "peak_rss_bytes": None,
+            "rows_in": rows_in,
+            "rows_out": None,
+            "bytes_in": bytes_in,
+            "bytes_out": None
+        }
+        # Keep peak RSS of the enclosing stage before resetting
+        if self.stage_stack:
+            parent = self.stage_stack[-1]
+            parent["peak_rss_bytes"] = max(parent["peak_rss_bytes"] or 0, read_peak_rss())
+        reset_peak_rss()
+        self.stage_stack.append(record)
+        wall_start = time.perf_counter()
+        cpu_start = read_cpu_seconds()
+        try:
+            yield record
+        except BaseException:
+            record["status"] = "failed"
+            self.status = "failed"
+            raise
+        finally:
+            record["wall_seconds"] = round(time.perf_counter() - wall_start, 6)
+            record["cpu_seconds"] = round(read_cpu_seconds() - cpu_start, 6)
+            record["peak_rss_bytes"] = max(record["peak_rss_bytes"] or 0, read_peak_rss())
+            self.stage_stack.pop()
+            if self.stage_stack:
+                parent = self.stage_stack[-1]
+                parent["peak_rss_bytes"] = max(parent["peak_rss_bytes"] or 0, record["peak_rss_bytes"])
+            self.stages.append(record)
+            LoggingMixin().log.info(
+                f"Stage {name} took {record['wall_seconds']:.3f}s wall, "
+                f"{record['cpu_seconds']:.3f}s CPU, "
+                f"{record['peak_rss_bytes'] / 1024**2:.1f} MB peak RSS"
+            )
+
+    def report(self):
+        """
+        This method returns the run report.
+
+        Returns
+        -------
+        dict
+            Run report with the stages in order of completion.
+        """
+        return {
+            "script": self.script,
+            "labels": self.labels,
+            "run_id": self.run_id,
+            "started_at": self.started_at,
+            "status": self.status,
+            "stages": self.stages
+        }
+
+    def summary(self):
+        """
+        This method returns a compact summary of the run to be pushed to XCom.
+
+        Returns
+        -------
+        dict
+            Status, and wall seconds and rows out by stage.
+        """
+        return {
+            "status": self.status,
+            "stages": {
+                record["stage"]: {
+                    key: record[key] for key in ["wall_seconds", "rows_out"]
+                    if record[key] is not None
+                }
+                for record in self.stages
+            }
+        }
+
+    def render_prometheus(self):
+        """
+        This method renders the stage metrics in the Prometheus text format.
+
+        Returns
+        -------
+        str
+            Prometheus text format of metrics.
+        """
+        lines = []
+        for metric in stage_metric_units:
+            name = f"weather_pipeline_stage_{metric}"
+            lines.append(f"# TYPE {name} gauge")
+            for record in self.stages:
+                if record[metric] is None:
+                    continue
+                labels = dict(self.labels, script=self.script, stage=record["stage"])
+                labels_str = ",".join(f'{key}="{value}"' for (key, value) in sorted(labels.items()))
+                lines.append(f"{name}{{{labels_str}}} {record[metric]}")
+        labels_str = ",".join(
+            f'{key}="{value}"' for (key, value) in sorted(dict(self.labels, script=self.script).items())
+        )
+        lines.append("# TYPE weather_pipeline_run_success gauge")
+        lines.append(f"weather_pipeline_run_success{{{labels_str}}} {int(self.status == 'success')}")
+        lines.append("# TYPE weather_pipeline_run_timestamp_seconds gauge")
+        lines.append(f"weather_pipeline_run_timestamp_seconds{{{labels_str}}} {int(time.time())}")
+        return "\n".join(lines) + "\n"
+
+    def render_statsd(self, prefix):
+        """
+        This method renders the stage metrics as StatsD lines, with times
+        as timers in milliseconds and the others as gauges.
+
+        Parameters
+        ----------
+        prefix: str
+            Prefix of metric names.
+
+        Returns
+        -------
+        list
+            List of StatsD lines.
+        """
+        lines = []
+        for record in self.stages:
+            for (metric, unit) in stage_metric_units.items():
+                if record[metric] is None:
+                    continue
+                name = f"{prefix}.{self.script}.{record['stage']}.{metric}"
+                if unit == "seconds":
+                    lines.append(f"{name}:{record[metric] * 1000:.3f}|ms")
+                else:
+                    lines.append(f"{name}:{record[metric]}|g")
+        return lines
+
+    def emit(self):
+        """
+        This method writes the JSON run report and the Prometheus textfile,
+        and sends the StatsD metrics, where configured. Failures to emit
+        are logged without failing the run.
+        """
+        LoggingMixin().log.info(f"Metrics summary: {json.dumps(self.summary())}")
+        try:
+            report_dir = os.environ.get("METRICS_REPORT_DIR")
+            if report_dir:
+                os.makedirs(report_dir, exist_ok=True)
+                report_path = os.path.join(
+                    report_dir,
+                    self.file_stem + "_" + re.sub(r"[^\w.-]", "_", self.run_id) + ".json"
+                )
+                with open(report_path, "w") as f:
+                    json.dump(self.report(), f, indent=2)
+                LoggingMixin().log.info(f"Run report has been written to {report_path}")
+
+            # Write Prometheus textfile atomically for the node exporter textfile collector
+            textfile_dir = os.environ.get("METRICS_TEXTFILE_DIR")
+            if textfile_dir:
+                os.makedirs(textfile_dir, exist_ok=True)
+                textfile_path = os.path.join(textfile_dir, self.file_stem + ".prom")
+                with open(textfile_path + ".tmp", "w") as f:
+                    f.write(self.render_prometheus())
+                os.replace(textfile_path + ".tmp", textfile_path)
+
+            statsd_host = os.environ.get("METRICS_STATSD_HOST")
+            if statsd_host:
+                statsd_port = int(os.environ.get("METRICS_STATSD_PORT", 8125))
+                statsd_prefix = os.environ.get("METRICS_STATSD_PREFIX", "weather_pipeline")
+                with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+                    for line in self.render_statsd(statsd_prefix):
+                        sock.sendto(line.encode(), (statsd_host, statsd_port))
+        except OSError as e:
+            LoggingMixin().log.warning(f"Metrics have not been emitted: {e}")
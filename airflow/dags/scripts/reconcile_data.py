@@ -1,95 +1,329 @@
 ###############################################################################
 # Name: reconcile_data.py
-# Description: This script reconciles row count between staging schema and
-#              weather schemas in Snowflake to ensure data integrity.
+# Description: This script reconciles row count and content between staging
+#              schema and weather schemas in the warehouse by year partition to
+#              ensure data integrity.
 # Author: Travis Hong
 # Repository: https://github.com/TravisH0301/weather_analysis
 ###############################################################################
 import os
+import json
+import calendar
 
-import snowflake.connector
 from airflow.utils.log.logging_mixin import LoggingMixin
 
+from warehouse import connect_warehouse
+from metrics import RunMetrics
 
-def extract_row_count(schema, start_year, end_year):
+
+def extract_staging_row_counts():
+    """
+    This function extracts the row count of the staging schema by year.
+
+    Returns
+    -------
+    dict
+        Row count by year.
+    """
+    return {int(year): row_count for (year, row_count) in warehouse.fetchall(query_count_staging)}
+
+
+def extract_partition_row_counts(partitions):
+    """
+    This function extracts the row count of each year partition table
+    of the weather schemas.
+
+    Row counts are taken from table metadata, which is exact for permanent
+    tables, in a single query. Partitions without metadata row count are
+    counted with queries running concurrently.
+
+    Parameters
+    ----------
+    partitions: list
+        List of (schema, year) pairs.
+
+    Returns
+    -------
+    dict
+        Row count by (schema, year). None when the partition table does not exist.
+    """
+    # Extract row counts from table metadata
+    schemas = sorted({schema for (schema, _) in partitions})
+    metadata_row_counts = warehouse.fetch_row_counts(schemas)
+    partition_row_counts = {
+        (schema, year): metadata_row_counts.get((schema, f"{schema}_{year}"))
+        for (schema, year) in partitions
+    }
+
+    # Count rows of existing partitions without metadata row count
+    count_partitions = [
+        (schema, year) for (schema, year) in partitions
+        if (schema, f"{schema}_{year}") in metadata_row_counts
+        and partition_row_counts[(schema, year)] is None
+    ]
+    results = warehouse.execute_concurrently([
+        f"SELECT COUNT(*) FROM {schema}.{schema}_{year}"
+        for (schema, year) in count_partitions
+    ])
+    for (partition, result) in zip(count_partitions, results):
+        partition_row_counts[partition] = result[0][0]
+
+    return partition_row_counts
+
+
+def find_row_count_mismatches(staging_row_counts, partition_row_counts):
     """
-    This function extracts the total row count of the given weather
-    schema tables.
+    This function compares the row count of each year partition table
+    with the row count of the staging schema for the year.
 
     Parameters
     ----------
-    schema: str
-        Weather schema.
-    start_year: int/str
-        Starting year to start count.
-    end_year: int/str
-        Ending year to stop count.
+    staging_row_counts: dict
+        Row count of the staging schema by year.
+    partition_row_counts: dict
+        Row count by (schema, year).
 
     Returns
     -------
-    int
-        Total row count of the schema.
+    list
+        List of (schema, year, staging row count, partition row count)
+        for partitions that disagree.
     """
-    # Build query to count rows of the schema
-    query_count = f"WITH UNION_CTE AS\n(SELECT * FROM {schema}.{schema}_{start_year}"
-    for year in range(start_year, end_year, 1):
-        query_count += f"\nUNION\nSELECT * FROM {schema}.{schema}_{year+1}"
-        if year + 1 == end_year:
-            query_count += "\n)\nSELECT COUNT(*) FROM UNION_CTE"
+    return [
+        (schema, year, staging_row_counts.get(year, 0), row_count)
+        for ((schema, year), row_count) in sorted(partition_row_counts.items())
+        if staging_row_counts.get(year, 0) != row_count
+    ]
+
 
-    # Execute query
-    cur.execute(query_count)
-    result = cur.fetchall()
-    row_count = result[0][0]
-    return row_count
+def extract_staging_checksums(schema_hash_columns, date_start=None, date_end=None):
+    """
+    This function extracts the aggregate hash of each weather schema's
+    columns in the staging schema by (year, month), or by day between
+    the given dates, in a single scan.
+
+    The record key assigned in the staging schema is carried over
+    to the weather schemas.
+
+    Parameters
+    ----------
+    schema_hash_columns: dict
+        Dictionary of weather schema and its columns to hash.
+    date_start: datetime.date
+        Start date to extract aggregate hash by day. None for by month.
+    date_end: datetime.date
+        End date to extract aggregate hash by day.
+
+    Returns
+    -------
+    dict
+        Aggregate hash by (schema, bucket), where bucket is (year, month)
+        or (year, month, day).
+    """
+    bucket_cols = ["EXTRACT(YEAR FROM DATE)", "EXTRACT(MONTH FROM DATE)"]
+    if date_start is not None:
+        bucket_cols.append("EXTRACT(DAY FROM DATE)")
+    schemas = list(schema_hash_columns)
+    hash_agg_cols = [
+        warehouse.hash_agg(["RECORD_KEY"] + schema_hash_columns[schema])
+        for schema in schemas
+    ]
+    query = (
+        f"SELECT {', '.join(bucket_cols + hash_agg_cols)}\n"
+        f"FROM STAGING.WEATHER_PREPROCESSED\n"
+    )
+    if date_start is not None:
+        query += f"WHERE DATE BETWEEN '{date_start}' AND '{date_end}'\n"
+    query += f"GROUP BY {', '.join(str(i + 1) for i in range(len(bucket_cols)))}"
+
+    staging_checksums = {}
+    for row in warehouse.fetchall(query):
+        bucket = tuple(int(value) for value in row[:len(bucket_cols)])
+        for (schema, checksum) in zip(schemas, row[len(bucket_cols):]):
+            staging_checksums[(schema, bucket)] = checksum
+    return staging_checksums
+
+
+def extract_partition_checksums(schema_hash_columns, partitions, date_start=None, date_end=None):
+    """
+    This function extracts the aggregate hash of the year partition tables
+    by (year, month), or by day between the given dates, with queries
+    running concurrently.
+
+    Parameters
+    ----------
+    schema_hash_columns: dict
+        Dictionary of weather schema and its columns to hash.
+    partitions: list
+        List of (schema, year) pairs.
+    date_start: datetime.date
+        Start date to extract aggregate hash by day. None for by month.
+    date_end: datetime.date
+        End date to extract aggregate hash by day.
+
+    Returns
+    -------
+    dict
+        Aggregate hash by (schema, bucket), where bucket is (year, month)
+        or (year, month, day).
+    """
+    bucket_cols = ["EXTRACT(MONTH FROM DATE)"]
+    if date_start is not None:
+        bucket_cols.append("EXTRACT(DAY FROM DATE)")
+    queries = []
+    for (schema, year) in partitions:
+        hash_agg_col = warehouse.hash_agg(["RECORD_KEY"] + schema_hash_columns[schema])
+        query = (
+            f"SELECT {', '.join(bucket_cols + [hash_agg_col])}\n"
+            f"FROM {schema}.{schema}_{year}\n"
+        )
+        if date_start is not None:
+            query += f"WHERE DATE BETWEEN '{date_start}' AND '{date_end}'\n"
+        query += f"GROUP BY {', '.join(str(i + 1) for i in range(len(bucket_cols)))}"
+        queries.append(query)
+
+    partition_checksums = {}
+    for ((schema, year), result) in zip(partitions, warehouse.execute_concurrently(queries)):
+        for row in result:
+            bucket = (year,) + tuple(int(value) for value in row[:-1])
+            partition_checksums[(schema, bucket)] = row[-1]
+    return partition_checksums
+
+
+def find_checksum_mismatches(staging_checksums, partition_checksums):
+    """
+    This function compares the aggregate hashes of the staging schema
+    and the weather schemas by bucket.
+
+    Parameters
+    ----------
+    staging_checksums: dict
+        Aggregate hash of the staging schema by (schema, bucket).
+    partition_checksums: dict
+        Aggregate hash of the weather schemas by (schema, bucket).
+
+    Returns
+    -------
+    list
+        Sorted list of (schema, bucket) that disagree.
+    """
+    buckets = set(staging_checksums) | set(partition_checksums)
+    return sorted(
+        bucket for bucket in buckets
+        if staging_checksums.get(bucket) != partition_checksums.get(bucket)
+    )
+
+
+def reconcile_checksums(schema_hash_columns, partitions):
+    """
+    This function reconciles the content of the staging schema and
+    the weather schemas by comparing aggregate hashes computed in the
+    warehouse, so that only the hashes are fetched.
+
+    Aggregate hashes are compared by (schema, year, month) first, and
+    the disagreeing months are narrowed down to the disagreeing days.
+
+    Parameters
+    ----------
+    schema_hash_columns: dict
+        Dictionary of weather schema and its columns to hash.
+    partitions: list
+        List of (schema, year) pairs.
+
+    Returns
+    -------
+    list
+        Sorted list of (schema, (year, month, day)) that disagree.
+    """
+    # Compare aggregate hashes by month
+    month_mismatches = find_checksum_mismatches(
+        extract_staging_checksums(schema_hash_columns),
+        extract_partition_checksums(schema_hash_columns, partitions)
+    )
+
+    # Narrow down disagreeing months to days
+    day_mismatches = []
+    for (schema, (year, month)) in month_mismatches:
+        date_start = f"{year}-{month:02d}-01"
+        date_end = f"{year}-{month:02d}-{calendar.monthrange(year, month)[1]:02d}"
+        schema_hash_column = {schema: schema_hash_columns[schema]}
+        day_mismatches += find_checksum_mismatches(
+            extract_staging_checksums(schema_hash_column, date_start, date_end),
+            extract_partition_checksums(
+                schema_hash_column, [(schema, year)], date_start, date_end
+            )
+        )
+    return day_mismatches
 
 
 def main():
     LoggingMixin().log.info("Process has started")
 
-    # Extract row count from staging schema
-    LoggingMixin().log.info("Extracting row count from staging schema...")
-    cur.execute(query_count_staging)
-    result = cur.fetchall()
-    row_count_stg = result[0][0]
-    LoggingMixin().log.info("Row count has been extracted")
-
-    # Extract row count from weather schemas
-    LoggingMixin().log.info("Extracting row counts from weather scheams")
-    weather_schema_counts = {}
-    for schema in weather_schema_names:
-        row_count = extract_row_count(weather_schema_names[0], 2012, 2023)
-        weather_schema_counts[schema] = row_count
+    # Extract row counts by year from staging schema
+    LoggingMixin().log.info("Extracting row counts from staging schema...")
+    with metrics.stage("count_staging") as stage:
+        staging_row_counts = extract_staging_row_counts()
+        stage["rows_out"] = sum(staging_row_counts.values())
+    LoggingMixin().log.info("Row counts have been extracted")
+
+    # Extract row counts from year partitions of weather schemas
+    LoggingMixin().log.info("Extracting row counts from weather scheams...")
+    partitions = [
+        (schema, year)
+        for schema in weather_schema_names
+        for year in staging_row_counts
+    ]
+    with metrics.stage("count_partitions", rows_in=len(partitions)) as stage:
+        partition_row_counts = extract_partition_row_counts(partitions)
+        stage["rows_out"] = sum(row_count or 0 for row_count in partition_row_counts.values())
     LoggingMixin().log.info("Row counts have been extracted")
 
-    # Reconcile row counts
+    # Reconcile row counts by year partition
     LoggingMixin().log.info("Reconciling row counts...")
-    for schema, row_count_weather in weather_schema_counts.items():
-        LoggingMixin().log.info(f"Staging schame row count: {row_count_stg}")
-        LoggingMixin().log.info(f"{schema} schema row count: {row_count_weather}")
-        if row_count_stg != row_count_weather:
-            LoggingMixin().log.error("Reconciliation has failed")
-            raise Exception("Reconciliation failure")
+    mismatches = find_row_count_mismatches(staging_row_counts, partition_row_counts)
+    for (schema, year, row_count_stg, row_count_weather) in mismatches:
+        LoggingMixin().log.error(
+            f"{schema}.{schema}_{year} row count {row_count_weather} "
+            f"does not match staging schema row count {row_count_stg} for {year}"
+        )
+    if mismatches:
+        LoggingMixin().log.error("Reconciliation has failed")
+        raise Exception("Reconciliation failure")
+    LoggingMixin().log.info("Row count reconciliation has been successful")
+
+    # Reconcile content by aggregate hashes
+    LoggingMixin().log.info("Reconciling aggregate hashes...")
+    with metrics.stage("reconcile_checksums", rows_in=len(partitions)) as stage:
+        mismatches = reconcile_checksums(
+            weather_schema_hash_columns,
+            partitions
+        )
+        stage["rows_out"] = len(mismatches)
+    for (schema, (year, month, day)) in mismatches:
+        LoggingMixin().log.error(
+            f"{schema}.{schema}_{year} content does not match staging schema "
+            f"on {year}-{month:02d}-{day:02d}"
+        )
+    if mismatches:
+        LoggingMixin().log.error("Reconciliation has failed")
+        raise Exception("Reconciliation failure")
     LoggingMixin().log.info("Reconciliation has been successful")
 
     LoggingMixin().log.info("Process has completed")
 
 
 if __name__ == "__main__":     
-    # Define Snowflake connection
-    snowflake_user = os.environ["SNOWFLAKE_USER"]
-    snowflake_pwd = os.environ["SNOWFLAKE_PWD"]
-    snowflake_acct = os.environ["SNOWFLAKE_ACCT"]
-    snowflake_wh = "COMPUTE_WH"
-    snowflake_db = "WEATHER_ANALYSIS"
-    conn = snowflake.connector.connect(
-        user=snowflake_user,
-        password=snowflake_pwd,
-        account=snowflake_acct,
-        warehouse=snowflake_wh,
-        database=snowflake_db,
-    )
-    cur = conn.cursor()
+    # Define warehouse connection
+    """Warehouse backend is either Snowflake or local DuckDB (for offline runs).
+    """
+    warehouse_backend = os.environ.get("WAREHOUSE_BACKEND", "snowflake")
+    warehouse = connect_warehouse(warehouse_backend, "WEATHER_ANALYSIS")
+
+    # Define performance metrics of stages
+    """Metrics are emitted as configured in metrics.py, and a summary is
+    printed as the last line of output to be pushed to XCom.
+    """
+    metrics = RunMetrics("reconcile_data")
 
     # Define schema names
     weather_schema_names = [
@@ -102,13 +336,35 @@ if __name__ == "__main__":
         "SOLAR_RADIATION"
     ]
 
-    # Define Snowflake query
-    query_count_staging = "SELECT COUNT(*) FROM STAGING.WEATHER_PREPROCESSED"
+    # Define columns to hash for each weather schema
+    """Derived columns (e.g., VARIANCE_TEMPERATURE) are excluded as they
+    do not exist in the staging schema.
+    """
+    weather_schema_hash_columns = {
+        "EVAPO_TRANSPIRATION": ["EVAPO_TRANSPIRATION"],
+        "RAIN": ["RAIN"],
+        "PAN_EVAPORATION": ["PAN_EVAPORATION"],
+        "TEMPERATURE": ["MAXIMUM_TEMPERATURE", "MINIMUM_TEMPERATURE"],
+        "RELATIVE_HUMIDITY": ["MAXIMUM_RELATIVE_HUMIDITY", "MINIMUM_RELATIVE_HUMIDITY"],
+        "WIND_SPEED": ["AVERAGE_10M_WIND_SPEED"],
+        "SOLAR_RADIATION": ["SOLAR_RADIATION"]
+    }
+
+    # Define warehouse queries
+    query_count_staging = """
+        SELECT EXTRACT(YEAR FROM DATE), COUNT(*)
+        FROM STAGING.WEATHER_PREPROCESSED
+        GROUP BY 1
+    """
 
     try:
         # Start process
         main()
     finally:
-        # Close cursor and connection
-        cur.close()
-        conn.close()
+        # Close connection
+        warehouse.close()
+        # Emit performance metrics
+        metrics.emit()
+
+    # Print metrics summary as the last line of output to be pushed to XCom
+    print(json.dumps(metrics.summary()))
@@ -2,58 +2,207 @@
 # Name: stage_data.py
 # Description: This script extracts weather and station datasets from the
 #              compressed BOM dataset file in the object storage. And this 
-#              pre-processes and loads the datasets into the Snowflake
+#              pre-processes and loads the datasets into the warehouse
 #              staging schema.
 # Author: Travis Hong
 # Repository: https://github.com/TravisH0301/weather_analysis
 ###############################################################################
 import os
+import sys
 import io
 import tarfile
+import json
+import hashlib
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 import pytz
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
 
 import boto3
 from botocore.exceptions import ClientError
-import snowflake.connector
-from snowflake.connector.pandas_tools import write_pandas
 from airflow.utils.log.logging_mixin import LoggingMixin
 
+from warehouse import connect_warehouse
+from metrics import RunMetrics
 
-def find_latest_file(s3_client, bucket_name):
+
+def find_latest_file(s3_client, bucket_name, landing_record_name, file_prefix):
     """
     This function looks up the object storage
     bucket to find the latest file.
 
+    The landing record written by the landing process points to the latest
+    file, so it is found with a single request. When the landing record
+    does not exist, the bucket is listed by year prefix from the current
+    year backwards, so that only a year's worth of files is listed.
+
     Parameters
     ----------
     s3_client: object
         boto3 S3 client.
     bucket_name: str
         Name of source bucket.
+    landing_record_name: str
+        Name of the landing record object.
+    file_prefix: str
+        Prefix of compressed BOM dataset files followed by date.
+        E.g., "IDCKWCDEA0_" for "IDCKWCDEA0_2023-11-12.tgz"
     
     Returns
     -------
     latest_obj_name: str
         Name of the latest compressed BOM dataset file.
     """
-    # Retrieve files and their dates
-    obj_name_date_dict = dict()
-    response = s3_client.list_objects(Bucket=bucket_name)
-    for obj in response["Contents"]:
-        obj_name = obj["Key"]
-        obj_date = obj_name[-14:-4]  #YYYY-MM-DD
-        obj_name_date_dict[obj_name] = obj_date
-    
-    # Get the latest file with its latest date
-    latest_obj_name = max(
-        obj_name_date_dict, 
-        key=lambda k: datetime.strptime(obj_name_date_dict[k], "%Y-%m-%d")
+    # Look up landing record
+    try:
+        response = s3_client.get_object(Bucket=bucket_name, Key=landing_record_name)
+        return json.loads(response["Body"].read())["file_name"]
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "NoSuchKey":
+            raise
+        LoggingMixin().log.warning("Landing record is not found, listing bucket instead")
+
+    # List files by year prefix
+    """File names end with the date in YYYY-MM-DD format,
+    so the latest file has the largest name within the year.
+    """
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for year in range(datetime.now().year, 1999, -1):
+        obj_names = []
+        for page in paginator.paginate(Bucket=bucket_name, Prefix=f"{file_prefix}{year}-"):
+            obj_names += [
+                obj["Key"] for obj in page.get("Contents", [])
+                if obj["Key"].endswith(".tgz")
+            ]
+        if obj_names:
+            return max(obj_names)
+
+    raise FileNotFoundError(f"No compressed BOM dataset file is found in {bucket_name}")
+
+
+def find_latest_manifest(s3_client, bucket_name, manifest_prefix):
+    """
+    This function looks up the object storage bucket to find
+    the manifest of the latest staged compressed BOM dataset file.
+
+    Manifest names contain the date of the compressed BOM dataset file,
+    so the latest manifest has the largest name.
+
+    Parameters
+    ----------
+    s3_client: object
+        boto3 S3 client.
+    bucket_name: str
+        Name of source bucket.
+    manifest_prefix: str
+        Prefix of manifest objects.
+
+    Returns
+    -------
+    dict
+        Manifest of members. None when no manifest exists.
+    """
+    manifest_names = []
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=manifest_prefix):
+        manifest_names += [obj["Key"] for obj in page.get("Contents", [])]
+    if not manifest_names:
+        return None
+
+    response = s3_client.get_object(Bucket=bucket_name, Key=max(manifest_names))
+    return json.loads(response["Body"].read())["members"]
+
+
+def save_manifest(s3_client, bucket_name, manifest_name, file_name, manifest):
+    """
+    This function saves the manifest of the compressed BOM dataset file
+    into the object storage.
+
+    Parameters
+    ----------
+    s3_client: object
+        boto3 S3 client.
+    bucket_name: str
+        Name of target bucket.
+    manifest_name: str
+        Name of the manifest object.
+    file_name: str
+        Name of the compressed BOM dataset file.
+    manifest: dict
+        Manifest of members.
+    """
+    body = json.dumps({"file_name": file_name, "members": manifest}, indent=2)
+    s3_client.put_object(
+        Bucket=bucket_name,
+        Key=manifest_name,
+        Body=body.encode("utf-8")
     )
-    
-    return latest_obj_name
+
+
+def open_file_stream(s3_client, bucket_name, obj_name):
+    """
+    This function opens the object in the object storage
+    as a non-seekable byte stream without downloading it first.
+
+    Parameters
+    ----------
+    s3_client: object
+        boto3 S3 client.
+    bucket_name: str
+        Name of source bucket.
+    obj_name: str
+        Name of the object to open.
+
+    Returns
+    -------
+    object
+        Streaming body of the object.
+    """
+    try:
+        response = s3_client.get_object(Bucket=bucket_name, Key=obj_name)
+    except ClientError as e:
+        LoggingMixin().log.error(f"File load has failed with an error: {e}")
+        raise
+    return response["Body"]
+
+
+def download_file(s3_client, bucket_name, obj_name):
+    """
+    This function downloads the object in the object storage
+    into a byte stream object.
+
+    Parameters
+    ----------
+    s3_client: object
+        boto3 S3 client.
+    bucket_name: str
+        Name of source bucket.
+    obj_name: str
+        Name of the object to download.
+
+    Returns
+    -------
+    object
+        Byte stream of the object.
+    """
+    file_obj = io.BytesIO()
+    try:
+        s3_client.download_fileobj(
+            Bucket=bucket_name,
+            Key=obj_name,
+            Fileobj=file_obj
+        )
+    except ClientError as e:
+        LoggingMixin().log.error(f"File load has failed with an error: {e}")
+        raise
+    file_obj.seek(0)
+    return file_obj
 
 
 def check_dataset_date_condition(file_name):
@@ -74,6 +223,65 @@ def check_dataset_date_condition(file_name):
     return create_year >= 2012
 
 
+def read_bom_csv(file_obj, columns):
+    """
+    This function reads the numeric block of the BOM daily weather CSV
+    file object into a dataframe in a single pass.
+
+    The BOM CSV file has a header block of titles and column descriptions
+    and a "Totals:" footer row. Instead of skipping them with the slow
+    python engine, the header block and footer row are located in the raw
+    bytes and only the block in between is parsed with the C engine,
+    typing the measurement columns as they are read.
+
+    Parameters
+    ----------
+    file_obj: object
+        CSV file object in Byte.
+    columns: list
+        Columns of the dataset. First two columns are the station name
+        and date, and the rest are measurement attributes.
+
+    Returns
+    -------
+    pd.DataFrame
+        Dataset with raw station name and date and float measurements.
+    """
+    content = file_obj.read()
+
+    # Find start of numeric block after the column description rows
+    """The column description ends with the "Station Name" row
+    followed by the unit row starting with an empty station name.
+    """
+    header = content.find(b"\nStation Name,")
+    if header == -1:
+        raise ValueError("Column description of BOM CSV file is not found")
+    start = content.find(b"\n", header + 1) + 1
+    while start and content[start:start + 1] in (b",", b"\r", b"\n"):
+        start = content.find(b"\n", start) + 1
+    if start == 0:
+        start = len(content)
+
+    # Find end of numeric block before the footer row
+    end = content.find(b"\nTotals:", start)
+    if end == -1:
+        end = len(content)
+
+    # Parse numeric block with measurements typed as float
+    df = pd.read_csv(
+        io.BytesIO(content[start:end]),
+        encoding="ISO-8859-1",
+        engine="c",
+        header=None,
+        names=columns,
+        dtype={col: np.float64 for col in columns[2:]},
+        na_values=[" "],
+        skip_blank_lines=True
+    )
+
+    return df
+
+
 def pre_process_csv(file_obj, state, date_today):
     """
     This function pre-processes CSV file object
@@ -108,24 +316,10 @@ def pre_process_csv(file_obj, state, date_today):
         "SOLAR_RADIATION"
     ]
 
-    # Load to dataframe
-    df = pd.read_csv(
-        file_obj,
-        encoding="ISO-8859-1",
-        engine="python",
-        skiprows=12,
-        skipfooter=1,
-        skip_blank_lines=True
-    )
+    # Load to dataframe with measurement attributes in float data type
+    df = read_bom_csv(file_obj, columns)
 
     # Pre-process dataset
-    ## Redefine columns
-    df.columns = columns
-    ## Nulliyfy empty strings
-    df = df.replace("", None).replace(" ", None)
-    ## Convert measurement attributes into float data type
-    for float_col in columns[2:]:
-        df[float_col] = df[float_col].astype(np.float64)
     ## Convert DATE column into date data type
     df["DATE"] = pd.to_datetime(df["DATE"], format="%d/%m/%Y").dt.date
     ## Add additional attributes
@@ -199,8 +393,312 @@ def pre_process_fwf(file_obj, date_today):
     return df
 
 
+def get_member_shard(member_name):
+    """
+    This function returns the shard of a member in the compressed
+    BOM dataset file, which is the state directory for weather datasets
+    and "STATION" for the station dataset.
+
+    Parameters
+    ----------
+    member_name: str
+        Name of the member in the compressed BOM dataset file.
+
+    Returns
+    -------
+    str
+        Shard of the member. None when the member is not a dataset.
+    """
+    if member_name.endswith(".csv"):
+        return member_name.split("/")[1].upper()
+    elif member_name.endswith(".txt"):
+        return "STATION"
+    return None
+
+
+def split_archive_shards(tar_file, output_dir):
+    """
+    This function splits the compressed BOM dataset file into an
+    uncompressed tar file per shard in a single pass, so that each shard
+    is pre-processed without downloading and decompressing the whole
+    compressed file again.
+
+    Members are copied one at a time with their names kept, so that the
+    tar file can be opened in stream mode and the manifests of shards
+    match the manifest of the compressed file.
+
+    Parameters
+    ----------
+    tar_file: tarfile.TarFile
+        Opened compressed BOM dataset file.
+    output_dir: str
+        Local directory to write the tar files of shards into.
 
-def dedup_weather(df):
+    Returns
+    -------
+    dict
+        Paths of tar files by shard in shard order.
+        Refer to `get_member_shard`.
+    """
+    shard_files = {}
+    try:
+        for member in tar_file:
+            if not member.isfile():
+                continue
+            shard = get_member_shard(member.name)
+            if shard is None:
+                continue
+            if shard not in shard_files:
+                shard_files[shard] = tarfile.open(os.path.join(output_dir, f"{shard}.tar"), mode="w")
+            shard_files[shard].addfile(member, tar_file.extractfile(member))
+    finally:
+        for shard_file in shard_files.values():
+            shard_file.close()
+
+    return {shard: os.path.join(output_dir, f"{shard}.tar") for shard in sorted(shard_files)}
+
+
+def iter_archive_members(tar_file, shards=None):
+    """
+    This function walks through the members of the compressed BOM dataset
+    file in archive order and yields the raw content of weather and station
+    datasets.
+
+    Members are read one at a time so that the tar file can be opened
+    in stream mode (e.g., "r|gz") where members cannot be revisited.
+    Members outside the given shards are skipped without being read.
+
+    Parameters
+    ----------
+    tar_file: tarfile.TarFile
+        Opened compressed BOM dataset file.
+    shards: list
+        List of shards to read. Refer to `get_member_shard`.
+        All members are read when None.
+
+    Yields
+    ------
+    member_name: str
+        Name of the member in the compressed BOM dataset file.
+    file_type: str
+        Either "csv" for weather dataset or "txt" for station dataset.
+    state: str
+        State the weather dataset is from. None for station dataset.
+    content: bytes
+        Raw content of the dataset.
+    """
+    for member in tar_file:
+        if not member.isfile():
+            continue
+        if shards is not None and get_member_shard(member.name) not in shards:
+            continue
+        # Read csv files for weather datasets
+        if member.name.endswith(".csv"):
+            # Process only if dataset is created in or after 2012
+            is_valid = check_dataset_date_condition(member.name)
+            if not is_valid:
+                continue
+            state = member.name.split("/")[1].upper()
+            yield member.name, "csv", state, tar_file.extractfile(member).read()
+
+        # Read text file for station dataset
+        elif member.name.endswith(".txt"):
+            yield member.name, "txt", None, tar_file.extractfile(member).read()
+
+
+def filter_changed_members(members, previous_manifest, manifest):
+    """
+    This function records the size and content hash of each member
+    into the manifest and yields only the members that are new or
+    changed since the previous manifest.
+
+    Parameters
+    ----------
+    members: iterable
+        Members yielded by `iter_archive_members`.
+    previous_manifest: dict
+        Manifest of the previously staged compressed BOM dataset file.
+        All members are yielded when None.
+    manifest: dict
+        Manifest to record the members into.
+        E.g., {member name: {"size": size, "sha256": content hash}}
+
+    Yields
+    ------
+    file_type: str
+        Either "csv" for weather dataset or "txt" for station dataset.
+    state: str
+        State the weather dataset is from. None for station dataset.
+    content: bytes
+        Raw content of the dataset.
+    """
+    for (member_name, file_type, state, content) in members:
+        member_entry = {
+            "size": len(content),
+            "sha256": hashlib.sha256(content).hexdigest()
+        }
+        manifest[member_name] = member_entry
+        if previous_manifest is not None and previous_manifest.get(member_name) == member_entry:
+            continue
+        yield file_type, state, content
+
+
+def pre_process_member(file_type, state, content, date_today):
+    """
+    This function pre-processes the raw content of a dataset
+    in the compressed BOM dataset file.
+
+    This is a top-level function so that it can be run
+    in worker processes.
+
+    Parameters
+    ----------
+    file_type: str
+        Either "csv" for weather dataset or "txt" for station dataset.
+    state: str
+        State the weather dataset is from.
+    content: bytes
+        Raw content of the dataset.
+    date_today: datetime.date
+        Current date.
+
+    Returns
+    -------
+    pd.DataFrame
+        Pre-processed dataset.
+    """
+    file_obj = io.BytesIO(content)
+    if file_type == "csv":
+        return pre_process_csv(file_obj, state, date_today)
+    else:
+        return pre_process_fwf(file_obj, date_today)
+
+
+def process_archive(
+    tar_file,
+    date_today,
+    max_workers=1,
+    max_inflight_bytes=None,
+    previous_manifest=None,
+    shards=None
+):
+    """
+    This function pre-processes weather and station datasets
+    in the compressed BOM dataset file.
+
+    When the manifest of the previously staged file is given, only the
+    members that are new or changed are pre-processed. The manifest of
+    the given file is returned to be compared against in the next run.
+
+    When more than one worker is given, the members are streamed out of
+    the tar file by this process and pre-processed in a process pool.
+    Results are gathered in archive order to produce the same output
+    as the serial process. The raw bytes handed to the pool and not yet
+    gathered are bounded by `max_inflight_bytes` to keep memory bounded.
+
+    Parameters
+    ----------
+    tar_file: tarfile.TarFile
+        Opened compressed BOM dataset file.
+    date_today: datetime.date
+        Current date.
+    max_workers: int
+        Number of worker processes. 1 pre-processes in this process.
+    max_inflight_bytes: int
+        Maximum raw bytes handed to the process pool at a time.
+        No limit when None.
+    previous_manifest: dict
+        Manifest of the previously staged compressed BOM dataset file.
+        All members are pre-processed when None.
+    shards: list
+        List of shards to pre-process. Refer to `get_member_shard`.
+        All members are pre-processed when None.
+
+    Returns
+    -------
+    df_weather_li: list
+        List of pre-processed weather datasets.
+    df_station: pd.DataFrame
+        Pre-processed station dataset. None when not changed.
+    manifest: dict
+        Manifest of the compressed BOM dataset file.
+    """
+    df_weather_li = []
+    df_station = None
+    manifest = {}
+    members = filter_changed_members(
+        iter_archive_members(tar_file, shards),
+        previous_manifest,
+        manifest
+    )
+
+    # Pre-process members serially
+    if max_workers <= 1:
+        for (file_type, state, content) in members:
+            df = pre_process_member(file_type, state, content, date_today)
+            if file_type == "csv":
+                df_weather_li.append(df)
+            else:
+                df_station = df
+        return df_weather_li, df_station, manifest
+
+    # Pre-process members in process pool
+    pending = deque()
+    inflight_bytes = 0
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for (file_type, state, content) in members:
+            # Gather oldest results until new member fits in-flight limit
+            while (
+                pending
+                and max_inflight_bytes is not None
+                and inflight_bytes + len(content) > max_inflight_bytes
+            ):
+                pending_file_type, pending_size, future = pending.popleft()
+                inflight_bytes -= pending_size
+                if pending_file_type == "csv":
+                    df_weather_li.append(future.result())
+                else:
+                    df_station = future.result()
+
+            future = executor.submit(
+                pre_process_member, file_type, state, content, date_today
+            )
+            pending.append((file_type, len(content), future))
+            inflight_bytes += len(content)
+
+        # Gather remaining results
+        while pending:
+            pending_file_type, _, future = pending.popleft()
+            if pending_file_type == "csv":
+                df_weather_li.append(future.result())
+            else:
+                df_station = future.result()
+
+    return df_weather_li, df_station, manifest
+
+
+def build_wrong_state_index(station_wrong_state):
+    """
+    This function builds a lookup index of stations and
+    their wrong station locations.
+
+    Parameters
+    ----------
+    station_wrong_state: list
+        List of pairs of station and its wrong station location.
+
+    Returns
+    -------
+    pd.MultiIndex
+        Index of station name and wrong state.
+    """
+    return pd.MultiIndex.from_tuples(
+        station_wrong_state,
+        names=["STATION_NAME", "STATE"]
+    )
+
+
+def dedup_weather(df, wrong_state_index):
     """
     This function deduplicates weather datasets using two methods:
     1. Removing weather records with wrong weather station location
@@ -213,32 +711,174 @@ def dedup_weather(df):
     the correct station locations, yet, due to its incompleteness, the station
     dataset is not integrated in this deduplication function.
 
+    Both methods are evaluated into a single mask which is applied once.
+    Wrong station locations are removed with an anti-join against the lookup
+    index, and duplicates are found on the integer record key of station
+    and date, which is the key of the staging and warehouse tables.
+
     Parameters
     ----------
     df: pd.DataFrame
-        Weather dataset to be deduplicated.
+        Weather dataset to be deduplicated, with RECORD_KEY column.
+        Refer to `assign_record_keys`.
+    wrong_state_index: pd.MultiIndex
+        Index of stations and their wrong station locations.
+        Refer to `build_wrong_state_index`.
 
     Returns
     -------
     pd.DataFrame
         Deduplicated weather dataset.
     """
-    # Remove records with wrong weather station location
-    for (station, wrong_state) in station_wrong_state:
-        df = df.loc[~((df["STATION_NAME"]==station) & (df["STATE"]==wrong_state))]
+    # Find records with wrong weather station location
+    is_kept = ~pd.MultiIndex.from_arrays(
+        [df["STATION_NAME"], df["STATE"]]
+    ).isin(wrong_state_index)
+
+    # Find records with duplication among remaining records
+    kept_positions = np.flatnonzero(is_kept)
+    record_key = df["RECORD_KEY"].to_numpy()[kept_positions]
+    is_duplicated = pd.Series(record_key).duplicated().to_numpy()
+    is_kept[kept_positions[is_duplicated]] = False
+
+    return df.loc[is_kept]
+
+
+def build_station_dictionary(station_names, station_ids, station_dictionary):
+    """
+    This function builds a dictionary of station names and
+    compact integer station keys.
+
+    Existing keys are kept as they are. A new station name is keyed with
+    its BOM station ID from the station dataset when the ID is not taken yet,
+    otherwise it is given the next key from 1,000,000 upwards, which is above
+    the range of 6-digit BOM station IDs.
+
+    Parameters
+    ----------
+    station_names: iterable
+        Station names to be keyed.
+    station_ids: dict
+        BOM station IDs by station name from the station dataset.
+    station_dictionary: dict
+        Existing station keys by station name.
+
+    Returns
+    -------
+    station_dictionary: dict
+        Station keys by station name including new station names.
+    new_entries: list
+        List of (station name, station key) pairs added to the dictionary.
+    """
+    station_dictionary = dict(station_dictionary)
+    keys_taken = set(station_dictionary.values())
+    next_key = max(keys_taken | {999999}) + 1
+    new_entries = []
+    for station_name in sorted(set(station_names) - set(station_dictionary)):
+        station_id = station_ids.get(station_name)
+        if station_id is not None and int(station_id) not in keys_taken:
+            station_key = int(station_id)
+        else:
+            station_key = next_key
+            next_key += 1
+        station_dictionary[station_name] = station_key
+        keys_taken.add(station_key)
+        new_entries.append((station_name, station_key))
+
+    return station_dictionary, new_entries
+
+
+def assign_record_keys(df, station_dictionary):
+    """
+    This function assigns integer station and record keys
+    to weather records.
 
-    # Remove records with duplication
-    df = df.drop_duplicates(
-        subset=[
-            "STATION_NAME",
-            "DATE"
-        ]
+    The record key is the station key multiplied by 100,000 plus
+    the date ordinal (days since 1970-01-01), which is unique for each
+    station and date up to the year 2243 and fits in 64 bits.
+
+    Parameters
+    ----------
+    df: pd.DataFrame
+        Weather dataset.
+    station_dictionary: dict
+        Station keys by station name.
+        Refer to `build_station_dictionary`.
+
+    Returns
+    -------
+    pd.DataFrame
+        Weather dataset with STATION_KEY and RECORD_KEY columns.
+    """
+    station_keys = df["STATION_NAME"].map(station_dictionary)
+    if station_keys.isna().any():
+        raise KeyError("Station names are missing in the station dictionary")
+    station_keys = station_keys.to_numpy(dtype=np.int64)
+    date_ordinals = np.array(df["DATE"], dtype="datetime64[D]").astype(np.int64)
+
+    return df.assign(
+        STATION_KEY=station_keys,
+        RECORD_KEY=station_keys * 100000 + date_ordinals
     )
 
-    return df
 
+def compile_validation_rules(validation_rules):
+    """
+    This function compiles validation rules into a function that
+    evaluates all rules into a single boolean mask.
+
+    Each rule is defined as (column, operator, bound) where bound is either
+    a number or another column name for a cross-column rule.
+    E.g., ("RAIN", ">=", 0) or ("MAXIMUM_TEMPERATURE", ">=", "MINIMUM_TEMPERATURE")
 
-def validate_weather(df):
+    A record passes a rule when the comparison holds or when any of
+    the compared values is null, as the weather station may not have
+    a measurement equipment.
+
+    Parameters
+    ----------
+    validation_rules: list
+        List of validation rules.
+
+    Returns
+    -------
+    function
+        Function that receives a weather dataset and returns a boolean mask
+        of valid records and a dictionary of rejected row count by rule.
+    """
+    operators = {
+        ">=": np.greater_equal,
+        ">": np.greater,
+        "<=": np.less_equal,
+        "<": np.less,
+        "==": np.equal,
+        "!=": np.not_equal
+    }
+    compiled_rules = [
+        (f"{column} {operator} {bound}", column, operators[operator], bound)
+        for (column, operator, bound) in validation_rules
+    ]
+
+    def evaluate(df):
+        is_valid = np.ones(len(df), dtype=bool)
+        rejected_counts = {}
+        for (rule_name, column, compare, bound) in compiled_rules:
+            values = df[column].to_numpy(dtype=np.float64)
+            is_null = np.isnan(values)
+            # Compare with another column for cross-column rule
+            if isinstance(bound, str):
+                bound = df[bound].to_numpy(dtype=np.float64)
+                is_null |= np.isnan(bound)
+            with np.errstate(invalid="ignore"):
+                is_passed = compare(values, bound) | is_null
+            rejected_counts[rule_name] = len(df) - int(np.count_nonzero(is_passed))
+            is_valid &= is_passed
+        return is_valid, rejected_counts
+
+    return evaluate
+
+
+def validate_weather(df, validation_rules):
     """
     This function validates weather dataset's measurement attributes
     by removing faulty records from the dataset.
@@ -249,138 +889,527 @@ def validate_weather(df):
     Note that null values are kept as the weather station may not has 
     a measurement equipment.
 
+    All validation rules are evaluated into a single mask which is applied
+    once, and the row count rejected by each rule is logged.
+
     Parameters
     ----------
     df: pd.DataFrame
         Weather dataset to be validated.
+    validation_rules: list
+        List of validation rules. Refer to `compile_validation_rules`.
     
     Returns
     -------
     pd.DataFrame
         Validated weather dataset.
     """
-    # Validate Evapo transpiration >= 0
-    df = df.loc[
-        (df["EVAPO_TRANSPIRATION"] >= 0)
-        | (df["EVAPO_TRANSPIRATION"].isnull())
-    ]
-    # Validate Rain fall >= 0
-    df = df.loc[
-        (df["RAIN"] >= 0)
-        | (df["RAIN"].isnull())
-    ]
-    # Validate Pan evaporation >= 0
-    df = df.loc[
-        (df["PAN_EVAPORATION"] >= 0)
-        | (df["PAN_EVAPORATION"].isnull())
-    ]
-    # Validate Max Temp > Min Temp
-    df = df.loc[
-        (df["MAXIMUM_TEMPERATURE"] >= df["MINIMUM_TEMPERATURE"])
-        | (df["MAXIMUM_TEMPERATURE"].isnull())
-        | (df["MINIMUM_TEMPERATURE"].isnull())
-    ]
-    # Validate Relative humidity >= 0
-    df = df.loc[
-        (
-            (df["MAXIMUM_RELATIVE_HUMIDITY"] >= 0)
-            | (df["MAXIMUM_RELATIVE_HUMIDITY"].isnull())
-        ) &
-        (
-            (df["MINIMUM_RELATIVE_HUMIDITY"] >= 0)
-            | (df["MINIMUM_RELATIVE_HUMIDITY"].isnull())
+    evaluate = compile_validation_rules(validation_rules)
+    is_valid, rejected_counts = evaluate(df)
+    for (rule_name, rejected_count) in rejected_counts.items():
+        LoggingMixin().log.info(f"Validation rule {rule_name} rejected {rejected_count} records")
+
+    return df.loc[is_valid]
+
+
+def write_parquet_partitions(df, output_dir, file_name, row_group_size):
+    """
+    This function writes the weather dataset as compressed Parquet files
+    partitioned by year and state in hive layout. File names are
+    suffixed with the partition, so that they are unique across partitions.
+    E.g., {output_dir}/year=2023/state=VIC/{file_name}_2023_VIC.parquet
+
+    Parameters
+    ----------
+    df: pd.DataFrame
+        Weather dataset.
+    output_dir: str
+        Local directory to write Parquet files into.
+    file_name: str
+        Prefix of name of Parquet file in each partition.
+    row_group_size: int
+        Maximum number of rows in each Parquet row group.
+
+    Returns
+    -------
+    list
+        Paths of Parquet files relative to the output directory.
+    """
+    file_paths = []
+    years = pd.DatetimeIndex(df["DATE"]).year
+    for ((year, state), df_partition) in df.groupby([years, df["STATE"]], sort=True):
+        file_path = f"year={year}/state={state}/{file_name}_{year}_{state}.parquet"
+        os.makedirs(os.path.join(output_dir, os.path.dirname(file_path)), exist_ok=True)
+        pq.write_table(
+            pa.Table.from_pandas(df_partition, preserve_index=False),
+            os.path.join(output_dir, file_path),
+            compression="zstd",
+            row_group_size=row_group_size
         )
-    ]
-    # Validate Wind speed >= 0
-    df = df.loc[
-        (df["AVERAGE_10M_WIND_SPEED"] >= 0)
-        | df["AVERAGE_10M_WIND_SPEED"].isnull()
-    ]
-    # Validate Solar radiation >= 0
-    df = df.loc[
-        (df["SOLAR_RADIATION"] >= 0)
-        | (df["SOLAR_RADIATION"].isnull())
-    ]
+        file_paths.append(file_path)
 
-    return df
+    return file_paths
 
-def main():
-    LoggingMixin().log.info("Process has started")
 
-    # Load latest compressed file as byte stream object
-    LoggingMixin().log.info("Retrieving latest compressed file...")
-    latest_file_name = find_latest_file(s3, bucket_name)
-    latest_file = io.BytesIO()
-    try:
-        s3.download_fileobj(
-            Bucket=bucket_name,
-            Key=latest_file_name,
-            Fileobj=latest_file
+def read_parquet_partitions(path, filesystem=None):
+    """
+    This function reads the weather dataset from Parquet files
+    partitioned by year and state to replay or benchmark loads.
+
+    Parameters
+    ----------
+    path: str
+        Directory of Parquet files written by `write_parquet_partitions`.
+    filesystem: pyarrow.fs.FileSystem
+        Filesystem of the directory (e.g., S3FileSystem for object storage).
+        Local filesystem when None.
+
+    Returns
+    -------
+    pd.DataFrame
+        Weather dataset.
+    """
+    dataset = ds.dataset(path, format="parquet", filesystem=filesystem, partitioning="hive")
+    df = dataset.to_table().to_pandas()
+
+    return df.drop(columns=["year", "state"], errors="ignore")
+
+
+def upload_parquet_partitions(s3_client, bucket_name, prefix, output_dir, file_paths):
+    """
+    This function uploads Parquet files into the object storage
+    keeping the partition layout.
+
+    Parameters
+    ----------
+    s3_client: object
+        boto3 S3 client.
+    bucket_name: str
+        Name of target bucket.
+    prefix: str
+        Prefix of uploaded objects.
+    output_dir: str
+        Local directory of Parquet files.
+    file_paths: list
+        Paths of Parquet files relative to the output directory.
+    """
+    for file_path in file_paths:
+        s3_client.upload_file(
+            os.path.join(output_dir, file_path),
+            bucket_name,
+            prefix + file_path
         )
-    except ClientError as e:
-        LoggingMixin().log.error("File load has failed with an error: {e}")  
-    LoggingMixin().log.info("Compressed file has been retrieved")
 
-    # Create Snowflake tables if not existing
-    LoggingMixin().log.info("Creating Snowflake tables...")
-    ## Weather dataset
-    cur.execute(query_create_tgt_weather)
-    cur.execute(query_create_temp_table.format(table_temp_weather, table_tgt_weather))
-    ## Station dataset
-    cur.execute(query_create_tgt_station)
-    cur.execute(query_create_temp_table.format(table_temp_station, table_tgt_station))
-    LoggingMixin().log.info("Snowflake tables have been created")
 
-    # Pre-process weather and station datasets from byte stream object
-    LoggingMixin().log.info("Pre-processing weather and station datasets...")
-    latest_file.seek(0)
+def save_shard_output(s3_client, bucket_name, prefix, df_weather_li, df_station, manifest):
+    """
+    This function saves the pre-processed datasets and the manifest
+    of a shard into the object storage to be loaded by the reduce step.
+
+    Parameters
+    ----------
+    s3_client: object
+        boto3 S3 client.
+    bucket_name: str
+        Name of target bucket.
+    prefix: str
+        Prefix of the shard output objects.
+    df_weather_li: list
+        List of pre-processed weather datasets.
+    df_station: pd.DataFrame
+        Pre-processed station dataset. None when not changed.
+    manifest: dict
+        Manifest of the members of the shard.
+    """
+    # Remove output of a previous attempt of the shard
+    delete_objects(s3_client, bucket_name, prefix)
+
+    df_outputs = {"weather.parquet": None, "station.parquet": df_station}
+    if df_weather_li:
+        df_outputs["weather.parquet"] = pd.concat(df_weather_li, ignore_index=True)
+    for (obj_name, df) in df_outputs.items():
+        if df is None:
+            continue
+        buffer = io.BytesIO()
+        pq.write_table(pa.Table.from_pandas(df, preserve_index=False), buffer, compression="zstd")
+        s3_client.put_object(Bucket=bucket_name, Key=prefix + obj_name, Body=buffer.getvalue())
+    s3_client.put_object(
+        Bucket=bucket_name,
+        Key=prefix + "manifest.json",
+        Body=json.dumps(manifest).encode("utf-8")
+    )
+
+
+def load_shard_outputs(s3_client, bucket_name, prefix):
+    """
+    This function loads the pre-processed datasets and the manifests
+    saved by all shards of the compressed BOM dataset file.
+
+    Shard outputs are loaded in shard name order, so that weather datasets
+    are combined in the same order on every run. Other objects under the
+    prefix, such as the tar files of shards, are not read.
+
+    Parameters
+    ----------
+    s3_client: object
+        boto3 S3 client.
+    bucket_name: str
+        Name of source bucket.
+    prefix: str
+        Prefix of the shard output objects of the compressed BOM dataset file.
+
+    Returns
+    -------
+    df_weather_li: list
+        List of pre-processed weather datasets.
+    df_station: pd.DataFrame
+        Pre-processed station dataset. None when not changed.
+    manifest: dict
+        Manifest of the compressed BOM dataset file.
+    """
+    obj_names = []
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+        obj_names += [obj["Key"] for obj in page.get("Contents", [])]
+
     df_weather_li = []
-    with tarfile.open(fileobj=latest_file) as tar_file:
-        for member in tar_file.getmembers():
-            # Process and load csv files for weather datasets
-            if member.isfile() and member.name.endswith(".csv"):
-                # Process only if dataset is created in or after 2012
-                is_valid = check_dataset_date_condition(member.name)
-                if not is_valid:
-                    continue
-                # Convert csv file object to dataframe
-                state = member.name.split("/")[1].upper()
-                csv_obj = tar_file.extractfile(member)
-                df_weather = pre_process_csv(csv_obj, state, date_today)
-                df_weather_li.append(df_weather)
-
-            # Process and load text file for station dataset
-            elif member.isfile() and member.name.endswith(".txt"):
-                # Convert fwf text file object to dataframe
-                fwf_obj = tar_file.extractfile(member)
-                df_station = pre_process_fwf(fwf_obj, date_today)
-    LoggingMixin().log.info("Datasets have been pre-processed")
-
-    # Load pre-processed datasets into Snowflake staging schema
-    """The use of temp tables and merge statements ensures
+    df_station = None
+    manifest = {}
+    for obj_name in sorted(obj_names):
+        # Skip other objects (e.g., tar files of shards) without reading them
+        if not obj_name.endswith(("manifest.json", "weather.parquet", "station.parquet")):
+            continue
+        body = s3_client.get_object(Bucket=bucket_name, Key=obj_name)["Body"].read()
+        if obj_name.endswith("manifest.json"):
+            manifest.update(json.loads(body))
+        elif obj_name.endswith("weather.parquet"):
+            df_weather_li.append(pq.read_table(io.BytesIO(body)).to_pandas())
+        elif obj_name.endswith("station.parquet"):
+            df_station = pq.read_table(io.BytesIO(body)).to_pandas()
+
+    return df_weather_li, df_station, manifest
+
+
+def delete_objects(s3_client, bucket_name, prefix):
+    """
+    This function deletes all objects under the prefix
+    in the object storage.
+
+    Parameters
+    ----------
+    s3_client: object
+        boto3 S3 client.
+    bucket_name: str
+        Name of bucket.
+    prefix: str
+        Prefix of objects to delete.
+    """
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+        objects = [{"Key": obj["Key"]} for obj in page.get("Contents", [])]
+        if objects:
+            s3_client.delete_objects(Bucket=bucket_name, Delete={"Objects": objects})
+
+
+def open_latest_file(latest_file_name):
+    """
+    This function opens the compressed BOM dataset file, or the tar file
+    of a shard, from the object storage in the ingest mode. The compression
+    is detected when the file is opened with `tarfile.open`.
+
+    In stream mode, the compressed file is read straight from the object
+    storage response body, so members are parsed while the file is still being
+    downloaded and the whole file is never held in memory.
+    In buffer mode, the compressed file is downloaded into a byte stream object
+    before any member is parsed.
+
+    Parameters
+    ----------
+    latest_file_name: str
+        Name of the compressed BOM dataset file or the tar file of a shard.
+
+    Returns
+    -------
+    latest_file: object
+        File object of the compressed BOM dataset file.
+    tar_mode: str
+        Mode to open the file object with `tarfile.open`.
+    """
+    if ingest_mode == "stream":
+        return open_file_stream(s3, bucket_name, latest_file_name), "r|*"
+    else:
+        return download_file(s3, bucket_name, latest_file_name), "r:*"
+
+
+def pre_process_latest_file(latest_file_name, shards=None):
+    """
+    This function pre-processes the weather and station datasets of the
+    given shards in the compressed BOM dataset file.
+
+    Parameters
+    ----------
+    latest_file_name: str
+        Name of the compressed BOM dataset file or the tar file of a shard.
+    shards: list
+        List of shards to pre-process. All members are pre-processed when None.
+
+    Returns
+    -------
+    df_weather_li: list
+        List of pre-processed weather datasets.
+    df_station: pd.DataFrame
+        Pre-processed station dataset. None when not changed.
+    manifest: dict
+        Manifest of the pre-processed members.
+    """
+    if stage_delta_only:
+        previous_manifest = find_latest_manifest(s3, bucket_name, manifest_prefix)
+    else:
+        previous_manifest = None
+    LoggingMixin().log.info(f"Pre-processing weather and station datasets in {ingest_mode} mode...")
+    """The stage covers the download, tar walk and parsing, which overlap
+    in stream mode. Bytes in are the uncompressed bytes of the members read.
+    """
+    with metrics.stage("pre_process") as stage:
+        latest_file, tar_mode = open_latest_file(latest_file_name)
+        with tarfile.open(fileobj=latest_file, mode=tar_mode) as tar_file:
+            df_weather_li, df_station, manifest = process_archive(
+                tar_file,
+                date_today,
+                max_workers=stage_max_workers,
+                max_inflight_bytes=stage_max_inflight_bytes,
+                previous_manifest=previous_manifest,
+                shards=shards
+            )
+        latest_file.close()
+        stage["bytes_in"] = sum(member_entry["size"] for member_entry in manifest.values())
+        stage["rows_out"] = sum(len(df) for df in df_weather_li)
+    LoggingMixin().log.info(f"{len(df_weather_li)} new or changed weather datasets have been pre-processed")
+
+    return df_weather_li, df_station, manifest
+
+
+def load_datasets(latest_file_name, df_weather_li, df_station):
+    """
+    This function deduplicates, validates and keys the pre-processed datasets
+    and loads them into the warehouse staging schema.
+
+    The use of temp tables and merge statements ensures
     the idempotency of this process.
+
+    Parameters
+    ----------
+    latest_file_name: str
+        Name of the compressed BOM dataset file.
+    df_weather_li: list
+        List of pre-processed weather datasets.
+    df_station: pd.DataFrame
+        Pre-processed station dataset. None when not changed.
+    """
+    # Create warehouse tables if not existing
+    LoggingMixin().log.info("Creating warehouse tables...")
+    with metrics.stage("create_tables"):
+        ## Weather dataset
+        warehouse.execute(query_create_tgt_weather)
+        for query_add_key_weather in query_add_keys_weather:
+            warehouse.execute(query_add_key_weather)
+        warehouse.create_temp_table_like(table_temp_weather, table_tgt_weather)
+        ## Station dataset
+        warehouse.execute(query_create_tgt_station)
+        warehouse.create_temp_table_like(table_temp_station, table_tgt_station)
+        warehouse.execute(query_create_station_dictionary)
+    LoggingMixin().log.info("Warehouse tables have been created")
+
+    # Load pre-processed datasets into warehouse staging schema
+    LoggingMixin().log.info("Loading datasets into warehouse staging schema...")
+    ## Station dataset
+    if df_station is not None:
+        ### Load station dataset into temp station table
+        with metrics.stage("write_pandas_station", rows_in=len(df_station)):
+            warehouse.write_pandas(df_station, table_temp_station)
+        ### Merge from temp station table to target station table
+        with metrics.stage("merge_station", rows_in=len(df_station)):
+            warehouse.merge_insert(
+                table_tgt_station,
+                table_temp_station,
+                "TARGET.STATION_ID = SOURCE.STATION_ID",
+                station_columns
+            )
+
+    ## Station dictionary
+    """Station names of the loaded weather records and of staged weather
+    records without keys are keyed, so that records staged before the keys
+    were introduced are backfilled.
     """
-    LoggingMixin().log.info("Loading datasets into Snowflake staging schema...")
-    ## Weather dataset 
-    ### Combine weather datasets
-    df_weather_combine = pd.concat(df_weather_li, ignore_index=True)
-    ### Deduplicate records
-    df_weather_combine_dedup = dedup_weather(df_weather_combine)
-    ### Validate records
-    df_weather_combine_valid = validate_weather(df_weather_combine_dedup)
-    ### Load into temp weather table
-    write_pandas(conn, df_weather_combine_valid, table_temp_weather)
-    ### Merge from temp weather table to target weather table
-    cur.execute(query_merge_weather)
-
-    ## State dataset
-    ### Load station dataset into temp station table
-    write_pandas(conn, df_station, table_temp_station)
-    ### Merge from temp station table to target station table
-    cur.execute(query_merge_station)
-    LoggingMixin().log.info("Datasets have been loaded to Snowflake")
+    with metrics.stage("station_dictionary") as stage:
+        if df_weather_li:
+            station_names = set().union(*(df["STATION_NAME"].unique() for df in df_weather_li))
+        else:
+            station_names = set()
+        station_names.update(row[0] for row in warehouse.fetchall(query_fetch_unkeyed_station_names))
+        station_dictionary = dict(warehouse.fetchall(query_fetch_station_dictionary))
+        station_ids = dict(warehouse.fetchall(query_fetch_station_ids))
+        station_dictionary, new_entries = build_station_dictionary(
+            station_names,
+            station_ids,
+            station_dictionary
+        )
+        if new_entries:
+            warehouse.insert_rows(table_station_dictionary, ["STATION_NAME", "STATION_KEY"], new_entries)
+            LoggingMixin().log.info(f"{len(new_entries)} stations have been added to the station dictionary")
+        warehouse.execute(query_backfill_keys_weather.format(date_ordinal=warehouse.date_ordinal("TARGET.DATE")))
+        stage["rows_in"] = len(station_names)
+        stage["rows_out"] = len(new_entries)
+
+    ## Weather dataset
+    if df_weather_li:
+        ### Combine weather datasets
+        with metrics.stage("combine_weather") as stage:
+            df_weather_combine = pd.concat(df_weather_li, ignore_index=True)
+            stage["rows_out"] = len(df_weather_combine)
+        ### Assign integer station and record keys
+        """Records are keyed before deduplication, so that duplicates are
+        found on the same record key as the merge into the target table.
+        """
+        with metrics.stage("assign_record_keys", rows_in=len(df_weather_combine)) as stage:
+            df_weather_combine = assign_record_keys(df_weather_combine, station_dictionary)
+            stage["rows_out"] = len(df_weather_combine)
+        ### Deduplicate records
+        with metrics.stage("dedup_weather", rows_in=len(df_weather_combine)) as stage:
+            df_weather_combine_dedup = dedup_weather(df_weather_combine, wrong_state_index)
+            stage["rows_out"] = len(df_weather_combine_dedup)
+        ### Validate records
+        with metrics.stage("validate_weather", rows_in=len(df_weather_combine_dedup)) as stage:
+            df_weather_combine_valid = validate_weather(df_weather_combine_dedup, weather_validation_rules)
+            stage["rows_out"] = len(df_weather_combine_valid)
+        ### Write partitioned Parquet files and copy into object storage
+        """Parquet files are partitioned by year and state, and kept
+        in the object storage to replay or benchmark loads.
+        """
+        with tempfile.TemporaryDirectory() as output_dir:
+            with metrics.stage("write_parquet", rows_in=len(df_weather_combine_valid)) as stage:
+                file_paths = write_parquet_partitions(
+                    df_weather_combine_valid,
+                    output_dir,
+                    latest_file_name[:-4],
+                    parquet_row_group_size
+                )
+                parquet_bytes = sum(
+                    os.path.getsize(os.path.join(output_dir, file_path))
+                    for file_path in file_paths
+                )
+                stage["bytes_out"] = parquet_bytes
+            with metrics.stage("upload_parquet", bytes_in=parquet_bytes):
+                upload_parquet_partitions(
+                    s3,
+                    bucket_name,
+                    parquet_prefix + latest_file_name[:-4] + "/",
+                    output_dir,
+                    file_paths
+                )
+            ### Bulk load Parquet files into temp weather table
+            with metrics.stage(
+                "bulk_load_weather",
+                rows_in=len(df_weather_combine_valid),
+                bytes_in=parquet_bytes
+            ):
+                warehouse.bulk_load_parquet(table_temp_weather, output_dir, file_paths)
+        ### Merge from temp weather table to target weather table
+        """The merge is limited to the date range of the loaded records
+        so that only the relevant micro-partitions of the target are scanned.
+        """
+        date_start = df_weather_combine_valid["DATE"].min()
+        date_end = df_weather_combine_valid["DATE"].max()
+        with metrics.stage("merge_weather", rows_in=len(df_weather_combine_valid)):
+            warehouse.merge_insert(
+                table_tgt_weather,
+                table_temp_weather,
+                "TARGET.RECORD_KEY = SOURCE.RECORD_KEY "
+                f"AND TARGET.DATE BETWEEN '{date_start}' AND '{date_end}'",
+                weather_columns
+            )
+
+    LoggingMixin().log.info("Datasets have been loaded to warehouse")
+
+
+def main():
+    LoggingMixin().log.info(f"Process has started in {stage_mode} mode")
+
+    # Retrieve latest compressed file
+    LoggingMixin().log.info("Retrieving latest compressed file...")
+    latest_file_name = find_latest_file(s3, bucket_name, landing_record_name, file_prefix)
+    manifest_name = manifest_prefix + latest_file_name[:-4] + ".json"
+    shard_prefix = shard_output_prefix + latest_file_name[:-4] + "/"
+    shard_archive_prefix = shard_prefix + "archives/"
+
+    # Split compressed file into tar files of shards to fan out staging
+    """The compressed file is downloaded and decompressed once, and each
+    shard task reads only the tar file of its shard.
+    """
+    if stage_mode == "list-shards":
+        with metrics.stage("split_shards") as stage:
+            latest_file, tar_mode = open_latest_file(latest_file_name)
+            with tempfile.TemporaryDirectory() as output_dir:
+                with tarfile.open(fileobj=latest_file, mode=tar_mode) as tar_file:
+                    shard_file_paths = split_archive_shards(tar_file, output_dir)
+                latest_file.close()
+                for (shard, file_path) in shard_file_paths.items():
+                    s3.upload_file(file_path, bucket_name, shard_archive_prefix + shard + ".tar")
+                stage["bytes_out"] = sum(os.path.getsize(file_path) for file_path in shard_file_paths.values())
+            shards = list(shard_file_paths)
+            stage["rows_out"] = len(shards)
+        LoggingMixin().log.info(f"{len(shards)} shards have been found and split")
+        LoggingMixin().log.info("Process has completed")
+        return shards
+
+    # Pre-process weather and station datasets of a shard
+    """Shard output is saved into the object storage, and the reduce step
+    loads outputs of all shards into the warehouse.
+    """
+    if stage_mode == "shard":
+        df_weather_li, df_station, manifest = pre_process_latest_file(
+            shard_archive_prefix + stage_shard + ".tar",
+            [stage_shard]
+        )
+        with metrics.stage("save_shard_output", rows_in=sum(len(df) for df in df_weather_li)):
+            save_shard_output(
+                s3,
+                bucket_name,
+                shard_prefix + stage_shard + "/",
+                df_weather_li,
+                df_station,
+                manifest
+            )
+        LoggingMixin().log.info(f"Output of shard {stage_shard} has been saved")
+        LoggingMixin().log.info("Process has completed")
+        return None
+
+    # Pre-process weather and station datasets, or gather them from shard outputs
+    """In reduce mode, cross-state deduplication and the single load
+    are applied to the combined outputs of all shards.
+    """
+    if stage_mode == "reduce":
+        with metrics.stage("load_shard_outputs") as stage:
+            df_weather_li, df_station, manifest = load_shard_outputs(s3, bucket_name, shard_prefix)
+            stage["rows_out"] = sum(len(df) for df in df_weather_li)
+        LoggingMixin().log.info(f"{len(df_weather_li)} shard outputs of weather datasets have been gathered")
+    else:
+        df_weather_li, df_station, manifest = pre_process_latest_file(latest_file_name)
+
+    # Load pre-processed datasets into warehouse staging schema
+    load_datasets(latest_file_name, df_weather_li, df_station)
+
+    # Save manifest of compressed file for next delta staging
+    """The manifest is saved only after the datasets are loaded, so that
+    a failed run is fully re-processed in the next run.
+    """
+    save_manifest(s3, bucket_name, manifest_name, latest_file_name, manifest)
+    LoggingMixin().log.info(f"Manifest {manifest_name} has been saved")
+    if stage_mode == "reduce":
+        delete_objects(s3, bucket_name, shard_prefix)
 
     LoggingMixin().log.info("Process has completed")
+    return None
 
 
 if __name__ == "__main__":
@@ -394,6 +1423,9 @@ if __name__ == "__main__":
     minio_access_key = os.environ["MINIO_ACCESS_KEY"]
     minio_secret_key = os.environ["MINIO_SECRET_KEY"]
     bucket_name = "bom-landing"
+    landing_record_name = "latest/IDCKWCDEA0.json"
+    file_prefix = "IDCKWCDEA0_"
+    ingest_mode = os.environ.get("STAGE_INGEST_MODE", "stream")  # stream or buffer
     s3 = boto3.client(
         "s3",
         endpoint_url=minio_endpoint,
@@ -401,22 +1433,58 @@ if __name__ == "__main__":
         aws_secret_access_key=minio_secret_key
     )
 
-    # Define Snowflake connection
-    snowflake_user = os.environ["SNOWFLAKE_USER"]
-    snowflake_pwd = os.environ["SNOWFLAKE_PWD"]
-    snowflake_acct = os.environ["SNOWFLAKE_ACCT"]
-    snowflake_wh = "COMPUTE_WH"
-    snowflake_db = "WEATHER_ANALYSIS"
-    snowflake_schema = "STAGING"
-    conn = snowflake.connector.connect(
-        user=snowflake_user,
-        password=snowflake_pwd,
-        account=snowflake_acct,
-        warehouse=snowflake_wh,
-        database=snowflake_db,
-        schema=snowflake_schema
-    )
-    cur = conn.cursor()
+    # Define delta staging
+    """Manifests of member name, size and content hash are kept for each
+    staged compressed file. When delta staging is on, only members that are
+    new or changed since the latest manifest are pre-processed and loaded.
+    """
+    manifest_prefix = "manifests/"
+    stage_delta_only = os.environ.get("STAGE_DELTA_ONLY", "true").lower() == "true"
+
+    # Define Parquet output
+    """Pre-processed weather dataset is written as Parquet files partitioned
+    by year and state, copied into the object storage under the prefix
+    and bulk loaded into the warehouse.
+    """
+    parquet_prefix = "staged/"
+    parquet_row_group_size = int(os.environ.get("STAGE_PARQUET_ROW_GROUP_SIZE", 1000000))
+
+    # Define pre-processing parallelism
+    """Worker processes pre-process datasets in parallel. In-flight bytes
+    limit the raw bytes handed to the workers at a time to bound memory.
+    """
+    stage_max_workers = int(os.environ.get("STAGE_MAX_WORKERS", os.cpu_count()))
+    stage_max_inflight_bytes = int(os.environ.get("STAGE_MAX_INFLIGHT_BYTES", 256 * 1024**2))
+
+    # Define stage mode
+    """
+    In full mode, all shards are pre-processed and loaded in this process.
+    To fan out staging across workers, shards (state directories and the
+    station dataset) are listed and split into tar files of shards in
+    list-shards mode, each shard is pre-processed in shard mode, and the outputs of all shards are
+    deduplicated and loaded in reduce mode.
+
+    E.g., $python stage_data.py [full | list-shards | shard <shard> | reduce]
+    """
+    stage_mode = sys.argv[1] if len(sys.argv) > 1 else "full"
+    stage_shard = sys.argv[2] if stage_mode == "shard" else None
+    shard_output_prefix = "shards/"
+
+    # Define performance metrics of stages
+    """Metrics are emitted as configured in metrics.py, and a summary is
+    printed as the last line of output to be pushed to XCom, except in
+    list-shards mode where the last line is the list of shards.
+    """
+    metrics = RunMetrics("stage_data", {"mode": stage_mode, "shard": stage_shard})
+
+    # Define warehouse connection
+    """Warehouse backend is either Snowflake or local DuckDB (for offline runs).
+    Warehouse is only connected in modes that load datasets.
+    """
+    warehouse_backend = os.environ.get("WAREHOUSE_BACKEND", "snowflake")
+    warehouse = None
+    if stage_mode in ("full", "reduce"):
+        warehouse = connect_warehouse(warehouse_backend, "WEATHER_ANALYSIS", "STAGING")
 
     # Define weather stations and their wrong station locations
     """ This list contains pairs of stations and their wrong station locations
@@ -433,71 +1501,102 @@ if __name__ == "__main__":
         ("FORREST",	"SA"),
         ("WANGARATTA AERO","WA")
     ]
+    wrong_state_index = build_wrong_state_index(station_wrong_state)
+
+    # Define weather validation rules
+    """ This list contains rules of (column, operator, bound) that valid weather
+    records satisfy. Bound is either a number or another column to compare with.
+    These are compiled into a single mask to remove faulty weather records.
+    """
+    weather_validation_rules = [
+        ("EVAPO_TRANSPIRATION", ">=", 0),
+        ("RAIN", ">=", 0),
+        ("PAN_EVAPORATION", ">=", 0),
+        ("MAXIMUM_TEMPERATURE", ">=", "MINIMUM_TEMPERATURE"),
+        ("MAXIMUM_RELATIVE_HUMIDITY", ">=", 0),
+        ("MINIMUM_RELATIVE_HUMIDITY", ">=", 0),
+        ("AVERAGE_10M_WIND_SPEED", ">=", 0),
+        ("SOLAR_RADIATION", ">=", 0)
+    ]
 
-    # Define Snowflake tables
+    # Define warehouse tables and their columns to merge
     ## Weather dataset
     table_tgt_weather = "WEATHER_PREPROCESSED"
     table_temp_weather = "WEATHER_PREPROCESSED_TEMP"
+    weather_columns = [
+        "STATION_NAME",
+        "DATE",
+        "EVAPO_TRANSPIRATION",
+        "RAIN",
+        "PAN_EVAPORATION",
+        "MAXIMUM_TEMPERATURE",
+        "MINIMUM_TEMPERATURE",
+        "MAXIMUM_RELATIVE_HUMIDITY",
+        "MINIMUM_RELATIVE_HUMIDITY",
+        "AVERAGE_10M_WIND_SPEED",
+        "SOLAR_RADIATION",
+        "STATE",
+        "LOAD_DATE",
+        "STATION_KEY",
+        "RECORD_KEY"
+    ]
     ## Station dataset
     table_tgt_station = "STATION_PREPROCESSED"
     table_temp_station = "STATION_PREPROCESSED_TEMP"
+    station_columns = [
+        "STATION_ID",
+        "STATE",
+        "DISTRICT_CODE",
+        "STATION_NAME",
+        "STATION_SINCE",
+        "LATITUDE",
+        "LONGITUDE",
+        "LOAD_DATE"
+    ]
+    ## Station dictionary
+    table_station_dictionary = "STATION_DICTIONARY"
 
-    # Define Snowflake queries
-    query_create_temp_table = """
-        CREATE TEMPORARY TABLE {} LIKE {};
+    # Define warehouse queries
+    """Column types are portable between Snowflake and DuckDB
+    (DOUBLE and BIGINT are synonyms of FLOAT and NUMBER(38,0) in Snowflake).
     """
     ## Weather dataset
     query_create_tgt_weather = f"""
         CREATE TABLE IF NOT EXISTS {table_tgt_weather} (
             STATION_NAME VARCHAR(100),
             DATE DATE,
-            EVAPO_TRANSPIRATION FLOAT,
-            RAIN FLOAT,
-            PAN_EVAPORATION FLOAT,
-            MAXIMUM_TEMPERATURE FLOAT,
-            MINIMUM_TEMPERATURE FLOAT,
-            MAXIMUM_RELATIVE_HUMIDITY FLOAT,
-            MINIMUM_RELATIVE_HUMIDITY FLOAT,
-            AVERAGE_10M_WIND_SPEED FLOAT,
-            SOLAR_RADIATION FLOAT,
+            EVAPO_TRANSPIRATION DOUBLE,
+            RAIN DOUBLE,
+            PAN_EVAPORATION DOUBLE,
+            MAXIMUM_TEMPERATURE DOUBLE,
+            MINIMUM_TEMPERATURE DOUBLE,
+            MAXIMUM_RELATIVE_HUMIDITY DOUBLE,
+            MINIMUM_RELATIVE_HUMIDITY DOUBLE,
+            AVERAGE_10M_WIND_SPEED DOUBLE,
+            SOLAR_RADIATION DOUBLE,
             STATE VARCHAR(100),
-            LOAD_DATE DATE
+            LOAD_DATE DATE,
+            STATION_KEY BIGINT,
+            RECORD_KEY BIGINT
         );
     """
-    query_merge_weather = f"""
-        MERGE INTO {table_tgt_weather} AS TARGET 
-        USING {table_temp_weather} AS SOURCE
-            ON TARGET.STATION_NAME = SOURCE.STATION_NAME
-                AND TARGET.DATE = SOURCE.DATE
-            WHEN NOT MATCHED THEN INSERT (
-                STATION_NAME,
-                DATE,
-                EVAPO_TRANSPIRATION,
-                RAIN,
-                PAN_EVAPORATION,
-                MAXIMUM_TEMPERATURE,
-                MINIMUM_TEMPERATURE,
-                MAXIMUM_RELATIVE_HUMIDITY,
-                MINIMUM_RELATIVE_HUMIDITY,
-                AVERAGE_10M_WIND_SPEED,
-                SOLAR_RADIATION,
-                STATE,
-                LOAD_DATE
-            ) VALUES (
-                SOURCE.STATION_NAME,
-                SOURCE.DATE,
-                SOURCE.EVAPO_TRANSPIRATION,
-                SOURCE.RAIN,
-                SOURCE.PAN_EVAPORATION,
-                SOURCE.MAXIMUM_TEMPERATURE,
-                SOURCE.MINIMUM_TEMPERATURE,
-                SOURCE.MAXIMUM_RELATIVE_HUMIDITY,
-                SOURCE.MINIMUM_RELATIVE_HUMIDITY,
-                SOURCE.AVERAGE_10M_WIND_SPEED,
-                SOURCE.SOLAR_RADIATION,
-                SOURCE.STATE,
-                SOURCE.LOAD_DATE
-            );
+    query_add_keys_weather = [
+        f"ALTER TABLE {table_tgt_weather} ADD COLUMN IF NOT EXISTS STATION_KEY BIGINT;",
+        f"ALTER TABLE {table_tgt_weather} ADD COLUMN IF NOT EXISTS RECORD_KEY BIGINT;"
+    ]
+    query_backfill_keys_weather = f"""
+        UPDATE {table_tgt_weather} AS TARGET
+        SET STATION_KEY = DICTIONARY.STATION_KEY,
+            RECORD_KEY = DICTIONARY.STATION_KEY * 100000
+                + {{date_ordinal}}
+        FROM {table_station_dictionary} AS DICTIONARY
+        WHERE TARGET.STATION_NAME = DICTIONARY.STATION_NAME
+            AND TARGET.RECORD_KEY IS NULL;
+    """
+    query_fetch_unkeyed_station_names = f"""
+        SELECT DISTINCT STATION_NAME
+        FROM {table_tgt_weather}
+        WHERE RECORD_KEY IS NULL;
     """
     ## Station dataset
     query_create_tgt_station = f"""
@@ -507,41 +1606,40 @@ if __name__ == "__main__":
             DISTRICT_CODE VARCHAR(5),
             STATION_NAME VARCHAR(40),
             STATION_SINCE DATE,
-            LATITUDE FLOAT,
-            LONGITUDE FLOAT,
+            LATITUDE DOUBLE,
+            LONGITUDE DOUBLE,
             LOAD_DATE DATE
         );
     """
-    query_merge_station = f"""
-        MERGE INTO {table_tgt_station} AS TARGET 
-        USING {table_temp_station} AS SOURCE
-            ON TARGET.STATION_ID = SOURCE.STATION_ID
-            WHEN NOT MATCHED THEN INSERT (
-                STATION_ID,
-                STATE,
-                DISTRICT_CODE,
-                STATION_NAME,
-                STATION_SINCE,
-                LATITUDE,
-                LONGITUDE,
-                LOAD_DATE
-            ) VALUES (
-                SOURCE.STATION_ID,
-                SOURCE.STATE,
-                SOURCE.DISTRICT_CODE,
-                SOURCE.STATION_NAME,
-                SOURCE.STATION_SINCE,
-                SOURCE.LATITUDE,
-                SOURCE.LONGITUDE,
-                SOURCE.LOAD_DATE
-            );
+    ## Station dictionary
+    query_create_station_dictionary = f"""
+        CREATE TABLE IF NOT EXISTS {table_station_dictionary} (
+            STATION_NAME VARCHAR(100),
+            STATION_KEY BIGINT
+        );
+    """
+    query_fetch_station_dictionary = f"""
+        SELECT STATION_NAME, STATION_KEY
+        FROM {table_station_dictionary};
+    """
+    query_fetch_station_ids = f"""
+        SELECT STATION_NAME, MIN(STATION_ID)
+        FROM {table_tgt_station}
+        GROUP BY STATION_NAME;
     """
-
     try:
         # Start process
-        main()
+        shards = main()
     finally:
-        # Close cursor and connections
-        cur.close()
-        conn.close()
+        # Close connections
+        if warehouse is not None:
+            warehouse.close()
         s3.close()
+        # Emit performance metrics
+        metrics.emit()
+
+    # Print shards or metrics summary as the last line of output to be pushed to XCom
+    if stage_mode == "list-shards":
+        print(json.dumps(shards))
+    else:
+        print(json.dumps(metrics.summary()))
@@ -0,0 +1,410 @@
+###############################################################################
+# Name: warehouse.py
+# Description: This script defines the warehouse backends shared by the
+#              pipeline scripts. Snowflake is the production warehouse, and
+#              the embedded DuckDB engine allows the staging, partition and
+#              reconciliation processes to run and be profiled offline.
+#              Backend-specific SQL (DDL, bulk load, merge, asynchronous
+#              queries and count/hash queries) is kept in this script.
+# Author: Travis Hong
+# Repository: https://github.com/TravisH0301/weather_analysis
+###############################################################################
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pyarrow as pa
+import duckdb
+import snowflake.connector
+from snowflake.connector.pandas_tools import write_pandas
+
+
+class SnowflakeWarehouse:
+    """
+    This class runs queries and loads datasets on Snowflake.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.cur = conn.cursor()
+
+    def execute(self, query):
+        """
+        This method runs a query.
+        """
+        self.cur.execute(query)
+
+    def fetchall(self, query):
+        """
+        This method runs a query and returns all rows of its result.
+        """
+        self.cur.execute(query)
+        return self.cur.fetchall()
+
+    def fetch_arrow(self, query):
+        """
+        This method runs a query and returns its result as an Arrow table.
+        """
+        self.cur.execute(query)
+        table = self.cur.fetch_arrow_all()
+        if table is None:
+            table = pa.table({col[0]: [] for col in self.cur.description})
+        return table
+
+    def execute_concurrently(self, queries, poll_interval=0.5):
+        """
+        This method submits queries asynchronously so that Snowflake runs
+        them concurrently, and fetches their results once all have completed.
+
+        Parameters
+        ----------
+        queries: list
+            List of queries.
+        poll_interval: float
+            Seconds between query status checks.
+
+        Returns
+        -------
+        list
+            List of query results in the order of the given queries.
+        """
+        query_ids = []
+        for query in queries:
+            self.cur.execute_async(query)
+            query_ids.append(self.cur.sfqid)
+
+        results = []
+        for query_id in query_ids:
+            while self.conn.is_still_running(self.conn.get_query_status_throw_if_error(query_id)):
+                time.sleep(poll_interval)
+            self.cur.get_results_from_sfqid(query_id)
+            results.append(self.cur.fetchall())
+        return results
+
+    def insert_rows(self, table, columns, rows):
+        """
+        This method inserts rows of the given columns into the table.
+        """
+        self.cur.executemany(
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})",
+            rows
+        )
+
+    def create_temp_table_like(self, table, source_table):
+        """
+        This method creates a temporary table with the columns of the source table.
+        """
+        self.cur.execute(f"CREATE TEMPORARY TABLE {table} LIKE {source_table}")
+
+    def write_pandas(self, df, table):
+        """
+        This method loads a dataframe into the table.
+        """
+        write_pandas(self.conn, df, table)
+
+    def bulk_load_parquet(self, table, output_dir, file_paths):
+        """
+        This method bulk loads Parquet files into the table by uploading
+        them into a temporary stage with a single wildcard `PUT` and copying
+        them with a single `COPY INTO`. The output directory is expected
+        to hold only the given files in the hive layout of year and state,
+        with file names unique across partitions.
+
+        Parameters
+        ----------
+        table: str
+            Name of target table.
+        output_dir: str
+            Local directory of Parquet files.
+        file_paths: list
+            Paths of Parquet files relative to the output directory.
+        """
+        stage = f"{table}_STAGE"
+        self.cur.execute(f"""
+            CREATE TEMPORARY STAGE IF NOT EXISTS {stage}
+                FILE_FORMAT = (TYPE = PARQUET);
+        """)
+        self.cur.execute(f"""
+            PUT 'file://{os.path.join(output_dir, "*", "*", "*.parquet")}' '@{stage}'
+                AUTO_COMPRESS = FALSE
+                OVERWRITE = TRUE;
+        """)
+        self.cur.execute(f"""
+            COPY INTO {table}
+            FROM '@{stage}'
+                PATTERN = '.*[.]parquet'
+                FILE_FORMAT = (TYPE = PARQUET)
+                MATCH_BY_COLUMN_NAME = CASE_INSENSITIVE
+                PURGE = TRUE;
+        """)
+
+    def merge_insert(self, target_table, source_table, on, columns):
+        """
+        This method inserts the records of the source table that are not
+        matched in the target table with a merge statement.
+
+        Parameters
+        ----------
+        target_table: str
+            Name of target table, aliased as TARGET.
+        source_table: str
+            Name of source table, aliased as SOURCE.
+        on: str
+            Match condition between TARGET and SOURCE.
+        columns: list
+            Columns to insert.
+        """
+        self.cur.execute(f"""
+            MERGE INTO {target_table} AS TARGET
+            USING {source_table} AS SOURCE
+                ON {on}
+                WHEN NOT MATCHED THEN INSERT (
+                    {', '.join(columns)}
+                ) VALUES (
+                    {', '.join('SOURCE.' + col for col in columns)}
+                );
+        """)
+
+    def hash_agg(self, columns):
+        """
+        This method returns an order-independent aggregate hash expression.
+        """
+        return f"HASH_AGG({', '.join(columns)})"
+
+    def date_ordinal(self, column):
+        """
+        This method returns an expression of days since 1970-01-01.
+        """
+        return f"DATEDIFF(DAY, '1970-01-01'::DATE, {column})"
+
+    def cluster_by(self, columns):
+        """
+        This method returns a clustering clause of table DDL.
+        """
+        return f"CLUSTER BY ({', '.join(columns)})"
+
+    def fetch_row_counts(self, schemas):
+        """
+        This method fetches the row count of each table in the schemas
+        from table metadata without scanning the tables.
+
+        Returns
+        -------
+        dict
+            Row count by (schema, table). None when not available in metadata.
+        """
+        self.cur.execute(f"""
+            SELECT TABLE_SCHEMA, TABLE_NAME, ROW_COUNT
+            FROM INFORMATION_SCHEMA.TABLES
+            WHERE TABLE_SCHEMA IN ({', '.join(f"'{schema}'" for schema in schemas)})
+        """)
+        return {(schema, table): row_count for (schema, table, row_count) in self.cur.fetchall()}
+
+    def close(self):
+        self.cur.close()
+        self.conn.close()
+
+
+class DuckDBWarehouse:
+    """
+    This class runs queries and loads datasets on the embedded DuckDB engine
+    as a local stand-in for Snowflake.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, query):
+        """
+        This method runs a query.
+        """
+        self.conn.execute(query)
+
+    def fetchall(self, query):
+        """
+        This method runs a query and returns all rows of its result.
+        """
+        return self.conn.execute(query).fetchall()
+
+    def fetch_arrow(self, query):
+        """
+        This method runs a query and returns its result as an Arrow table.
+        """
+        table = self.conn.execute(query).arrow()
+        if isinstance(table, pa.RecordBatchReader):
+            table = table.read_all()
+        return table
+
+    def execute_concurrently(self, queries, max_workers=8):
+        """
+        This method runs queries in threads, each with its own cursor,
+        and returns their results.
+
+        Parameters
+        ----------
+        queries: list
+            List of queries.
+        max_workers: int
+            Number of threads.
+
+        Returns
+        -------
+        list
+            List of query results in the order of the given queries.
+        """
+        def run_query(query):
+            cur = self.conn.cursor()
+            try:
+                return cur.execute(query).fetchall()
+            finally:
+                cur.close()
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(run_query, queries))
+
+    def insert_rows(self, table, columns, rows):
+        """
+        This method inserts rows of the given columns into the table.
+        """
+        self.conn.executemany(
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['?'] * len(columns))})",
+            rows
+        )
+
+    def create_temp_table_like(self, table, source_table):
+        """
+        This method creates a temporary table with the columns of the source table.
+        """
+        self.conn.execute(f"CREATE TEMPORARY TABLE {table} AS SELECT * FROM {source_table} LIMIT 0")
+
+    def write_pandas(self, df, table):
+        """
+        This method loads a dataframe into the table.
+        """
+        self.conn.register("write_pandas_df", df)
+        try:
+            self.conn.execute(f"INSERT INTO {table} BY NAME SELECT * FROM write_pandas_df")
+        finally:
+            self.conn.unregister("write_pandas_df")
+
+    def bulk_load_parquet(self, table, output_dir, file_paths):
+        """
+        This method bulk loads Parquet files into the table
+        by reading them in place. Hive partition columns in the paths
+        are not read, as the columns are kept in the files.
+
+        Parameters
+        ----------
+        table: str
+            Name of target table.
+        output_dir: str
+            Local directory of Parquet files.
+        file_paths: list
+            Paths of Parquet files relative to the output directory.
+        """
+        file_paths_str = ", ".join(f"'{os.path.join(output_dir, file_path)}'" for file_path in file_paths)
+        self.conn.execute(f"INSERT INTO {table} BY NAME SELECT * FROM read_parquet([{file_paths_str}], hive_partitioning = false)")
+
+    def merge_insert(self, target_table, source_table, on, columns):
+        """
+        This method inserts the records of the source table that are not
+        matched in the target table with an anti-join.
+
+        Parameters
+        ----------
+        target_table: str
+            Name of target table, aliased as TARGET.
+        source_table: str
+            Name of source table, aliased as SOURCE.
+        on: str
+            Match condition between TARGET and SOURCE.
+        columns: list
+            Columns to insert.
+        """
+        self.conn.execute(f"""
+            INSERT INTO {target_table} ({', '.join(columns)})
+            SELECT {', '.join('SOURCE.' + col for col in columns)}
+            FROM {source_table} AS SOURCE
+            WHERE NOT EXISTS (
+                SELECT 1 FROM {target_table} AS TARGET WHERE {on}
+            )
+        """)
+
+    def hash_agg(self, columns):
+        """
+        This method returns an order-independent aggregate hash expression.
+        """
+        return f"SUM(HASH({', '.join(columns)}))"
+
+    def date_ordinal(self, column):
+        """
+        This method returns an expression of days since 1970-01-01.
+        """
+        return f"({column} - DATE '1970-01-01')"
+
+    def cluster_by(self, columns):
+        """
+        This method returns a clustering clause of table DDL, which
+        DuckDB does not have.
+        """
+        return ""
+
+    def fetch_row_counts(self, schemas):
+        """
+        This method lists the tables in the schemas. Row counts are
+        not available in DuckDB table metadata.
+
+        Returns
+        -------
+        dict
+            None by (schema, table).
+        """
+        rows = self.conn.execute(f"""
+            SELECT UPPER(schema_name), UPPER(table_name)
+            FROM duckdb_tables()
+            WHERE UPPER(schema_name) IN ({', '.join(f"'{schema.upper()}'" for schema in schemas)})
+        """).fetchall()
+        return {(schema, table): None for (schema, table) in rows}
+
+    def close(self):
+        self.conn.close()
+
+
+def connect_warehouse(backend, database, schema=None):
+    """
+    This function connects to the warehouse backend.
+
+    Snowflake is connected with credentials from environment variables.
+    DuckDB is connected to the database file given by the environment
+    variable DUCKDB_PATH, and the schema is created if not existing.
+
+    Parameters
+    ----------
+    backend: str
+        Warehouse backend of either "snowflake" or "duckdb".
+    database: str
+        Name of database.
+    schema: str
+        Name of default schema. None for no default schema.
+
+    Returns
+    -------
+    SnowflakeWarehouse/DuckDBWarehouse
+        Warehouse.
+    """
+    if backend == "duckdb":
+        conn = duckdb.connect(os.environ.get("DUCKDB_PATH", f"/opt/airflow/data/{database.lower()}.duckdb"))
+        if schema is not None:
+            conn.execute(f"CREATE SCHEMA IF NOT EXISTS {schema}")
+            conn.execute(f"USE {schema}")
+        return DuckDBWarehouse(conn)
+
+    conn = snowflake.connector.connect(
+        user=os.environ["SNOWFLAKE_USER"],
+        password=os.environ["SNOWFLAKE_PWD"],
+        account=os.environ["SNOWFLAKE_ACCT"],
+        warehouse="COMPUTE_WH",
+        database=database,
+        schema=schema
+    )
+    return SnowflakeWarehouse(conn)
@@ -0,0 +1,226 @@
+###############################################################################
+# Name: weather_query.py
+# Description: This script provides a partition-aware query of weather
+#              measurements over a date range. Year partitions overlapping
+#              the date range are found from the partition registry, and
+#              combined with `UNION ALL` with predicates pushed down to each
+#              year partition, so that consumers do not need to know the
+#              year partition naming.
+#              E.g., $python weather_query.py RAIN 2019-03-01 2021-06-30
+# Author: Travis Hong
+# Repository: https://github.com/TravisH0301/weather_analysis
+###############################################################################
+import os
+import sys
+from datetime import date
+
+from warehouse import connect_warehouse
+
+
+# Define weather schemas and their measurement columns
+"""
+E.g., { Weather schema: [ Measurement columns of year partition tables ] }
+"""
+weather_schema_columns = {
+    "EVAPO_TRANSPIRATION": ["EVAPO_TRANSPIRATION"],
+    "RAIN": ["RAIN"],
+    "PAN_EVAPORATION": ["PAN_EVAPORATION"],
+    "TEMPERATURE": [
+        "MAXIMUM_TEMPERATURE",
+        "MINIMUM_TEMPERATURE",
+        "VARIANCE_TEMPERATURE"
+    ],
+    "RELATIVE_HUMIDITY": [
+        "MAXIMUM_RELATIVE_HUMIDITY",
+        "MINIMUM_RELATIVE_HUMIDITY"
+    ],
+    "WIND_SPEED": ["AVERAGE_10M_WIND_SPEED"],
+    "SOLAR_RADIATION": ["SOLAR_RADIATION"]
+}
+
+
+def quote_literal(value):
+    """
+    This function quotes the value as a SQL string literal.
+
+    Parameters
+    ----------
+    value: object
+        Value to be quoted.
+
+    Returns
+    -------
+    str
+        SQL string literal.
+    """
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def fetch_partition_years(warehouse, measurements, start, end):
+    """
+    This function fetches the years of the registered year partitions
+    of the given weather schemas that overlap the date range.
+
+    Parameters
+    ----------
+    warehouse: SnowflakeWarehouse/DuckDBWarehouse
+        Warehouse. Refer to warehouse.py.
+    measurements: list
+        List of weather schemas.
+    start: datetime.date
+        Start date of the date range.
+    end: datetime.date
+        End date of the date range.
+
+    Returns
+    -------
+    dict
+        Years of year partitions by weather schema.
+    """
+    rows = warehouse.fetchall(f"""
+        SELECT SCHEMA_NAME, YEAR
+        FROM STAGING.WEATHER_PARTITION_REGISTRY
+        WHERE SCHEMA_NAME IN ({', '.join(quote_literal(schema) for schema in measurements)})
+            AND YEAR BETWEEN {start.year} AND {end.year}
+    """)
+    partition_years = {schema: [] for schema in measurements}
+    for (schema, year) in rows:
+        partition_years[schema].append(int(year))
+    return {schema: sorted(years) for (schema, years) in partition_years.items()}
+
+
+def render_query(partition_years, start, end, stations=None, states=None):
+    """
+    This function renders a query of weather measurements over the date range.
+
+    The year partitions of each weather schema are combined with `UNION ALL`
+    with the date, station and state predicates pushed down to each year
+    partition. When multiple weather schemas are given, they are joined
+    on the record key to the first weather schema.
+
+    Parameters
+    ----------
+    partition_years: dict
+        Years of year partitions by weather schema.
+        Refer to `fetch_partition_years`.
+    start: datetime.date
+        Start date of the date range.
+    end: datetime.date
+        End date of the date range.
+    stations: list
+        List of station names to filter. None for all stations,
+        and empty for no stations.
+    states: list
+        List of states to filter. None for all states,
+        and empty for no states.
+
+    Returns
+    -------
+    str
+        Query string.
+    """
+    # Render empty filter as false predicate, as `IN ()` is invalid
+    predicate_li = [f"DATE BETWEEN '{start}' AND '{end}'"]
+    if stations is not None:
+        if stations:
+            predicate_li.append(f"STATION_NAME IN ({', '.join(quote_literal(s) for s in stations)})")
+        else:
+            predicate_li.append("FALSE")
+    if states is not None:
+        if states:
+            predicate_li.append(f"STATE IN ({', '.join(quote_literal(s) for s in states)})")
+        else:
+            predicate_li.append("FALSE")
+    predicate_str = " AND ".join(predicate_li)
+
+    cte_str_li = []
+    for (schema, years) in partition_years.items():
+        cols_str = ", ".join(["RECORD_KEY", "STATION_NAME", "DATE", "STATE"] + weather_schema_columns[schema])
+        select_str_li = [
+            f"    SELECT {cols_str} FROM {schema}.{schema}_{year} WHERE {predicate_str}"
+            for year in years
+        ]
+        # Keep the columns of a weather schema without overlapping year partitions
+        if not select_str_li:
+            null_cols_str = ", ".join(
+                ["NULL::BIGINT AS RECORD_KEY", "NULL::VARCHAR AS STATION_NAME", "NULL::DATE AS DATE", "NULL::VARCHAR AS STATE"]
+                + [f"NULL::FLOAT AS {col}" for col in weather_schema_columns[schema]]
+            )
+            select_str_li = [f"    SELECT {null_cols_str} WHERE FALSE"]
+        cte_str_li.append(f"{schema} AS (\n" + "\n    UNION ALL\n".join(select_str_li) + "\n)")
+
+    schemas = list(partition_years)
+    select_cols = [f"{schemas[0]}.{col}" for col in ["STATION_NAME", "DATE", "STATE"]]
+    for schema in schemas:
+        select_cols += [f"{schema}.{col}" for col in weather_schema_columns[schema]]
+    query_str = (
+        "WITH " + ",\n".join(cte_str_li) + "\n"
+        f"SELECT {', '.join(select_cols)}\n"
+        f"FROM {schemas[0]}\n"
+    )
+    for schema in schemas[1:]:
+        query_str += f"LEFT JOIN {schema} ON {schemas[0]}.RECORD_KEY = {schema}.RECORD_KEY\n"
+    query_str += f"ORDER BY {schemas[0]}.STATION_NAME, {schemas[0]}.DATE"
+    return query_str
+
+
+def query(warehouse, measurements, start, end, stations=None, states=None, output="pandas"):
+    """
+    This function queries weather measurements over the date range
+    from the year partitions overlapping the date range.
+
+    Parameters
+    ----------
+    warehouse: SnowflakeWarehouse/DuckDBWarehouse
+        Warehouse. Refer to warehouse.py.
+    measurements: list
+        List of weather schemas. E.g., ["RAIN", "TEMPERATURE"]
+        Duplicate weather schemas are queried once.
+    start: datetime.date/str
+        Start date of the date range.
+    end: datetime.date/str
+        End date of the date range.
+    stations: list
+        List of station names to filter. None for all stations,
+        and empty for no stations.
+    states: list
+        List of states to filter. None for all states,
+        and empty for no states.
+    output: str
+        Output format of either "pandas" or "arrow".
+
+    Returns
+    -------
+    pd.DataFrame/pa.Table
+        Weather measurements by station and date.
+    """
+    if isinstance(start, str):
+        start = date.fromisoformat(start)
+    if isinstance(end, str):
+        end = date.fromisoformat(end)
+    # Deduplicate weather schemas in order, so that each is queried once
+    measurements = list(dict.fromkeys(schema.upper() for schema in measurements))
+    unknown_measurements = set(measurements) - set(weather_schema_columns)
+    if unknown_measurements:
+        raise ValueError(f"Unknown weather schemas: {sorted(unknown_measurements)}")
+
+    partition_years = fetch_partition_years(warehouse, measurements, start, end)
+    table = warehouse.fetch_arrow(render_query(partition_years, start, end, stations, states))
+
+    if output == "arrow":
+        return table
+    return table.to_pandas()
+
+
+if __name__ == "__main__":
+    # Define warehouse connection
+    warehouse_backend = os.environ.get("WAREHOUSE_BACKEND", "snowflake")
+    warehouse = connect_warehouse(warehouse_backend, "WEATHER_ANALYSIS")
+
+    try:
+        # Query weather measurements, e.g., RAIN,TEMPERATURE 2019-03-01 2021-06-30
+        measurements, start, end = sys.argv[1].split(","), sys.argv[2], sys.argv[3]
+        print(query(warehouse, measurements, start, end))
+    finally:
+        # Close connection
+        warehouse.close()
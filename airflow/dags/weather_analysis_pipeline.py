@@ -5,9 +5,11 @@
 # Author: Travis Hong
 # Repository: https://github.com/TravisH0301/weather_analysis
 ###############################################################################
+import json
 from datetime import datetime
 from airflow import DAG
 
+from airflow.decorators import task
 from airflow.operators.bash import BashOperator
 
 from utils.airflow_email import AirflowEmailSender
@@ -43,30 +45,89 @@ with DAG(
 ) as dag:
     
     # Task to retrive BOM dataset and land into object storage
+    """The task is skipped with exit code 99 when the BOM dataset has not
+    changed since the last landing and the last landed file has been staged,
+    which skips the downstream tasks.
+    Tasks running pipeline scripts push a summary of their stage metrics
+    to XCom, unless the last line of output is used otherwise.
+    """
     land_file = BashOperator(
         task_id="land_file",
         bash_command="python /opt/airflow/dags/scripts/land_file.py",
+        skip_on_exit_code=99,
+        do_xcom_push=True,
         dag=dag
     )
 
-    # Task to pre-process and stage weather dataset into Snowflake
+    # Task to list shards of BOM dataset to fan out staging
+    """Shards are state directories and the station dataset in the
+    compressed BOM dataset file. The shards are printed as a JSON list
+    on the last line of output, which is pushed to XCom.
+    """
+    list_stage_shards = BashOperator(
+        task_id="list_stage_shards",
+        bash_command="python /opt/airflow/dags/scripts/stage_data.py list-shards",
+        do_xcom_push=True,
+        dag=dag
+    )
+
+    # Task to render staging command of each shard
+    @task(task_id="make_stage_shard_commands")
+    def make_stage_shard_commands(shards_str):
+        return [
+            f"python /opt/airflow/dags/scripts/stage_data.py shard {shard}"
+            for shard in json.loads(shards_str)
+        ]
+
+    # Tasks to pre-process each shard of weather dataset in parallel
+    """A mapped task instance is expanded per shard, so that shards
+    are pre-processed across the available workers.
+    """
+    stage_data_shard = BashOperator.partial(
+        task_id="stage_data_shard",
+        do_xcom_push=True,
+        dag=dag
+    ).expand(
+        bash_command=make_stage_shard_commands(list_stage_shards.output)
+    )
+
+    # Task to deduplicate and stage weather dataset into Snowflake
+    """Cross-state deduplication and the single load are applied
+    to the outputs of all shards.
+    """
     stage_data = BashOperator(
         task_id="stage_data",
-        bash_command="python /opt/airflow/dags/scripts/stage_data.py",
+        bash_command="python /opt/airflow/dags/scripts/stage_data.py reduce",
+        do_xcom_push=True,
         dag=dag
     )
     
     # Task to generate dbt data model scripts for year partition tables 
+    """The dbt selector of data models affected by the latest staging load
+    is printed on the last line of output, which is pushed to XCom.
+    """
     generate_dbt_model = BashOperator(
         task_id="generate_dbt_model",
         bash_command="python /opt/airflow/dags/scripts/generate_dbt_model.py",
+        do_xcom_push=True,
         dag=dag
     )
 
     # Task to load data into data model incrementally in Snowflake
+    """dbt target artefacts and installed packages are kept between runs
+    to keep dbt partial parsing effective. Packages are only installed
+    when missing or when the package lock file has changed.
+    Only the data models selected by generate_dbt_model are built,
+    and the whole project is built when the selector is empty.
+    """
     incremental_data_load = BashOperator(
         task_id="incremental_data_load",
-        bash_command="cd /opt/airflow/dags/dbt; dbt clean; dbt deps; dbt build",
+        bash_command=(
+            "cd /opt/airflow/dags/dbt; "
+            "if [ ! -d dbt_packages ] || [ package-lock.yml -nt dbt_packages ]; then dbt deps; fi; "
+            "DBT_SELECTOR=\"{{ ti.xcom_pull(task_ids='generate_dbt_model') or '' }}\"; "
+            "dbt build ${DBT_SELECTOR:+--select $DBT_SELECTOR}"
+        ),
         dag=dag
     )
 
@@ -74,6 +135,7 @@ with DAG(
     reconcile_data = BashOperator(
         task_id="reconcile_data",
         bash_command="python /opt/airflow/dags/scripts/reconcile_data.py",
+        do_xcom_push=True,
         dag=dag
     )
 
@@ -81,6 +143,8 @@ with DAG(
     # Define task dependecies
     (
         land_file
+        >> list_stage_shards
+        >> stage_data_shard
         >> stage_data
         >> generate_dbt_model
         >> incremental_data_load
@@ -0,0 +1,112 @@
+###############################################################################
+# Name: benchmark_partition_layout.py
+# Description: This script benchmarks the scan and union cost of the year
+#              table partition layout against the single clustered table
+#              layout of a weather schema, using DuckDB as a local stand-in
+#              for Snowflake.
+#              Run from the repository root:
+#              $python benchmarks/benchmark_partition_layout.py
+# Author: Travis Hong
+# Repository: https://github.com/TravisH0301/weather_analysis
+###############################################################################
+import os
+import timeit
+
+import duckdb
+
+
+def create_layouts(conn, station_count, year_start, year_end):
+    """
+    This function creates a year table per year and a single table
+    ordered by date and station key with the same synthetic rain records.
+    DuckDB prunes row groups of the ordered table with min-max zone maps,
+    as Snowflake prunes micro-partitions of a clustered table.
+    """
+    conn.execute("CREATE SCHEMA RAIN")
+    conn.execute(f"""
+        CREATE TABLE RAIN.RAIN AS
+        WITH DATES AS (
+            SELECT TS::DATE AS DATE
+            FROM range(DATE '{year_start}-01-01', DATE '{year_end + 1}-01-01', INTERVAL 1 DAY) AS d(TS)
+        )
+        SELECT
+            STATION_KEY * 100000 + (DATE - DATE '1970-01-01') AS RECORD_KEY,
+            STATION_KEY,
+            'STATION_' || STATION_KEY AS STATION_NAME,
+            DATE,
+            RANDOM() * 10 AS RAIN,
+            'VIC' AS STATE,
+            DATE AS LOAD_DATE
+        FROM range(0, {station_count}) AS s(STATION_KEY), DATES
+        ORDER BY DATE, STATION_KEY
+    """)
+    for year in range(year_start, year_end + 1):
+        conn.execute(f"""
+            CREATE TABLE RAIN.RAIN_{year} AS
+            SELECT * FROM RAIN.RAIN
+            WHERE DATE BETWEEN '{year}-01-01' AND '{year}-12-31'
+            ORDER BY STATION_KEY
+        """)
+
+
+def make_union_query(years, predicate):
+    """
+    This function returns a query over year tables combined with
+    `UNION ALL` with the predicate pushed down to each year table.
+    """
+    return "\nUNION ALL\n".join(
+        f"SELECT STATION_KEY, DATE, RAIN FROM RAIN.RAIN_{year} WHERE {predicate}"
+        for year in years
+    )
+
+
+def benchmark(conn, query, number):
+    """
+    This function returns the average seconds per run of the given query.
+    """
+    seconds = timeit.timeit(
+        lambda: conn.execute(f"SELECT COUNT(*), AVG(RAIN) FROM ({query})").fetchall(),
+        number=number
+    )
+    return seconds / number
+
+
+if __name__ == "__main__":
+    number = int(os.environ.get("BENCHMARK_NUMBER", 20))
+    station_count = int(os.environ.get("BENCHMARK_STATION_COUNT", 500))
+    year_start, year_end = 2012, 2023
+    years = list(range(year_start, year_end + 1))
+
+    conn = duckdb.connect()
+    create_layouts(conn, station_count, year_start, year_end)
+
+    date_predicate = "DATE BETWEEN '2019-03-01' AND '2021-06-30'"
+    station_predicate = "STATION_KEY = 42"
+    cases = {
+        "date range, all years unioned": (
+            make_union_query(years, date_predicate),
+            f"SELECT STATION_KEY, DATE, RAIN FROM RAIN.RAIN WHERE {date_predicate}"
+        ),
+        "date range, overlapping years unioned": (
+            make_union_query(range(2019, 2022), date_predicate),
+            f"SELECT STATION_KEY, DATE, RAIN FROM RAIN.RAIN WHERE {date_predicate}"
+        ),
+        "single station, all years": (
+            make_union_query(years, station_predicate),
+            f"SELECT STATION_KEY, DATE, RAIN FROM RAIN.RAIN WHERE {station_predicate}"
+        ),
+        "full scan, all years": (
+            make_union_query(years, "TRUE"),
+            "SELECT STATION_KEY, DATE, RAIN FROM RAIN.RAIN"
+        )
+    }
+
+    row_count = conn.execute("SELECT COUNT(*) FROM RAIN.RAIN").fetchone()[0]
+    print(f"{row_count} records, {len(years)} year tables vs 1 clustered table")
+    for (case, (query_year_table, query_clustered)) in cases.items():
+        seconds_year_table = benchmark(conn, query_year_table, number)
+        seconds_clustered = benchmark(conn, query_clustered, number)
+        print(f"{case}:")
+        print(f"    year tables:     {seconds_year_table * 1000:.3f} ms/query")
+        print(f"    clustered table: {seconds_clustered * 1000:.3f} ms/query")
+    conn.close()
@@ -0,0 +1,253 @@
+###############################################################################
+# Name: benchmark_pipeline.py
+# Description: This script benchmarks the throughput and peak memory of the
+#              pre-processing steps and the whole staging path on a synthetic
+#              compressed BOM dataset file, and writes the results as JSON to
+#              be compared between releases.
+#              Run from the repository root:
+#              $python benchmarks/benchmark_pipeline.py
+#              Scale and output are configured with environment variables:
+#              BENCHMARK_STATION_COUNT, BENCHMARK_STATES, BENCHMARK_YEAR_START,
+#              BENCHMARK_YEAR_END, BENCHMARK_NUMBER, BENCHMARK_MAX_WORKERS,
+#              BENCHMARK_OUTPUT and BENCHMARK_BASELINE (JSON of a previous run).
+# Author: Travis Hong
+# Repository: https://github.com/TravisH0301/weather_analysis
+###############################################################################
+import sys
+import os
+import io
+import json
+import time
+import tarfile
+import platform
+import tempfile
+import tracemalloc
+import subprocess
+from datetime import date, datetime
+
+import pandas as pd
+
+# Add Python script to the path
+script_directory = os.path.abspath("./airflow/dags/scripts")
+sys.path.append(script_directory)
+
+from stage_data import (
+    pre_process_csv,
+    pre_process_fwf,
+    process_archive,
+    split_archive_shards,
+    build_wrong_state_index,
+    dedup_weather,
+    validate_weather,
+    build_station_dictionary,
+    assign_record_keys,
+    write_parquet_partitions
+)
+from generate_bom_archive import generate_bom_archive
+
+
+# Define weather validation rules as in stage_data.py
+weather_validation_rules = [
+    ("EVAPO_TRANSPIRATION", ">=", 0),
+    ("RAIN", ">=", 0),
+    ("PAN_EVAPORATION", ">=", 0),
+    ("MAXIMUM_TEMPERATURE", ">=", "MINIMUM_TEMPERATURE"),
+    ("MAXIMUM_RELATIVE_HUMIDITY", ">=", 0),
+    ("MINIMUM_RELATIVE_HUMIDITY", ">=", 0),
+    ("AVERAGE_10M_WIND_SPEED", ">=", 0),
+    ("SOLAR_RADIATION", ">=", 0)
+]
+
+
+def measure(func, number, rows, bytes_count):
+    """
+    This function measures the average wall time of the given function
+    over a number of runs, and its peak traced memory in a separate run
+    so that tracing does not slow down the timed runs.
+
+    Parameters
+    ----------
+    func: function
+        Function to benchmark without arguments.
+    number: int
+        Number of timed runs.
+    rows: int
+        Number of rows handled by a run.
+    bytes_count: int
+        Number of input bytes handled by a run.
+
+    Returns
+    -------
+    dict
+        Benchmark result.
+    """
+    start = time.perf_counter()
+    for _ in range(number):
+        func()
+    seconds = (time.perf_counter() - start) / number
+
+    tracemalloc.start()
+    func()
+    _, peak_memory_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "seconds": seconds,
+        "rows": rows,
+        "rows_per_second": rows / seconds,
+        "bytes": bytes_count,
+        "megabytes_per_second": bytes_count / seconds / 1024**2,
+        "peak_memory_bytes": peak_memory_bytes
+    }
+
+
+def run_staging_path(archive, wrong_state_index, max_workers, output_dir):
+    """
+    This function runs the staging path of stage_data.py up to the
+    Parquet output, without loading into Snowflake.
+    """
+    with tarfile.open(fileobj=io.BytesIO(archive), mode="r:gz") as tar_file:
+        df_weather_li, df_station, _ = process_archive(tar_file, date.today(), max_workers=max_workers)
+    df_weather = pd.concat(df_weather_li, ignore_index=True)
+    station_ids = dict(zip(df_station["STATION_NAME"], df_station["STATION_ID"]))
+    station_dictionary, _ = build_station_dictionary(df_weather["STATION_NAME"].unique(), station_ids, {})
+    df_weather = assign_record_keys(df_weather, station_dictionary)
+    df_weather = dedup_weather(df_weather, wrong_state_index)
+    df_weather = validate_weather(df_weather, weather_validation_rules)
+    return write_parquet_partitions(df_weather, output_dir, "benchmark", 1000000)
+
+
+def run_split_shards(archive, output_dir):
+    """
+    This function runs the split of the compressed file into tar files
+    of shards, which is done once in list-shards mode of stage_data.py
+    in place of a full decompression by every shard task.
+    """
+    with tarfile.open(fileobj=io.BytesIO(archive), mode="r|gz") as tar_file:
+        return split_archive_shards(tar_file, output_dir)
+
+
+def get_git_commit():
+    """
+    This function returns the current git commit. None when unavailable.
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+    # Define scale of synthetic dataset and benchmark
+    scale = {
+        "station_count": int(os.environ.get("BENCHMARK_STATION_COUNT", 20)),
+        "states": os.environ.get("BENCHMARK_STATES", "NSW,NT,QLD,SA,TAS,VIC,WA").split(","),
+        "years": list(range(
+            int(os.environ.get("BENCHMARK_YEAR_START", 2022)),
+            int(os.environ.get("BENCHMARK_YEAR_END", 2023)) + 1
+        ))
+    }
+    number = int(os.environ.get("BENCHMARK_NUMBER", 3))
+    max_workers = int(os.environ.get("BENCHMARK_MAX_WORKERS", 1))
+    output_path = os.environ.get("BENCHMARK_OUTPUT", "benchmark_pipeline.json")
+    baseline_path = os.environ.get("BENCHMARK_BASELINE")
+
+    # Generate synthetic compressed BOM dataset file and its members
+    archive, station_wrong_state = generate_bom_archive(
+        scale["station_count"],
+        scale["states"],
+        scale["years"]
+    )
+    wrong_state_index = build_wrong_state_index(station_wrong_state)
+    csv_members = []
+    with tarfile.open(fileobj=io.BytesIO(archive), mode="r:gz") as tar_file:
+        for member in tar_file:
+            content = tar_file.extractfile(member).read()
+            if member.name.endswith(".csv"):
+                csv_members.append((member.name.split("/")[1].upper(), content))
+            else:
+                station_content = content
+    df_weather = pd.concat(
+        [pre_process_csv(io.BytesIO(content), state, date.today()) for (state, content) in csv_members],
+        ignore_index=True
+    )
+    station_dictionary, _ = build_station_dictionary(df_weather["STATION_NAME"].unique(), {}, {})
+    df_weather = assign_record_keys(df_weather, station_dictionary)
+    df_weather_dedup = dedup_weather(df_weather, wrong_state_index)
+    csv_bytes = sum(len(content) for (_, content) in csv_members)
+
+    # Benchmark pre-processing steps and staging path
+    results = {}
+    results["pre_process_csv"] = measure(
+        lambda: [pre_process_csv(io.BytesIO(content), state, date.today()) for (state, content) in csv_members],
+        number,
+        len(df_weather),
+        csv_bytes
+    )
+    results["pre_process_fwf"] = measure(
+        lambda: pre_process_fwf(io.BytesIO(station_content), date.today()),
+        number,
+        station_content.count(b"\n"),
+        len(station_content)
+    )
+    results["dedup_weather"] = measure(
+        lambda: dedup_weather(df_weather, wrong_state_index),
+        number,
+        len(df_weather),
+        int(df_weather.memory_usage(deep=True).sum())
+    )
+    results["validate_weather"] = measure(
+        lambda: validate_weather(df_weather_dedup, weather_validation_rules),
+        number,
+        len(df_weather_dedup),
+        int(df_weather_dedup.memory_usage(deep=True).sum())
+    )
+    with tempfile.TemporaryDirectory() as output_dir:
+        results["split_shards"] = measure(
+            lambda: run_split_shards(archive, output_dir),
+            number,
+            len(df_weather),
+            len(archive)
+        )
+    with tempfile.TemporaryDirectory() as output_dir:
+        results["staging_path"] = measure(
+            lambda: run_staging_path(archive, wrong_state_index, max_workers, output_dir),
+            number,
+            len(df_weather),
+            len(archive)
+        )
+
+    # Write results
+    report = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "git_commit": get_git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "pandas": pd.__version__,
+        "scale": dict(scale, archive_bytes=len(archive), max_workers=max_workers),
+        "results": results
+    }
+    with open(output_path, "w") as f:
+        json.dump(report, f, indent=2)
+
+    # Print results and comparison with baseline
+    baseline_results = {}
+    if baseline_path:
+        with open(baseline_path, "r") as f:
+            baseline_results = json.load(f)["results"]
+    for (step, result) in results.items():
+        line = (
+            f"{step:<18} {result['seconds'] * 1000:>10.1f} ms "
+            f"{result['rows_per_second']:>12.0f} rows/s "
+            f"{result['megabytes_per_second']:>8.1f} MB/s "
+            f"{result['peak_memory_bytes'] / 1024**2:>8.1f} MB peak"
+        )
+        if step in baseline_results:
+            line += f"  {baseline_results[step]['seconds'] / result['seconds']:.2f}x vs baseline"
+        print(line)
+    print(f"Results have been written to {output_path}")
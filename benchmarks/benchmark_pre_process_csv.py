@@ -0,0 +1,85 @@
+###############################################################################
+# Name: benchmark_pre_process_csv.py
+# Description: This script benchmarks the BOM CSV pre-processing against the
+#              previous python engine parser using the test weather dataset.
+#              Run from the repository root:
+#              $python benchmarks/benchmark_pre_process_csv.py
+# Author: Travis Hong
+# Repository: https://github.com/TravisH0301/weather_analysis
+###############################################################################
+import sys
+import os
+import io
+import timeit
+from datetime import date
+import numpy as np
+import pandas as pd
+
+# Add Python script to the path
+script_directory = os.path.abspath("./airflow/dags/scripts")
+sys.path.append(script_directory)
+
+from stage_data import pre_process_csv
+
+
+def pre_process_csv_python_engine(file_obj, state, date_today):
+    """
+    This function pre-processes CSV file object with the python engine
+    parser, as done before the fast-path parser was introduced.
+    """
+    columns = [
+        "STATION_NAME",
+        "DATE",
+        "EVAPO_TRANSPIRATION",
+        "RAIN",
+        "PAN_EVAPORATION",
+        "MAXIMUM_TEMPERATURE",
+        "MINIMUM_TEMPERATURE",
+        "MAXIMUM_RELATIVE_HUMIDITY",
+        "MINIMUM_RELATIVE_HUMIDITY",
+        "AVERAGE_10M_WIND_SPEED",
+        "SOLAR_RADIATION"
+    ]
+    df = pd.read_csv(
+        file_obj,
+        encoding="ISO-8859-1",
+        engine="python",
+        skiprows=12,
+        skipfooter=1,
+        skip_blank_lines=True
+    )
+    df.columns = columns
+    df = df.replace("", None).replace(" ", None)
+    for float_col in columns[2:]:
+        df[float_col] = df[float_col].astype(np.float64)
+    df["DATE"] = pd.to_datetime(df["DATE"], format="%d/%m/%Y").dt.date
+    df["STATE"] = state
+    df["LOAD_DATE"] = date_today
+
+    return df
+
+
+def benchmark(func, content, number):
+    """
+    This function returns the average seconds per file of the given
+    pre-processing function.
+    """
+    date_today = date.today()
+    seconds = timeit.timeit(
+        lambda: func(io.BytesIO(content), "VIC", date_today),
+        number=number
+    )
+    return seconds / number
+
+
+if __name__ == "__main__":
+    number = int(os.environ.get("BENCHMARK_NUMBER", 200))
+    with open("./tests/test_datasets/melbourne_airport-202310.csv", "rb") as f:
+        content = f.read()
+
+    seconds_python = benchmark(pre_process_csv_python_engine, content, number)
+    seconds_fast = benchmark(pre_process_csv, content, number)
+
+    print(f"python engine: {seconds_python * 1000:.3f} ms/file")
+    print(f"fast-path:     {seconds_fast * 1000:.3f} ms/file")
+    print(f"speedup:       {seconds_python / seconds_fast:.2f}x")
@@ -0,0 +1,227 @@
+###############################################################################
+# Name: generate_bom_archive.py
+# Description: This script generates a synthetic compressed BOM dataset file
+#              following the BOM directory layout and file formats, at a
+#              configurable scale of stations, states and years. Generated
+#              datasets contain cross-state duplicates, bad measurements and
+#              the "Totals:" footer row as in the BOM dataset.
+#              Run from the repository root:
+#              $python benchmarks/generate_bom_archive.py <output .tgz path>
+# Author: Travis Hong
+# Repository: https://github.com/TravisH0301/weather_analysis
+###############################################################################
+import os
+import io
+import sys
+import tarfile
+import calendar
+
+import numpy as np
+
+
+# Define BOM states and their names used in the CSV header block
+state_names = {
+    "NSW": "New South Wales",
+    "NT": "Northern Territory",
+    "QLD": "Queensland",
+    "SA": "South Australia",
+    "TAS": "Tasmania",
+    "VIC": "Victoria",
+    "WA": "Western Australia"
+}
+
+# Define header block of BOM CSV file
+csv_header_str = """IDCKWCDE61,,,,,,,,,,
+Australian Government Bureau of Meteorology,,,,,,,,,,
+{state_name},,,,,,,,,,
+
+Daily Evapotranspiration for {station_name} {state_name} for {month_name} {year},,,,,,,,,,
+Issued at 22:30 GMT on Wednesday 01 November 2023,,,,,,,,,,
+Copyright Commonwealth of Australia 2023 Bureau of Meteorology (ABN 92 637 533 532),,,,,,,,,,
+Please note Copyright Disclaimer and Privacy Notice <http://www.bom.gov.au/other/copyright.shtml>,,,,,,,,,,
+
+,,Evapo-,,Pan,,,Maximum,Minimum,Average,
+,,Transpiration,Rain,Evaporation,Maximum,Minimum,Relative,Relative,10m Wind,Solar
+Station Name,Date,0000-2400,0900-0900,0900-0900,Temperature,Temperature,Humidity,Humidity,Speed,Radiation
+,,(mm),(mm),(mm),(C),(C),(%),(%),(m/sec),(MJ/sq m)
+"""
+
+
+def make_station_name(state, index):
+    """
+    This function returns the synthetic name of a station.
+    """
+    return f"SYNTHETIC {state} STATION {index:04d}"
+
+
+def render_weather_csv(rng, station_name, state, year, month, bad_ratio):
+    """
+    This function renders a monthly BOM CSV file of a station with random
+    daily measurements, where a ratio of days have bad measurements
+    (e.g., negative rain fall or minimum temperature above maximum
+    temperature) and blank measurements.
+
+    Parameters
+    ----------
+    rng: np.random.Generator
+        Random number generator.
+    station_name: str
+        Name of the station.
+    state: str
+        State of the station.
+    year: int
+        Year of the file.
+    month: int
+        Month of the file.
+    bad_ratio: float
+        Ratio of days with bad measurements.
+
+    Returns
+    -------
+    bytes
+        Content of the CSV file.
+    """
+    day_count = calendar.monthrange(year, month)[1]
+    max_temperature = rng.uniform(10, 40, day_count)
+    measurements = np.column_stack([
+        rng.uniform(0, 10, day_count),
+        rng.exponential(2, day_count),
+        rng.uniform(0, 15, day_count),
+        max_temperature,
+        max_temperature - rng.uniform(0, 15, day_count),
+        rng.uniform(50, 100, day_count),
+        rng.uniform(10, 50, day_count),
+        rng.uniform(0, 15, day_count),
+        rng.uniform(0, 30, day_count)
+    ])
+
+    # Add bad measurements on a ratio of days
+    is_bad = rng.random(day_count) < bad_ratio
+    measurements[is_bad, 1] = -measurements[is_bad, 1] - 1
+    measurements[is_bad, 4] = measurements[is_bad, 3] + 1
+
+    lines = [csv_header_str.format(
+        state_name=state_names[state],
+        station_name=station_name,
+        month_name=calendar.month_name[month],
+        year=year
+    )]
+    for day in range(day_count):
+        values = [f"{value:.1f}" for value in measurements[day]]
+        # Leave solar radiation blank on a ratio of days
+        if is_bad[day] and day % 2 == 0:
+            values[-1] = " "
+        lines.append(f"{station_name},{day + 1:02d}/{month:02d}/{year}," + ",".join(values) + "\n")
+    totals = measurements[:, :3].sum(axis=0)
+    lines.append(f"Totals:,,{totals[0]:.1f},{totals[1]:.1f},{totals[2]:.1f},,,,,, ")
+
+    return "".join(lines).encode("ISO-8859-1")
+
+
+def render_stations_db(stations):
+    """
+    This function renders the BOM station dataset in fixed width format.
+
+    Parameters
+    ----------
+    stations: list
+        List of (station id, state, station name) of stations.
+
+    Returns
+    -------
+    bytes
+        Content of the station dataset.
+    """
+    lines = [
+        f"{station_id:06d}  {state:<4}{'99S':<6}{station_name:<41}{'19400101..':<16}"
+        f"{-30 - station_id % 10:<9.4f}{130 + station_id % 20:<10.4f}\n"
+        for (station_id, state, station_name) in stations
+    ]
+    return "".join(lines).encode("ISO-8859-1")
+
+
+def generate_bom_archive(
+    station_count=10,
+    states=("NSW", "VIC", "WA"),
+    years=(2022, 2023),
+    duplicate_ratio=0.1,
+    bad_ratio=0.01,
+    seed=0
+):
+    """
+    This function generates a synthetic compressed BOM dataset file
+    with monthly CSV files of each station in each state and year.
+
+    A ratio of stations are also written into the directory of the next
+    state, which duplicates their weather datasets across states as in
+    the BOM dataset.
+
+    Parameters
+    ----------
+    station_count: int
+        Number of stations in each state.
+    states: list
+        List of states.
+    years: list
+        List of years.
+    duplicate_ratio: float
+        Ratio of stations duplicated into another state directory.
+    bad_ratio: float
+        Ratio of days with bad measurements.
+    seed: int
+        Seed of the random number generator.
+
+    Returns
+    -------
+    archive: bytes
+        Content of the compressed BOM dataset file.
+    station_wrong_state: list
+        List of pairs of duplicated station and its wrong station location.
+    """
+    rng = np.random.default_rng(seed)
+    stations = []
+    station_wrong_state = []
+    archive = io.BytesIO()
+    with tarfile.open(fileobj=archive, mode="w:gz") as tar_file:
+        for (state_index, state) in enumerate(states):
+            for station_index in range(station_count):
+                station_name = make_station_name(state, station_index)
+                station_slug = station_name.lower().replace(" ", "_")
+                stations.append((len(stations) + 1, state, station_name))
+
+                # Find state directories of the station
+                station_states = [state]
+                if len(states) > 1 and station_index < station_count * duplicate_ratio:
+                    wrong_state = states[(state_index + 1) % len(states)]
+                    station_states.append(wrong_state)
+                    station_wrong_state.append((station_name, wrong_state))
+
+                for year in years:
+                    for month in range(1, 13):
+                        content = render_weather_csv(rng, station_name, state, year, month, bad_ratio)
+                        for station_state in station_states:
+                            member = tarfile.TarInfo(
+                                f"tables/{station_state.lower()}/{station_slug}/{station_slug}-{year}{month:02d}.csv"
+                            )
+                            member.size = len(content)
+                            tar_file.addfile(member, io.BytesIO(content))
+
+        content = render_stations_db(stations)
+        member = tarfile.TarInfo("tables/stations_db.txt")
+        member.size = len(content)
+        tar_file.addfile(member, io.BytesIO(content))
+
+    return archive.getvalue(), station_wrong_state
+
+
+if __name__ == "__main__":
+    # Define scale of synthetic dataset
+    station_count = int(os.environ.get("BENCHMARK_STATION_COUNT", 10))
+    states = os.environ.get("BENCHMARK_STATES", "NSW,VIC,WA").split(",")
+    year_start = int(os.environ.get("BENCHMARK_YEAR_START", 2022))
+    year_end = int(os.environ.get("BENCHMARK_YEAR_END", 2023))
+
+    archive, _ = generate_bom_archive(station_count, states, range(year_start, year_end + 1))
+    with open(sys.argv[1], "wb") as f:
+        f.write(archive)
+    print(f"{len(archive)} bytes have been written to {sys.argv[1]}")
@@ -0,0 +1,342 @@
+###############################################################################
+# Name: test_generate_dbt_model.py
+# Description: This script defines unit tests for the generation of year
+#              partition tables and dbt data models.
+# Author: Travis Hong
+# Repository: https://github.com/TravisH0301/weather_analysis
+###############################################################################
+import sys
+import os
+import ast
+import tempfile
+import unittest
+from unittest import mock
+from datetime import date
+
+import duckdb
+import yaml
+
+# Add Python script to the path
+script_directory = os.path.abspath("./airflow/dags/scripts")
+sys.path.append(script_directory)
+
+import generate_dbt_model
+from generate_dbt_model import (
+    find_missing_partitions,
+    render_schema_yml,
+    write_if_changed,
+    generate_partition_models,
+    render_daily_weather_model,
+    render_monthly_average_model,
+    render_dbt_selector,
+    weather_schema_dict_table
+)
+from warehouse import DuckDBWarehouse
+from metrics import RunMetrics
+
+
+class TestGenerateDbtModel(unittest.TestCase):
+    def test_find_missing_partitions(self):
+        # Check if only partitions missing from registry are found
+        missing_partitions = find_missing_partitions(
+            ["RAIN", "TEMPERATURE"],
+            [2022, 2023],
+            {("RAIN", 2022), ("RAIN", 2023), ("TEMPERATURE", 2022)}
+        )
+        self.assertEqual(missing_partitions, [("TEMPERATURE", 2023)])
+
+        # Check if nothing is missing when all partitions are registered
+        missing_partitions = find_missing_partitions(
+            ["RAIN"],
+            [2022, 2023],
+            {("RAIN", 2022), ("RAIN", 2023)}
+        )
+        self.assertEqual(missing_partitions, [])
+
+
+    def test_render_schema_yml(self):
+        # Load dictionary of schema-specific columns details
+        with open("./airflow/dags/scripts/weather_schema_yaml_dict.txt", "r") as f:
+            weather_schema_yaml_dict = ast.literal_eval(f.read())
+
+        # Check if rendered schema file is identical to the existing schema file
+        schema_str = render_schema_yml("rain", 2012, weather_schema_yaml_dict["RAIN"])
+        with open("./airflow/dags/dbt/models/rain/rain_2012.yml", "r") as f:
+            self.assertEqual(schema_str, f.read())
+
+        # Check if schema file of measurement table is named after the schema
+        schema_str = render_schema_yml("rain", None, weather_schema_yaml_dict["RAIN"])
+        self.assertIn("- name: rain\n", schema_str)
+
+
+    def test_write_if_changed(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_path = os.path.join(temp_dir, "rain", "rain_2012.sql")
+
+            # Check if new and changed files are written
+            self.assertTrue(write_if_changed(file_path, "select 1"))
+            self.assertTrue(write_if_changed(file_path, "select 2"))
+
+            # Check if unchanged file is left untouched
+            os.utime(file_path, (0, 0))
+            self.assertFalse(write_if_changed(file_path, "select 2"))
+            self.assertEqual(os.stat(file_path).st_mtime, 0)
+            with open(file_path, "r") as f:
+                self.assertEqual(f.read(), "select 2")
+
+
+
+    def test_render_dbt_selector(self):
+        # Check if only year partitions of loaded years and downstream models are selected
+        self.assertEqual(
+            render_dbt_selector(["RAIN", "TEMPERATURE"], [2023]),
+            "rain_2023+ temperature_2023+ daily_weather+"
+        )
+
+        # Check if measurement tables are selected in clustered mode
+        self.assertEqual(
+            render_dbt_selector(["RAIN", "TEMPERATURE"], [2022, 2023], "clustered"),
+            "rain+ temperature+ daily_weather+"
+        )
+
+        # Check if rewritten models of older years and downstream models are selected
+        self.assertEqual(
+            render_dbt_selector(["RAIN"], [2023], "year_table", [
+                "/dbt/models/rain/rain_2015.sql",
+                "/dbt/models/rain/rain_2015.yml",
+                "/dbt/models/rain/rain_2023.yml",
+                "/dbt/models/daily_weather/daily_weather.yml",
+                "/dbt/models/aggregated/monthly_average.sql"
+            ]),
+            "rain_2023+ daily_weather+ rain_2015+ monthly_average+"
+        )
+
+
+
+class TestRenderDbtModel(unittest.TestCase):
+    def setUp(self):
+        # Define location of dbt models written into temp directory
+        self.model_dir = tempfile.TemporaryDirectory()
+        self.patcher = mock.patch.object(
+            generate_dbt_model,
+            "target_location",
+            os.path.join(self.model_dir.name, "{}", "{}")
+        )
+        self.patcher.start()
+        self.schemas = list(weather_schema_dict_table)
+        self.partitions = [(schema, year) for schema in self.schemas for year in (2022, 2023)]
+
+
+    def tearDown(self):
+        self.patcher.stop()
+        self.model_dir.cleanup()
+
+
+    def test_render_monthly_average_model(self):
+        script_str = render_monthly_average_model(self.partitions)
+
+        # Check if months of latest staging load are computed in incremental runs only
+        self.assertIn(
+            "with {% if is_incremental() %}\n"
+            "load_months as (\n"
+            "    select distinct cast(date_trunc('month', date) as date) as month_start\n",
+            script_str
+        )
+        self.assertIn("where load_date = (select max(load_date)", script_str)
+
+        # Check if aggregate is merged on station, state, year and month
+        self.assertIn("unique_key=['station_name', 'state', 'year', 'month']", script_str)
+        self.assertIn("incremental_strategy=('merge' if target.type == 'snowflake' else 'delete+insert')", script_str)
+
+        # Check if year partitions of each weather schema are combined with union all and filtered by month
+        self.assertIn(
+            "rain_union as (\n"
+            "    select record_key, station_name, state, date, rain from {{ ref('rain_2023') }}{{ load_month_filter() }}\n"
+            "    union all\n"
+            "    select record_key, station_name, state, date, rain from {{ ref('rain_2022') }}{{ load_month_filter() }}\n"
+            ")",
+            script_str
+        )
+        self.assertEqual(script_str.count("union all"), len(self.schemas))
+        self.assertEqual(script_str.count("{{ load_month_filter() }}"), len(self.partitions))
+
+        # Check if month filter macro filters on months of latest staging load
+        with open("./airflow/dags/dbt/macros/load_month_filter_macro.sql", "r") as f:
+            macro_str = f.read()
+        self.assertIn("{% if is_incremental() %}", macro_str)
+        self.assertIn("in (select month_start from load_months)", macro_str)
+
+        # Check if rendered aggregate is identical to the existing aggregate
+        partitions = [(schema, year) for schema in self.schemas for year in range(2012, 2024)]
+        with open("./airflow/dags/dbt/models/aggregated/monthly_average.sql", "r") as f:
+            self.assertEqual(render_monthly_average_model(partitions), f.read())
+
+
+
+    def test_render_clustered_models(self):
+        # Check if measurement table and year views are written in clustered mode
+        partitions = [("RAIN", 2022), ("RAIN", 2023)]
+        written_file_paths = generate_partition_models(partitions, "clustered")
+        self.assertEqual(
+            sorted(os.path.relpath(file_path, self.model_dir.name) for file_path in written_file_paths),
+            ["rain/rain.sql", "rain/rain.yml", "rain/rain_2022.sql", "rain/rain_2023.sql"]
+        )
+        with open(os.path.join(self.model_dir.name, "rain", "rain.sql"), "r") as f:
+            script_str = f.read()
+        self.assertIn("cluster_by=['date', 'station_key']", script_str)
+        self.assertIn('generate_year_partition_model_macro(\n        "RAIN, ", none\n    )', script_str)
+        with open(os.path.join(self.model_dir.name, "rain", "rain.yml"), "r") as f:
+            self.assertIn("- name: rain\n", f.read())
+        with open(os.path.join(self.model_dir.name, "rain", "rain_2022.sql"), "r") as f:
+            self.assertEqual(
+                f.read(),
+                "{{\n    config(\n        materialized='view'\n    )\n}}"
+                "\n\nselect *\nfrom {{ ref('rain') }}\nwhere date between '2022-01-01' and '2022-12-31'"
+            )
+        self.assertEqual(generate_partition_models(partitions, "clustered"), [])
+
+        # Check if monthly average reads measurement tables without union
+        script_str = render_monthly_average_model(self.partitions, "clustered")
+        self.assertIn(
+            "rain_union as (\n"
+            "    select record_key, station_name, state, date, rain from {{ ref('rain') }}{{ load_month_filter() }}\n"
+            ")",
+            script_str
+        )
+        self.assertNotIn("union all", script_str)
+        self.assertNotIn("rain_2022", script_str)
+
+        # Check if measurement tables and written year views are selected
+        self.assertEqual(
+            render_dbt_selector(["RAIN"], [2023], "clustered", written_file_paths),
+            "rain+ daily_weather+ rain_2022+ rain_2023+"
+        )
+        self.assertEqual(render_dbt_selector(["RAIN"], [], "clustered"), "daily_weather+")
+
+
+
+    def test_render_daily_weather_model(self):
+        script_str, schema_str = render_daily_weather_model()
+
+        # Check if all attributes of weather schemas are loaded in a single pass without join
+        attribute_li = [
+            attribute
+            for attributes in generate_dbt_model.weather_schema_dict_model.values()
+            for attribute in attributes
+        ]
+        self.assertIn('"' + ", ".join(attribute_li) + ', ", none', script_str)
+        self.assertIn("cluster_by=['date', 'station_key']", script_str)
+        self.assertNotIn("join", script_str)
+        with open("./airflow/dags/dbt/macros/generate_year_partition_model_macro.sql", "r") as f:
+            macro_str = f.read()
+        self.assertIn("    record_key,\n    station_key,\n", macro_str)
+        self.assertIn("target.record_key = source.record_key", macro_str)
+
+        # Check if schema file holds columns of all weather schemas from schema dictionary
+        model = yaml.safe_load(schema_str)["models"][0]
+        col_schema = {
+            col_name: col_detail
+            for schema_col_schema in generate_dbt_model.weather_schema_yaml_dict.values()
+            for (col_name, col_detail) in schema_col_schema.items()
+        }
+        self.assertEqual(model["name"], "daily_weather")
+        self.assertEqual(
+            [column["name"] for column in model["columns"]],
+            ["record_key", "station_key", "station_name", "date"] + list(col_schema) + ["state", "load_date"]
+        )
+        for column in model["columns"]:
+            if column["name"] in col_schema:
+                self.assertEqual(column["description"], col_schema[column["name"]][0])
+        self.assertEqual(model["columns"][0]["tests"], ["not_null", "unique"])
+
+        # Check if rendered files are identical to the existing files
+        for (file_name, content) in [("daily_weather.sql", script_str), ("daily_weather.yml", schema_str)]:
+            with open(f"./airflow/dags/dbt/models/daily_weather/{file_name}", "r") as f:
+                self.assertEqual(content, f.read())
+
+
+class TestMain(unittest.TestCase):
+    def setUp(self):
+        # Create staging tables and a year partition table created before the keys in DuckDB
+        self.conn = duckdb.connect()
+        self.conn.execute("CREATE SCHEMA STAGING")
+        self.conn.execute("""
+            CREATE TABLE STAGING.WEATHER_PREPROCESSED AS
+            SELECT 'STATION_A' AS STATION_NAME, DATE '2022-01-02' AS DATE, DATE '2023-01-01' AS LOAD_DATE
+        """)
+        self.conn.execute("""
+            CREATE TABLE STAGING.STATION_DICTIONARY AS
+            SELECT 'STATION_A' AS STATION_NAME, 1 AS STATION_KEY
+        """)
+        self.conn.execute("CREATE SCHEMA RAIN")
+        self.conn.execute("""
+            CREATE TABLE RAIN.RAIN_2022 AS
+            SELECT 'STATION_A' AS STATION_NAME, DATE '2022-01-02' AS DATE, 1.5 AS RAIN,
+                'VIC' AS STATE, DATE '2023-01-01' AS LOAD_DATE
+        """)
+
+        # Define variables of main block with dbt models written into temp directory
+        self.model_dir = tempfile.TemporaryDirectory()
+        self.warehouse = DuckDBWarehouse(self.conn)
+        self.patcher = mock.patch.multiple(
+            generate_dbt_model,
+            create=True,
+            warehouse=self.warehouse,
+            metrics=RunMetrics("generate_dbt_model"),
+            partition_mode="year_table",
+            monthly_average_source="partitions",
+            dbt_selective_build=False,
+            target_location=os.path.join(self.model_dir.name, "{}", "{}")
+        )
+        self.patcher.start()
+
+
+    def tearDown(self):
+        self.patcher.stop()
+        self.warehouse.close()
+        self.model_dir.cleanup()
+
+
+    def test_main_first_run(self):
+        generate_dbt_model.main()
+
+        # Check if existing year partition table is registered on first run of partition registry
+        self.assertIn(
+            ("RAIN", 2022),
+            self.conn.execute("SELECT SCHEMA_NAME, YEAR FROM STAGING.WEATHER_PARTITION_REGISTRY").fetchall()
+        )
+
+        # Check if keys of existing year partition table are backfilled on first run
+        self.assertEqual(
+            self.conn.execute("SELECT STATION_KEY, RECORD_KEY FROM RAIN.RAIN_2022").fetchall(),
+            [(1, 100000 + (date(2022, 1, 2) - date(1970, 1, 1)).days)]
+        )
+
+
+    def test_main_backfill_once(self):
+        generate_dbt_model.main()
+
+        # Check if year partitions are flagged once their keys are backfilled
+        self.assertEqual(
+            self.conn.execute("""
+                SELECT COUNT(*)
+                FROM STAGING.WEATHER_PARTITION_REGISTRY
+                WHERE NOT KEYS_BACKFILLED
+            """).fetchall(),
+            [(0,)]
+        )
+
+        # Check if keys of flagged year partition tables are not backfilled again
+        self.conn.execute("""
+            INSERT INTO RAIN.RAIN_2022 (STATION_NAME, DATE, RAIN, STATE, LOAD_DATE)
+            VALUES ('STATION_A', DATE '2022-01-03', 2.5, 'VIC', DATE '2023-01-01')
+        """)
+        generate_dbt_model.main()
+        self.assertEqual(
+            self.conn.execute("SELECT RECORD_KEY FROM RAIN.RAIN_2022 WHERE DATE = DATE '2022-01-03'").fetchall(),
+            [(None,)]
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,296 @@
+###############################################################################
+# Name: test_land_file.py
+# Description: This script defines unit tests for the landing of the
+#              compressed BOM dataset file. These test cases use a local
+#              FTP server and a mocked S3-compatible object storage.
+# Author: Travis Hong
+# Repository: https://github.com/TravisH0301/weather_analysis
+###############################################################################
+import sys
+import os
+import json
+import ftplib
+import hashlib
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import boto3
+from moto import mock_aws
+from pyftpdlib.authorizers import DummyAuthorizer
+from pyftpdlib.handlers import FTPHandler
+from pyftpdlib.servers import FTPServer
+
+# Add Python script to the path
+script_directory = os.path.abspath("./airflow/dags/scripts")
+sys.path.append(script_directory)
+
+import land_file
+from land_file import get_ftp_file_info, iter_ftp_file_parts, upload_multipart
+from metrics import RunMetrics
+
+
+class InterruptedConnection():
+    """
+    This class wraps the FTP data connection to drop it
+    after the given number of bytes.
+    """
+
+    def __init__(self, conn, drop_after):
+        self.conn = conn
+        self.drop_after = drop_after
+
+    def recv(self, size):
+        if self.drop_after <= 0:
+            raise ConnectionResetError("Connection dropped")
+        chunk = self.conn.recv(min(size, self.drop_after))
+        self.drop_after -= len(chunk)
+        return chunk
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.conn.close()
+
+
+class NoMdtmFTPHandler(FTPHandler):
+    """
+    This class serves FTP without the MDTM command.
+    """
+    proto_cmds = {cmd: info for (cmd, info) in FTPHandler.proto_cmds.items() if cmd != "MDTM"}
+
+
+class TestLandFile(unittest.TestCase):
+    def setUp(self):
+        # Create test file on local FTP server
+        self.ftp_dir = tempfile.TemporaryDirectory()
+        self.ftp_file_path = os.path.join(self.ftp_dir.name, "IDCKWCDEA0.tgz")
+        self.content = os.urandom(11 * 1024**2 + 123)
+        with open(self.ftp_file_path, "wb") as f:
+            f.write(self.content)
+        open(os.path.join(self.ftp_dir.name, "EMPTY.tgz"), "wb").close()
+        self.start_ftp_server(FTPHandler)
+
+    def tearDown(self):
+        self.stop_ftp_server()
+        self.ftp_dir.cleanup()
+
+    def start_ftp_server(self, handler_class):
+        # Serve test directory anonymously with a subclass of the given handler
+        authorizer = DummyAuthorizer()
+        authorizer.add_anonymous(self.ftp_dir.name)
+        handler = type("AnonymousFTPHandler", (handler_class,), {"authorizer": authorizer})
+        self.ftp_server = FTPServer(("127.0.0.1", 0), handler)
+        self.ftp_port = self.ftp_server.socket.getsockname()[1]
+        self.ftp_thread = threading.Thread(
+            target=self.ftp_server.serve_forever,
+            kwargs={"timeout": 0.1}
+        )
+        self.ftp_thread.start()
+
+    def stop_ftp_server(self):
+        self.ftp_server.close_all()
+        self.ftp_thread.join()
+
+    def run_main(self, s3, date_today_str):
+        # Run landing process with module variables defined in main block
+        with mock.patch.multiple(
+            land_file,
+            create=True,
+            ftp_file_path=f"ftp://127.0.0.1:{self.ftp_port}/IDCKWCDEA0.tgz",
+            s3=s3,
+            bucket_name="bom-landing",
+            landing_record_name="latest/IDCKWCDEA0.json",
+            manifest_prefix="manifests/",
+            date_today_str=date_today_str,
+            part_size=5 * 1024**2,
+            max_concurrency=2,
+            metrics=RunMetrics("land_file")
+        ):
+            is_staging_required = land_file.main()
+        response = s3.get_object(Bucket="bom-landing", Key="latest/IDCKWCDEA0.json")
+        return is_staging_required, json.loads(response["Body"].read())
+
+    def list_landed_files(self, s3):
+        response = s3.list_objects_v2(Bucket="bom-landing")
+        return sorted(obj["Key"] for obj in response["Contents"] if obj["Key"].endswith(".tgz"))
+
+
+    def test_get_ftp_file_info(self):
+        # Check if size and modification time are retrieved without download
+        ftp_file_info = get_ftp_file_info("127.0.0.1", "/IDCKWCDEA0.tgz", ftp_port=self.ftp_port)
+        self.assertEqual(ftp_file_info["size"], len(self.content))
+        self.assertRegex(ftp_file_info["mdtm"], r"^\d{14}")
+
+        # Check if modification time is None without MDTM support
+        self.stop_ftp_server()
+        self.start_ftp_server(NoMdtmFTPHandler)
+        ftp_file_info = get_ftp_file_info("127.0.0.1", "/IDCKWCDEA0.tgz", ftp_port=self.ftp_port)
+        self.assertEqual(ftp_file_info, {"size": len(self.content), "mdtm": None})
+
+
+    def test_iter_ftp_file_parts_resume(self):
+        # Drop data connection of the first transfer mid-way
+        transfercmd = ftplib.FTP.transfercmd
+        drops = [3 * 1024**2]
+        def interrupted_transfercmd(ftp, cmd, rest=None):
+            conn = transfercmd(ftp, cmd, rest)
+            if drops:
+                return InterruptedConnection(conn, drops.pop())
+            return conn
+
+        with mock.patch.object(ftplib.FTP, "transfercmd", interrupted_transfercmd):
+            parts = list(iter_ftp_file_parts(
+                "127.0.0.1",
+                "/IDCKWCDEA0.tgz",
+                part_size=5 * 1024**2,
+                ftp_port=self.ftp_port
+            ))
+
+        # Check if file is resumed and split into fixed-size parts
+        self.assertEqual([len(part) for part in parts], [5 * 1024**2, 5 * 1024**2, 1024**2 + 123])
+        self.assertEqual(b"".join(parts), self.content)
+
+
+    @mock_aws
+    def test_upload_multipart(self):
+        # Create mocked bucket
+        s3 = boto3.client("s3", region_name="us-east-1")
+        s3.create_bucket(Bucket="bom-landing")
+
+        # Stream file from FTP server into mocked bucket
+        parts = iter_ftp_file_parts(
+            "127.0.0.1",
+            "/IDCKWCDEA0.tgz",
+            part_size=5 * 1024**2,
+            ftp_port=self.ftp_port
+        )
+        upload_multipart(s3, "bom-landing", "IDCKWCDEA0_2023-11-12.tgz", parts, max_concurrency=2)
+
+        # Check if uploaded object is identical to the file
+        response = s3.get_object(Bucket="bom-landing", Key="IDCKWCDEA0_2023-11-12.tgz")
+        self.assertEqual(response["Body"].read(), self.content)
+
+
+    @mock_aws
+    def test_upload_multipart_abort_unchanged(self):
+        # Create mocked bucket
+        s3 = boto3.client("s3", region_name="us-east-1")
+        s3.create_bucket(Bucket="bom-landing")
+
+        # Stream file from FTP server but decide not to complete upload
+        parts = iter_ftp_file_parts(
+            "127.0.0.1",
+            "/IDCKWCDEA0.tgz",
+            part_size=5 * 1024**2,
+            ftp_port=self.ftp_port
+        )
+        is_landed = upload_multipart(
+            s3,
+            "bom-landing",
+            "IDCKWCDEA0_2023-11-12.tgz",
+            parts,
+            max_concurrency=2,
+            should_complete=lambda: False
+        )
+
+        # Check if no object nor incomplete upload is left in bucket
+        self.assertFalse(is_landed)
+        self.assertNotIn("Contents", s3.list_objects_v2(Bucket="bom-landing"))
+        self.assertNotIn("Uploads", s3.list_multipart_uploads(Bucket="bom-landing"))
+
+
+    @mock_aws
+    def test_upload_multipart_empty(self):
+        # Create mocked bucket
+        s3 = boto3.client("s3", region_name="us-east-1")
+        s3.create_bucket(Bucket="bom-landing")
+
+        # Stream empty file from FTP server into mocked bucket
+        parts = iter_ftp_file_parts(
+            "127.0.0.1",
+            "/EMPTY.tgz",
+            part_size=5 * 1024**2,
+            ftp_port=self.ftp_port
+        )
+        is_landed = upload_multipart(s3, "bom-landing", "EMPTY_2023-11-12.tgz", parts, max_concurrency=2)
+
+        # Check if empty object is uploaded without incomplete upload left in bucket
+        self.assertTrue(is_landed)
+        response = s3.get_object(Bucket="bom-landing", Key="EMPTY_2023-11-12.tgz")
+        self.assertEqual(response["Body"].read(), b"")
+        self.assertNotIn("Uploads", s3.list_multipart_uploads(Bucket="bom-landing"))
+
+
+    @mock_aws
+    def test_main(self):
+        # Create mocked bucket
+        s3 = boto3.client("s3", region_name="us-east-1")
+        s3.create_bucket(Bucket="bom-landing")
+
+        # Check if new file is landed with landing record
+        is_staging_required, landing_record = self.run_main(s3, "2023-11-12")
+        self.assertTrue(is_staging_required)
+        self.assertEqual(landing_record["file_name"], "IDCKWCDEA0_2023-11-12.tgz")
+        self.assertEqual(landing_record["sha256"], hashlib.sha256(self.content).hexdigest())
+
+        # Check if file with unchanged metadata is staged again when last landed file is not staged
+        is_staging_required, _ = self.run_main(s3, "2023-11-13")
+        self.assertTrue(is_staging_required)
+        self.assertEqual(self.list_landed_files(s3), ["IDCKWCDEA0_2023-11-12.tgz"])
+
+        # Check if file with unchanged metadata is skipped once last landed file is staged
+        s3.put_object(Bucket="bom-landing", Key="manifests/IDCKWCDEA0_2023-11-12.json", Body=b"{}")
+        is_staging_required, _ = self.run_main(s3, "2023-11-13")
+        self.assertFalse(is_staging_required)
+        self.assertEqual(self.list_landed_files(s3), ["IDCKWCDEA0_2023-11-12.tgz"])
+
+        # Check if file with changed metadata and same content is not landed
+        # while landing record keeps pointing to last landed file with new metadata
+        os.utime(self.ftp_file_path, (1000000000, 1000000000))
+        is_staging_required, landing_record = self.run_main(s3, "2023-11-14")
+        self.assertFalse(is_staging_required)
+        self.assertEqual(self.list_landed_files(s3), ["IDCKWCDEA0_2023-11-12.tgz"])
+        self.assertEqual(landing_record["file_name"], "IDCKWCDEA0_2023-11-12.tgz")
+        self.assertEqual(landing_record["mdtm"], "20010909014640")
+        self.assertNotIn("Uploads", s3.list_multipart_uploads(Bucket="bom-landing"))
+
+        # Check if file with new content is landed
+        content = os.urandom(1024)
+        with open(self.ftp_file_path, "wb") as f:
+            f.write(content)
+        is_staging_required, landing_record = self.run_main(s3, "2023-11-15")
+        self.assertTrue(is_staging_required)
+        self.assertEqual(
+            self.list_landed_files(s3),
+            ["IDCKWCDEA0_2023-11-12.tgz", "IDCKWCDEA0_2023-11-15.tgz"]
+        )
+        self.assertEqual(landing_record["file_name"], "IDCKWCDEA0_2023-11-15.tgz")
+        self.assertEqual(landing_record["sha256"], hashlib.sha256(content).hexdigest())
+
+
+    @mock_aws
+    def test_main_without_mdtm(self):
+        # Create mocked bucket and serve FTP without MDTM support
+        s3 = boto3.client("s3", region_name="us-east-1")
+        s3.create_bucket(Bucket="bom-landing")
+        self.stop_ftp_server()
+        self.start_ftp_server(NoMdtmFTPHandler)
+
+        # Check if unchanged file is compared by content hash and not landed again
+        is_staging_required, _ = self.run_main(s3, "2023-11-12")
+        self.assertTrue(is_staging_required)
+        is_staging_required, _ = self.run_main(s3, "2023-11-13")
+        self.assertTrue(is_staging_required)
+        s3.put_object(Bucket="bom-landing", Key="manifests/IDCKWCDEA0_2023-11-12.json", Body=b"{}")
+        is_staging_required, landing_record = self.run_main(s3, "2023-11-13")
+        self.assertFalse(is_staging_required)
+        self.assertEqual(self.list_landed_files(s3), ["IDCKWCDEA0_2023-11-12.tgz"])
+        self.assertEqual(landing_record["file_name"], "IDCKWCDEA0_2023-11-12.tgz")
+        self.assertIsNone(landing_record["mdtm"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+###############################################################################
+# Name: test_metrics.py
+# Description: This script defines unit tests for the performance metrics
+#              recorded and emitted by the pipeline scripts.
+# Author: Travis Hong
+# Repository: https://github.com/TravisH0301/weather_analysis
+###############################################################################
+import sys
+import os
+import json
+import tempfile
+import unittest
+from unittest import mock
+
+# Add Python script to the path
+script_directory = os.path.abspath("./airflow/dags/scripts")
+sys.path.append(script_directory)
+
+from metrics import RunMetrics
+
+
+class TestRunMetrics(unittest.TestCase):
+    def test_stage(self):
+        metrics = RunMetrics("stage_data", {"mode": "reduce", "shard": None})
+
+        # Check if nested stages are recorded with rows and peak RSS
+        with metrics.stage("load_datasets"):
+            with metrics.stage("dedup_weather", rows_in=10) as stage:
+                buffer = bytearray(64 * 1024**2)
+                stage["rows_out"] = 8
+            del buffer
+        (inner, outer) = metrics.stages
+        self.assertEqual((inner["stage"], inner["rows_in"], inner["rows_out"]), ("dedup_weather", 10, 8))
+        self.assertGreaterEqual(inner["peak_rss_bytes"], 64 * 1024**2)
+        self.assertGreaterEqual(outer["peak_rss_bytes"], inner["peak_rss_bytes"])
+        self.assertGreaterEqual(outer["wall_seconds"], inner["wall_seconds"])
+
+        # Check if failed stage fails the run
+        with self.assertRaises(ValueError):
+            with metrics.stage("merge_weather"):
+                raise ValueError
+        self.assertEqual(metrics.stages[-1]["status"], "failed")
+        self.assertEqual(metrics.summary()["status"], "failed")
+        self.assertEqual(metrics.summary()["stages"]["dedup_weather"]["rows_out"], 8)
+
+
+    def test_emit(self):
+        metrics = RunMetrics("reconcile_data")
+        with metrics.stage("count_staging") as stage:
+            stage["rows_out"] = 100
+
+        # Check if metrics are rendered for Prometheus and StatsD
+        prometheus_str = metrics.render_prometheus()
+        self.assertIn('weather_pipeline_stage_rows_out{script="reconcile_data",stage="count_staging"} 100', prometheus_str)
+        self.assertIn('weather_pipeline_run_success{script="reconcile_data"} 1', prometheus_str)
+        self.assertIn("weather_pipeline.reconcile_data.count_staging.rows_out:100|g", metrics.render_statsd("weather_pipeline"))
+
+        # Check if run report and Prometheus textfile are written
+        with tempfile.TemporaryDirectory() as output_dir:
+            with mock.patch.dict(os.environ, {
+                "METRICS_REPORT_DIR": output_dir,
+                "METRICS_TEXTFILE_DIR": output_dir,
+                "AIRFLOW_CTX_DAG_RUN_ID": "scheduled__2023-11-12T00:00:00+00:00"
+            }):
+                metrics = RunMetrics("reconcile_data")
+                metrics.emit()
+            self.assertEqual(
+                sorted(os.listdir(output_dir)),
+                ["reconcile_data.prom", "reconcile_data_scheduled__2023-11-12T00_00_00_00_00.json"]
+            )
+            with open(os.path.join(output_dir, "reconcile_data_scheduled__2023-11-12T00_00_00_00_00.json")) as f:
+                self.assertEqual(json.load(f)["status"], "success")
+
+
+if __name__ == '__main__':
+    unittest.main()
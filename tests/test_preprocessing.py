@@ -8,15 +8,78 @@
 ###############################################################################
 import sys
 import os
+import io
+import tarfile
+import tempfile
 import unittest
-from datetime import datetime
+from datetime import datetime, date
 import pytz
+import numpy as np
+import pandas as pd
 
 # Add Python script to the path
 script_directory = os.path.abspath("./airflow/dags/scripts")
 sys.path.append(script_directory)
+benchmark_directory = os.path.abspath("./benchmarks")
+sys.path.append(benchmark_directory)
 
-from stage_data import pre_process_csv, pre_process_fwf
+from stage_data import (
+    pre_process_csv,
+    pre_process_fwf,
+    process_archive,
+    split_archive_shards,
+    build_wrong_state_index,
+    dedup_weather,
+    build_station_dictionary,
+    assign_record_keys,
+    compile_validation_rules,
+    validate_weather
+)
+
+from generate_bom_archive import generate_bom_archive
+
+
+def build_test_archive():
+    """
+    This function builds a compressed BOM dataset file in memory
+    from the test datasets, following the BOM directory layout.
+    """
+    archive = io.BytesIO()
+    with tarfile.open(fileobj=archive, mode="w:gz") as tar_file:
+        for (file_path, member_name) in [
+            (
+                "./tests/test_datasets/stations_db.txt",
+                "tables/stations_db.txt"
+            ),
+            (
+                "./tests/test_datasets/melbourne_airport-202310.csv",
+                "tables/vic/melbourne_airport/melbourne_airport-202310.csv"
+            ),
+            (
+                "./tests/test_datasets/melbourne_airport-202310.csv",
+                "tables/vic/melbourne_airport/melbourne_airport-201110.csv"
+            )
+        ]:
+            tar_file.add(file_path, arcname=member_name)
+    return archive.getvalue()
+
+
+class NonSeekableStream(io.RawIOBase):
+    """
+    This class wraps bytes as a forward-only stream
+    similar to the object storage response body.
+    """
+
+    def __init__(self, data):
+        self.buffer = io.BytesIO(data)
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        chunk = self.buffer.read(len(b))
+        b[:len(chunk)] = chunk
+        return len(chunk)
 
 
 class TestPreprocessing(unittest.TestCase):
@@ -50,6 +113,36 @@ class TestPreprocessing(unittest.TestCase):
             self.assertIn(col, test_df.columns, f"{col} column is missing.")
 
 
+    def test_pre_process_csv_matches_python_engine(self):
+        # Define date variable
+        date_today = datetime.now(pytz.timezone("Australia/Melbourne")).date()
+
+        # Preprocess test weather dataset
+        with open("./tests/test_datasets/melbourne_airport-202310.csv", "rb") as f:
+            test_df = pre_process_csv(f, "VIC", date_today)
+
+        # Build expected dataframe with the python engine parser
+        with open("./tests/test_datasets/melbourne_airport-202310.csv", "rb") as f:
+            expected_df = pd.read_csv(
+                f,
+                encoding="ISO-8859-1",
+                engine="python",
+                skiprows=12,
+                skipfooter=1,
+                skip_blank_lines=True
+            )
+        expected_df.columns = test_df.columns[:-2]
+        expected_df = expected_df.replace("", None).replace(" ", None)
+        for float_col in expected_df.columns[2:]:
+            expected_df[float_col] = expected_df[float_col].astype(np.float64)
+        expected_df["DATE"] = pd.to_datetime(expected_df["DATE"], format="%d/%m/%Y").dt.date
+        expected_df["STATE"] = "VIC"
+        expected_df["LOAD_DATE"] = date_today
+
+        # Check if fast-path parser gives identical dataframe
+        pd.testing.assert_frame_equal(test_df, expected_df)
+
+
     def test_pre_process_fwf(self):
         # Define date variable
         date_today = datetime.now(pytz.timezone("Australia/Melbourne")).date()
@@ -75,5 +168,214 @@ class TestPreprocessing(unittest.TestCase):
             self.assertIn(col, test_df.columns, f"{col} column is missing.")
 
 
+    def test_process_archive_stream(self):
+        # Define date variable
+        date_today = datetime.now(pytz.timezone("Australia/Melbourne")).date()
+
+        # Preprocess test archive in stream mode
+        stream = NonSeekableStream(build_test_archive())
+        with tarfile.open(fileobj=stream, mode="r|gz") as tar_file:
+            df_weather_li, df_station, _ = process_archive(tar_file, date_today)
+
+        # Check if only dataset created in or after 2012 is processed
+        self.assertEqual(len(df_weather_li), 1, "Only one weather dataset should be processed.")
+        self.assertEqual(df_weather_li[0]["STATE"].unique().tolist(), ["VIC"])
+        # Check if station dataset is processed
+        self.assertFalse(df_station.empty, "The station DataFrame should not be empty.")
+
+
+    def test_process_archive_shards(self):
+        # Define date variable
+        date_today = datetime.now(pytz.timezone("Australia/Melbourne")).date()
+
+        # Check if archive is split into shards of state directories and station dataset
+        with tempfile.TemporaryDirectory() as output_dir:
+            with tarfile.open(fileobj=NonSeekableStream(build_test_archive()), mode="r|gz") as tar_file:
+                shard_file_paths = split_archive_shards(tar_file, output_dir)
+            self.assertEqual(list(shard_file_paths), ["STATION", "VIC"])
+
+            # Check if only members of given shard are processed from its tar file
+            with tarfile.open(shard_file_paths["STATION"], mode="r|*") as tar_file:
+                df_weather_li, df_station, manifest = process_archive(tar_file, date_today, shards=["STATION"])
+        self.assertEqual(df_weather_li, [])
+        self.assertFalse(df_station.empty)
+        self.assertEqual(list(manifest), ["tables/stations_db.txt"])
+
+
+    def test_process_archive_parallel(self):
+        # Define date variable
+        date_today = datetime.now(pytz.timezone("Australia/Melbourne")).date()
+
+        # Preprocess test archive serially and in process pool
+        archive = build_test_archive()
+        with tarfile.open(fileobj=io.BytesIO(archive), mode="r|gz") as tar_file:
+            df_weather_li, df_station, _ = process_archive(tar_file, date_today)
+        with tarfile.open(fileobj=io.BytesIO(archive), mode="r|gz") as tar_file:
+            df_weather_li_parallel, df_station_parallel, _ = process_archive(
+                tar_file,
+                date_today,
+                max_workers=2,
+                max_inflight_bytes=1
+            )
+
+        # Check if parallel process gives the same output as serial process
+        self.assertEqual(len(df_weather_li), len(df_weather_li_parallel))
+        for (df_weather, df_weather_parallel) in zip(df_weather_li, df_weather_li_parallel):
+            pd.testing.assert_frame_equal(df_weather, df_weather_parallel)
+        pd.testing.assert_frame_equal(df_station, df_station_parallel)
+
+
+    def test_process_archive_delta(self):
+        # Define date variable
+        date_today = datetime.now(pytz.timezone("Australia/Melbourne")).date()
+
+        # Preprocess test archive and record its manifest
+        archive = build_test_archive()
+        with tarfile.open(fileobj=io.BytesIO(archive), mode="r|gz") as tar_file:
+            _, _, manifest = process_archive(tar_file, date_today)
+        self.assertEqual(len(manifest), 2, "Manifest should contain processed members.")
+
+        # Check if unchanged members are skipped against the previous manifest
+        with tarfile.open(fileobj=io.BytesIO(archive), mode="r|gz") as tar_file:
+            df_weather_li, df_station, manifest_delta = process_archive(
+                tar_file,
+                date_today,
+                previous_manifest=manifest
+            )
+        self.assertEqual(df_weather_li, [], "Unchanged weather dataset should be skipped.")
+        self.assertIsNone(df_station, "Unchanged station dataset should be skipped.")
+        self.assertEqual(manifest, manifest_delta)
+
+        # Check if changed member is pre-processed
+        manifest["tables/stations_db.txt"]["sha256"] = ""
+        with tarfile.open(fileobj=io.BytesIO(archive), mode="r|gz") as tar_file:
+            df_weather_li, df_station, _ = process_archive(
+                tar_file,
+                date_today,
+                previous_manifest=manifest
+            )
+        self.assertEqual(df_weather_li, [])
+        self.assertIsNotNone(df_station, "Changed station dataset should be processed.")
+
+
+    def test_dedup_weather(self):
+        # Define stations with wrong locations and weather dataset with duplicates
+        wrong_state_index = build_wrong_state_index([("ALBURY AIRPORT", "VIC")])
+        test_df = pd.DataFrame({
+            "STATION_NAME": ["ALBURY AIRPORT", "ALBURY AIRPORT", "EUCLA", "EUCLA", "EUCLA"],
+            "STATE": ["VIC", "NSW", "WA", "SA", "WA"],
+            "DATE": [date(2023, 10, 1), date(2023, 10, 1), date(2023, 10, 1), date(2023, 10, 1), date(2023, 10, 2)]
+        })
+        test_df = assign_record_keys(test_df, {"ALBURY AIRPORT": 72160, "EUCLA": 11003})
+
+        # Check if records with wrong location and duplicated records are removed
+        dedup_df = dedup_weather(test_df, wrong_state_index)
+        self.assertEqual(dedup_df.index.tolist(), [1, 2, 4])
+
+
+    def test_build_station_dictionary(self):
+        # Define existing dictionary and BOM station IDs
+        station_dictionary = {"EUCLA": 11003}
+        station_ids = {"EUCLA": "011003", "ALBURY AIRPORT": "072160", "FORREST": "011003"}
+
+        # Check if existing keys are kept and new names are keyed by station ID or sequence
+        station_dictionary, new_entries = build_station_dictionary(
+            ["EUCLA", "ALBURY AIRPORT", "FORREST", "MILDURA"],
+            station_ids,
+            station_dictionary
+        )
+        self.assertEqual(station_dictionary, {
+            "EUCLA": 11003,
+            "ALBURY AIRPORT": 72160,
+            "FORREST": 1000000,
+            "MILDURA": 1000001
+        })
+        self.assertEqual(new_entries, [
+            ("ALBURY AIRPORT", 72160),
+            ("FORREST", 1000000),
+            ("MILDURA", 1000001)
+        ])
+
+
+    def test_assign_record_keys(self):
+        # Define weather dataset
+        test_df = pd.DataFrame({
+            "STATION_NAME": ["EUCLA", "MILDURA", "EUCLA"],
+            "DATE": [date(1970, 1, 2), date(2023, 10, 1), date(2023, 10, 1)]
+        })
+
+        # Check if record keys are unique by station and date
+        keyed_df = assign_record_keys(test_df, {"EUCLA": 11003, "MILDURA": 1000001})
+        self.assertEqual(keyed_df["STATION_KEY"].tolist(), [11003, 1000001, 11003])
+        self.assertEqual(keyed_df["RECORD_KEY"].tolist(), [
+            11003 * 100000 + 1,
+            1000001 * 100000 + 19631,
+            11003 * 100000 + 19631
+        ])
+        self.assertEqual(keyed_df["RECORD_KEY"].dtype, np.int64)
+
+        # Check if unknown station name is rejected
+        with self.assertRaises(KeyError):
+            assign_record_keys(test_df, {"EUCLA": 11003})
+
+
+    def test_validate_weather(self):
+        # Define validation rules and weather dataset with faulty records
+        validation_rules = [
+            ("RAIN", ">=", 0),
+            ("MAXIMUM_TEMPERATURE", ">=", "MINIMUM_TEMPERATURE")
+        ]
+        test_df = pd.DataFrame({
+            "RAIN": [0.0, -1.0, np.nan, 2.0, -3.0],
+            "MAXIMUM_TEMPERATURE": [20.0, 20.0, 10.0, np.nan, 5.0],
+            "MINIMUM_TEMPERATURE": [10.0, 10.0, 15.0, 10.0, 10.0]
+        })
+
+        # Check if rejected row counts are reported by rule
+        evaluate = compile_validation_rules(validation_rules)
+        is_valid, rejected_counts = evaluate(test_df)
+        self.assertEqual(is_valid.tolist(), [True, False, False, True, False])
+        self.assertEqual(
+            rejected_counts,
+            {
+                "RAIN >= 0": 2,
+                "MAXIMUM_TEMPERATURE >= MINIMUM_TEMPERATURE": 2
+            }
+        )
+
+        # Check if faulty records are removed while null values are kept
+        valid_df = validate_weather(test_df, validation_rules)
+        self.assertEqual(valid_df.index.tolist(), [0, 3])
+
+
+
+    def test_synthetic_archive(self):
+        # Generate synthetic archive with a duplicated station in each state
+        archive, station_wrong_state = generate_bom_archive(
+            station_count=4,
+            states=("NSW", "VIC"),
+            years=(2023,),
+            duplicate_ratio=0.25,
+            bad_ratio=0.05
+        )
+        with tarfile.open(fileobj=io.BytesIO(archive), mode="r:gz") as tar_file:
+            df_weather_li, df_station, _ = process_archive(tar_file, date(2023, 11, 12))
+        df_weather = pd.concat(df_weather_li, ignore_index=True)
+        station_dictionary, _ = build_station_dictionary(df_weather["STATION_NAME"].unique(), {}, {})
+        df_weather = assign_record_keys(df_weather, station_dictionary)
+
+        # Check if all stations and cross-state duplicates are parsed
+        self.assertEqual(len(df_station), 8)
+        self.assertEqual(len(df_weather), (8 + 2) * 365)
+
+        # Check if duplicates and bad measurements are removed
+        dedup_df = dedup_weather(df_weather, build_wrong_state_index(station_wrong_state))
+        self.assertEqual(len(dedup_df), 8 * 365)
+        rules = [("RAIN", ">=", 0), ("MAXIMUM_TEMPERATURE", ">=", "MINIMUM_TEMPERATURE")]
+        self.assertTrue((dedup_df["RAIN"] < 0).any())
+        valid_df = validate_weather(dedup_df, rules)
+        self.assertFalse((valid_df["RAIN"] < 0).any())
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,91 @@
+###############################################################################
+# Name: test_reconcile_data.py
+# Description: This script defines unit tests for the reconciliation between
+#              staging schema and weather schemas. These test cases use
+#              DuckDB as a local stand-in for Snowflake.
+# Author: Travis Hong
+# Repository: https://github.com/TravisH0301/weather_analysis
+###############################################################################
+import sys
+import os
+import unittest
+
+import duckdb
+
+# Add Python script to the path
+script_directory = os.path.abspath("./airflow/dags/scripts")
+sys.path.append(script_directory)
+
+import reconcile_data
+from reconcile_data import (
+    find_row_count_mismatches,
+    extract_partition_row_counts,
+    reconcile_checksums
+)
+from warehouse import DuckDBWarehouse
+
+
+class TestReconcileData(unittest.TestCase):
+    def test_find_row_count_mismatches(self):
+        # Check if only disagreeing partitions are reported
+        mismatches = find_row_count_mismatches(
+            {2022: 100, 2023: 50},
+            {
+                ("RAIN", 2022): 100,
+                ("RAIN", 2023): 49,
+                ("TEMPERATURE", 2022): 100,
+                ("TEMPERATURE", 2023): None
+            }
+        )
+        self.assertEqual(mismatches, [
+            ("RAIN", 2023, 50, 49),
+            ("TEMPERATURE", 2023, 50, None)
+        ])
+
+
+    def test_reconcile_checksums(self):
+        # Create staging schema and weather schema tables in DuckDB
+        conn = duckdb.connect()
+        conn.execute("CREATE SCHEMA STAGING")
+        conn.execute("""
+            CREATE TABLE STAGING.WEATHER_PREPROCESSED AS
+            SELECT
+                'STATION_' || (i % 3) AS STATION_NAME,
+                DATE '2022-12-01' + (i // 3)::INTEGER AS DATE,
+                i / 10 AS RAIN,
+                (i % 3) * 100000 + (DATE '2022-12-01' - DATE '1970-01-01') + i // 3 AS RECORD_KEY
+            FROM range(0, 300) AS t(i)
+        """)
+        conn.execute("CREATE SCHEMA RAIN")
+        for year in [2022, 2023]:
+            conn.execute(f"""
+                CREATE TABLE RAIN.RAIN_{year} AS
+                SELECT
+                    RECORD_KEY,
+                    STATION_NAME,
+                    DATE,
+                    RAIN
+                FROM STAGING.WEATHER_PREPROCESSED
+                WHERE EXTRACT(YEAR FROM DATE) = {year}
+            """)
+        reconcile_data.warehouse = DuckDBWarehouse(conn)
+        schema_hash_columns = {"RAIN": ["RAIN"]}
+        partitions = [("RAIN", 2022), ("RAIN", 2023)]
+
+        # Check if identical content is reconciled
+        mismatches = reconcile_checksums(schema_hash_columns, partitions)
+        self.assertEqual(mismatches, [])
+
+        # Check if corrupted value is narrowed down to its day
+        conn.execute("UPDATE RAIN.RAIN_2023 SET RAIN = -1 WHERE STATION_NAME = 'STATION_1' AND DATE = '2023-02-15'")
+        mismatches = reconcile_checksums(schema_hash_columns, partitions)
+        self.assertEqual(mismatches, [("RAIN", (2023, 2, 15))])
+
+        # Check if partitions are counted, and missing partitions are reported as None
+        partition_row_counts = extract_partition_row_counts(partitions + [("RAIN", 2024)])
+        self.assertEqual(partition_row_counts, {("RAIN", 2022): 93, ("RAIN", 2023): 207, ("RAIN", 2024): None})
+        conn.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,156 @@
+###############################################################################
+# Name: test_stage_data.py
+# Description: This script defines unit tests for the object storage lookups
+#              and the Parquet output of the staging process. These test cases
+#              use a mocked S3-compatible object storage and the test datasets.
+# Author: Travis Hong
+# Repository: https://github.com/TravisH0301/weather_analysis
+###############################################################################
+import sys
+import os
+import io
+import json
+import tempfile
+import unittest
+from unittest import mock
+from datetime import date
+
+import pandas as pd
+
+import boto3
+from moto import mock_aws
+
+# Add Python script to the path
+script_directory = os.path.abspath("./airflow/dags/scripts")
+sys.path.append(script_directory)
+
+from stage_data import (
+    find_latest_file,
+    find_latest_manifest,
+    save_manifest,
+    pre_process_csv,
+    write_parquet_partitions,
+    read_parquet_partitions,
+    save_shard_output,
+    load_shard_outputs,
+    delete_objects
+)
+
+
+@mock_aws
+class TestStageData(unittest.TestCase):
+    def setUp(self):
+        # Create mocked bucket with compressed files
+        self.s3 = boto3.client("s3", region_name="us-east-1")
+        self.s3.create_bucket(Bucket="bom-landing")
+        for obj_name in [
+            "IDCKWCDEA0_2022-12-12.tgz",
+            "IDCKWCDEA0_2023-10-12.tgz",
+            "IDCKWCDEA0_2023-11-12.tgz"
+        ]:
+            self.s3.put_object(Bucket="bom-landing", Key=obj_name, Body=b"")
+
+
+    def test_find_latest_file_landing_record(self):
+        # Check if landing record is used to find latest file
+        self.s3.put_object(
+            Bucket="bom-landing",
+            Key="latest/IDCKWCDEA0.json",
+            Body=json.dumps({"file_name": "IDCKWCDEA0_2023-10-12.tgz"})
+        )
+        latest_file_name = find_latest_file(
+            self.s3,
+            "bom-landing",
+            "latest/IDCKWCDEA0.json",
+            "IDCKWCDEA0_"
+        )
+        self.assertEqual(latest_file_name, "IDCKWCDEA0_2023-10-12.tgz")
+
+
+    def test_find_latest_file_listing(self):
+        # Check if bucket is listed when landing record does not exist
+        latest_file_name = find_latest_file(
+            self.s3,
+            "bom-landing",
+            "latest/IDCKWCDEA0.json",
+            "IDCKWCDEA0_"
+        )
+        self.assertEqual(latest_file_name, "IDCKWCDEA0_2023-11-12.tgz")
+
+
+    def test_manifest(self):
+        # Check if no manifest is found before staging
+        self.assertIsNone(find_latest_manifest(self.s3, "bom-landing", "manifests/"))
+
+        # Check if latest manifest is found
+        for file_name in ["IDCKWCDEA0_2023-10-12.tgz", "IDCKWCDEA0_2023-11-12.tgz"]:
+            manifest = {"tables/stations_db.txt": {"size": 1, "sha256": file_name}}
+            manifest_name = "manifests/" + file_name[:-4] + ".json"
+            save_manifest(self.s3, "bom-landing", manifest_name, file_name, manifest)
+        self.assertEqual(
+            find_latest_manifest(self.s3, "bom-landing", "manifests/"),
+            {"tables/stations_db.txt": {"size": 1, "sha256": "IDCKWCDEA0_2023-11-12.tgz"}}
+        )
+
+
+    def test_parquet_partitions(self):
+        # Preprocess test weather dataset across two states
+        with open("./tests/test_datasets/melbourne_airport-202310.csv", "rb") as f:
+            content = f.read()
+        test_df = pd.concat([
+            pre_process_csv(io.BytesIO(content), "VIC", date(2023, 11, 12)),
+            pre_process_csv(io.BytesIO(content), "NSW", date(2023, 11, 12))
+        ], ignore_index=True)
+
+        # Check if Parquet files are partitioned by year and state
+        with tempfile.TemporaryDirectory() as output_dir:
+            file_paths = write_parquet_partitions(test_df, output_dir, "IDCKWCDEA0_2023-11-12", 10)
+            self.assertEqual(file_paths, [
+                "year=2023/state=NSW/IDCKWCDEA0_2023-11-12_2023_NSW.parquet",
+                "year=2023/state=VIC/IDCKWCDEA0_2023-11-12_2023_VIC.parquet"
+            ])
+
+            # Check if dataset is read back from Parquet files
+            read_df = read_parquet_partitions(output_dir)
+        sort_columns = ["STATE", "DATE"]
+        pd.testing.assert_frame_equal(
+            read_df.sort_values(sort_columns).reset_index(drop=True),
+            test_df.sort_values(sort_columns).reset_index(drop=True)
+        )
+
+
+
+    def test_shard_outputs(self):
+        # Preprocess test weather dataset for two shards
+        with open("./tests/test_datasets/melbourne_airport-202310.csv", "rb") as f:
+            content = f.read()
+        df_vic = pre_process_csv(io.BytesIO(content), "VIC", date(2023, 11, 12))
+        df_nsw = pre_process_csv(io.BytesIO(content), "NSW", date(2023, 11, 12))
+        prefix = "shards/IDCKWCDEA0_2023-11-12/"
+
+        # Save shard outputs, including a retried shard
+        save_shard_output(self.s3, "bom-landing", prefix + "VIC/", [df_vic, df_vic], None, {"a.csv": {}})
+        save_shard_output(self.s3, "bom-landing", prefix + "VIC/", [df_vic], None, {"b.csv": {}})
+        save_shard_output(self.s3, "bom-landing", prefix + "NSW/", [df_nsw], None, {"c.csv": {}})
+        self.s3.put_object(Bucket="bom-landing", Key=prefix + "archives/VIC.tar", Body=b"tar")
+
+        # Check if shard outputs are gathered in shard name order without reading tar files of shards
+        get_object = self.s3.get_object
+        def get_output_object(**kwargs):
+            self.assertNotIn("/archives/", kwargs["Key"])
+            return get_object(**kwargs)
+        with mock.patch.object(self.s3, "get_object", get_output_object):
+            df_weather_li, df_station, manifest = load_shard_outputs(self.s3, "bom-landing", prefix)
+        self.assertEqual(len(df_weather_li), 2)
+        pd.testing.assert_frame_equal(df_weather_li[0], df_nsw)
+        pd.testing.assert_frame_equal(df_weather_li[1], df_vic)
+        self.assertIsNone(df_station)
+        self.assertEqual(manifest, {"b.csv": {}, "c.csv": {}})
+
+        # Check if shard outputs are deleted
+        delete_objects(self.s3, "bom-landing", prefix)
+        self.assertEqual(load_shard_outputs(self.s3, "bom-landing", prefix), ([], None, {}))
+
+
+if __name__ == '__main__':
+    unittest.main()
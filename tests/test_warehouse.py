@@ -0,0 +1,113 @@
+###############################################################################
+# Name: test_warehouse.py
+# Description: This script defines unit tests for the embedded DuckDB warehouse
+#              backend used for offline runs of the pipeline.
+# Author: Travis Hong
+# Repository: https://github.com/TravisH0301/weather_analysis
+###############################################################################
+import sys
+import os
+import tempfile
+import unittest
+from unittest import mock
+from datetime import date
+
+import duckdb
+import pandas as pd
+
+# Add Python script to the path
+script_directory = os.path.abspath("./airflow/dags/scripts")
+sys.path.append(script_directory)
+
+from warehouse import SnowflakeWarehouse, DuckDBWarehouse
+from stage_data import write_parquet_partitions
+
+
+class TestDuckDBWarehouse(unittest.TestCase):
+    def setUp(self):
+        # Create staging schema with target weather table in DuckDB
+        self.warehouse = DuckDBWarehouse(duckdb.connect())
+        self.warehouse.execute("CREATE SCHEMA STAGING")
+        self.warehouse.execute("USE STAGING")
+        self.warehouse.execute("""
+            CREATE TABLE WEATHER (
+                RECORD_KEY BIGINT,
+                STATION_NAME VARCHAR(100),
+                DATE DATE,
+                RAIN DOUBLE,
+                STATE VARCHAR(3)
+            )
+        """)
+        self.df = pd.DataFrame({
+            "STATION_NAME": ["STATION_A", "STATION_A", "STATION_B"],
+            "DATE": [date(2022, 12, 31), date(2023, 1, 1), date(2023, 1, 1)],
+            "RAIN": [0.5, 1.5, 2.5],
+            "STATE": ["VIC", "VIC", "WA"],
+            "RECORD_KEY": [100019357, 100019358, 200019358]
+        })
+
+
+    def tearDown(self):
+        self.warehouse.close()
+
+
+    def test_bulk_load_and_merge(self):
+        # Check if partitioned Parquet files are bulk loaded into temp table
+        self.warehouse.create_temp_table_like("WEATHER_TEMP", "WEATHER")
+        with tempfile.TemporaryDirectory() as output_dir:
+            file_paths = write_parquet_partitions(self.df, output_dir, "test", 1000)
+            self.warehouse.bulk_load_parquet("WEATHER_TEMP", output_dir, file_paths)
+        self.assertEqual(self.warehouse.fetchall("SELECT COUNT(*) FROM WEATHER_TEMP"), [(3,)])
+
+        # Check if merge inserts only unmatched records, idempotently
+        self.warehouse.write_pandas(self.df.iloc[:1], "WEATHER")
+        columns = list(self.df.columns)
+        for _ in range(2):
+            self.warehouse.merge_insert(
+                "WEATHER",
+                "WEATHER_TEMP",
+                "TARGET.RECORD_KEY = SOURCE.RECORD_KEY",
+                columns
+            )
+        self.assertEqual(
+            self.warehouse.fetchall("SELECT RECORD_KEY FROM WEATHER ORDER BY 1"),
+            [(100019357,), (100019358,), (200019358,)]
+        )
+
+
+    def test_queries(self):
+        # Check if rows are inserted and queries are run concurrently
+        self.warehouse.insert_rows("WEATHER", ["RECORD_KEY", "STATION_NAME"], [(1, "STATION_A"), (2, "STATION_B")])
+        results = self.warehouse.execute_concurrently([
+            "SELECT COUNT(*) FROM STAGING.WEATHER",
+            "SELECT MAX(RECORD_KEY) FROM STAGING.WEATHER"
+        ])
+        self.assertEqual(results, [[(2,)], [(2,)]])
+
+        # Check if date ordinal matches the record key convention
+        self.assertEqual(
+            self.warehouse.fetchall("SELECT " + self.warehouse.date_ordinal("DATE '2023-01-01'")),
+            [((date(2023, 1, 1) - date(1970, 1, 1)).days,)]
+        )
+
+        # Check if tables are listed without metadata row counts
+        self.assertEqual(self.warehouse.fetch_row_counts(["STAGING"]), {("STAGING", "WEATHER"): None})
+
+
+class TestSnowflakeWarehouse(unittest.TestCase):
+    def test_bulk_load_parquet(self):
+        # Check if Parquet files are uploaded with a single PUT and copied with a single COPY
+        warehouse = SnowflakeWarehouse(mock.MagicMock())
+        warehouse.bulk_load_parquet("WEATHER_TEMP", "/tmp/output", [
+            "year=2023/state=NSW/test_2023_NSW.parquet",
+            "year=2023/state=VIC/test_2023_VIC.parquet"
+        ])
+        queries = [call.args[0] for call in warehouse.cur.execute.call_args_list]
+        self.assertEqual(len(queries), 3)
+        self.assertIn("PUT 'file:///tmp/output/*/*/*.parquet' '@WEATHER_TEMP_STAGE'", queries[1])
+        self.assertIn("FROM '@WEATHER_TEMP_STAGE'", queries[2])
+        self.assertIn("PATTERN = '.*[.]parquet'", queries[2])
+
+
+if __name__ == '__main__':
+    unittest.main()
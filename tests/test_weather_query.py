@@ -0,0 +1,115 @@
+###############################################################################
+# Name: test_weather_query.py
+# Description: This script defines unit tests for the partition-aware query
+#              of weather measurements. These test cases use DuckDB as a local
+#              stand-in for Snowflake.
+# Author: Travis Hong
+# Repository: https://github.com/TravisH0301/weather_analysis
+###############################################################################
+import sys
+import os
+import unittest
+from datetime import date
+
+import duckdb
+import pyarrow as pa
+
+# Add Python script to the path
+script_directory = os.path.abspath("./airflow/dags/scripts")
+sys.path.append(script_directory)
+
+from weather_query import query, render_query
+from warehouse import DuckDBWarehouse
+
+
+class TestWeatherQuery(unittest.TestCase):
+    def setUp(self):
+        # Create partition registry and year partition tables in DuckDB
+        self.conn = duckdb.connect()
+        self.conn.execute("CREATE SCHEMA STAGING")
+        self.conn.execute("CREATE TABLE STAGING.WEATHER_PARTITION_REGISTRY (SCHEMA_NAME VARCHAR, YEAR INTEGER)")
+        for (schema, cols) in [("RAIN", "i / 10 AS RAIN"), ("WIND_SPEED", "i / 100 AS AVERAGE_10M_WIND_SPEED")]:
+            self.conn.execute(f"CREATE SCHEMA {schema}")
+            for year in range(2018, 2023):
+                self.conn.execute(f"INSERT INTO STAGING.WEATHER_PARTITION_REGISTRY VALUES ('{schema}', {year})")
+                self.conn.execute(f"""
+                    CREATE TABLE {schema}.{schema}_{year} AS
+                    SELECT
+                        (i % 2) * 100000 + (DATE '{year}-01-01' - DATE '1970-01-01') + i // 2 AS RECORD_KEY,
+                        'STATION_' || (i % 2) AS STATION_NAME,
+                        DATE '{year}-01-01' + (i // 2)::INTEGER AS DATE,
+                        CASE WHEN i % 2 = 0 THEN 'VIC' ELSE 'WA' END AS STATE,
+                        {cols}
+                    FROM range(0, 732) AS t(i)
+                    WHERE EXTRACT(YEAR FROM DATE '{year}-01-01' + (i // 2)::INTEGER) = {year}
+                """)
+
+
+        self.warehouse = DuckDBWarehouse(self.conn)
+
+
+    def tearDown(self):
+        self.warehouse.close()
+
+
+    def test_render_query(self):
+        # Check if only overlapping year partitions are unioned with pushed-down predicates
+        query_str = render_query(
+            {"RAIN": [2019, 2020, 2021]},
+            date(2019, 3, 1),
+            date(2021, 6, 30),
+            states=["VIC"]
+        )
+        self.assertIn("RAIN.RAIN_2019", query_str)
+        self.assertIn("RAIN.RAIN_2021", query_str)
+        self.assertNotIn("RAIN.RAIN_2018", query_str)
+        self.assertEqual(query_str.count("STATE IN ('VIC')"), 3)
+
+        # Check if empty filter is rendered as false predicate
+        query_str = render_query({"RAIN": [2019]}, date(2019, 3, 1), date(2019, 6, 30), stations=[], states=[])
+        self.assertNotIn("IN ()", query_str)
+        self.assertEqual(query_str.count("AND FALSE"), 2)
+
+
+    def test_query(self):
+        # Check if records within date range are returned from year partitions
+        df = query(self.warehouse, ["rain"], "2019-03-01", "2021-06-30", states=["VIC"])
+        self.assertEqual(len(df), (date(2021, 6, 30) - date(2019, 3, 1)).days + 1)
+        self.assertEqual(df["STATE"].unique().tolist(), ["VIC"])
+        self.assertEqual(df["DATE"].min(), date(2019, 3, 1))
+
+        # Check if multiple weather schemas are joined into a single table
+        table = query(
+            self.warehouse,
+            ["RAIN", "WIND_SPEED"],
+            date(2022, 12, 30),
+            date(2023, 1, 31),
+            stations=["STATION_1"],
+            output="arrow"
+        )
+        self.assertIsInstance(table, pa.Table)
+        self.assertEqual(table.column_names, ["STATION_NAME", "DATE", "STATE", "RAIN", "AVERAGE_10M_WIND_SPEED"])
+        self.assertEqual(table.num_rows, 2)
+
+        # Check if duplicate weather schemas are queried once
+        df = query(self.warehouse, ["rain", "WIND_SPEED", "RAIN"], "2019-03-01", "2019-03-31")
+        self.assertEqual(df.columns.tolist(), ["STATION_NAME", "DATE", "STATE", "RAIN", "AVERAGE_10M_WIND_SPEED"])
+        self.assertEqual(len(df), 2 * 31)
+
+        # Check if empty filter returns no records
+        df = query(self.warehouse, ["RAIN", "WIND_SPEED"], "2019-03-01", "2019-06-30", stations=[])
+        self.assertEqual(len(df), 0)
+        df = query(self.warehouse, ["RAIN"], "2019-03-01", "2019-06-30", states=[])
+        self.assertEqual(len(df), 0)
+
+        # Check if date range without year partitions returns no records
+        df = query(self.warehouse, ["RAIN"], "2030-01-01", "2030-12-31")
+        self.assertEqual(len(df), 0)
+
+        # Check if unknown weather schema is rejected
+        with self.assertRaises(ValueError):
+            query(self.warehouse, ["SNOW"], "2019-01-01", "2019-12-31")
+
+
+if __name__ == '__main__':
+    unittest.main()